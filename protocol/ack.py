@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+from twisted.internet import reactor
+from functions import SEQUENCE_NUMBER_MODULO
+from functions import prepareBuffSelectiveAck
+
+
+class c2wAckTracker(object):
+
+    #: Number of sequence numbers after the cumulative one which can be
+    #: acknowledged selectively (the bitmap has at most 8 bytes).
+    windowSize = 64
+    #: Time (in seconds) an ACK waits for the next messages, well below the
+    #: smallest retransmission timeout.
+    ackDelay = 0.02
+
+    def __init__(self, write, cumulativeSequenceNumber):
+        """
+        :param write: Called with the buffer of an ACK to send it to the
+            peer.
+        :param cumulativeSequenceNumber: The sequence number before the
+            first message expected from the peer.
+
+        Acknowledges the messages of one peer with cumulative and selective
+        ACKs (see :py:func:`functions.prepareBuffSelectiveAck`) instead of
+        one ACK per message:
+
+        .. code-block:: python
+
+            # a message (not an ACK) is received
+            self.ackTracker.received(sequenceNumber)
+
+        The ACK is delayed by :py:attr:`ackDelay`, so that it acknowledges
+        every message received in the meantime.  It is sent at once when a
+        message is received twice (the previous ACK was lost) or after a
+        missing one (the peer must retransmit it without waiting).
+        """
+        self.write = write
+        #: Every message up to this sequence number has been received.
+        self.cumulativeSequenceNumber = cumulativeSequenceNumber
+        #: Bit i set: the message cumulativeSequenceNumber + 1 + i has been
+        #: received.
+        self.bitmap = 0
+        self._call = None
+
+    def __repr__(self):
+        return '<c2wAckTracker cumulative={0}, bitmap={1:#x}>'.format(
+            self.cumulativeSequenceNumber, self.bitmap)
+
+    def received(self, sequenceNumber):
+        """
+        :param sequenceNumber: The sequence number of a message received
+            from the peer.
+        :returns: False if the message had already been received.
+        """
+        offset = (sequenceNumber - self.cumulativeSequenceNumber) % SEQUENCE_NUMBER_MODULO
+        if offset == 0 or offset > SEQUENCE_NUMBER_MODULO // 2:
+            self.flush()
+            return False
+        if offset > self.windowSize:
+            # the peer never sends a message windowSize after its oldest
+            # one waiting for an ACK: the missing ones before the window
+            # were given up
+            shift = offset - self.windowSize
+            self.bitmap >>= shift
+            self.cumulativeSequenceNumber = (self.cumulativeSequenceNumber + shift) % SEQUENCE_NUMBER_MODULO
+            offset = self.windowSize
+        bit = 1 << (offset - 1)
+        if self.bitmap & bit:
+            self.flush()
+            return False
+        self.bitmap |= bit
+        while self.bitmap & 1:
+            self.bitmap >>= 1
+            self.cumulativeSequenceNumber = (self.cumulativeSequenceNumber + 1) % SEQUENCE_NUMBER_MODULO
+        if self.bitmap:
+            self.flush()
+        elif self._call is None:
+            self._call = reactor.callLater(self.ackDelay, self.flush)
+        return True
+
+    def flush(self):
+        """
+        Sends the ACK now.
+        """
+        self.cancel()
+        self.write(prepareBuffSelectiveAck(self.cumulativeSequenceNumber, self.bitmap))
+
+    def cancel(self):
+        """
+        Cancels the delayed ACK (e.g. the peer has left).
+        """
+        if self._call is not None and self._call.active():
+            self._call.cancel()
+        self._call = None
@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+from twisted.internet import reactor
+
+
+class c2wCoalescer(object):
+
+    def __init__(self, writeDatagram, window, maxDatagramSize):
+        """
+        :param writeDatagram: Called with a datagram to send it to the
+            peer.
+        :param window: Time (in seconds) the first message of a datagram
+            waits for the next ones before the datagram is sent.
+        :param maxDatagramSize: The largest datagram sent (the messages
+            are never split, a datagram is sent before it grows beyond).
+
+        Packs the messages sent to one peer within :py:attr:`window` (chat
+        lines, ACKs, users list updates) into one datagram instead of one
+        datagram each:
+
+        .. code-block:: python
+
+            # instead of self.transport.write(buff, host_port)
+            self.coalescer.write(buff)
+
+        Each message keeps its header, so its length, its sequence number
+        and its own ACK and retransmission: the peer splits the datagram
+        with :py:func:`functions.splitDatagram` and treats every message as
+        if it had been received alone.
+        """
+        self.writeDatagram = writeDatagram
+        self.window = window
+        self.maxDatagramSize = maxDatagramSize
+        self._buffs = []
+        self._size = 0
+        self._call = None
+
+    def __repr__(self):
+        return '<c2wCoalescer size={0}>'.format(self._size)
+
+    def writeSequence(self, buffSequence):
+        """
+        :param buffSequence: The parts of one message (see
+            :py:meth:`functions.c2wBroadcast.prepareBuffSequence`).
+        """
+        size = sum(len(buff) for buff in buffSequence)
+        if self._size and self._size + size > self.maxDatagramSize:
+            self.flush()
+        self._buffs.extend(buffSequence)
+        self._size += size
+        if self._size >= self.maxDatagramSize:
+            self.flush()
+        elif self._call is None:
+            self._call = reactor.callLater(self.window, self.flush)
+
+    def write(self, buff):
+        """
+        :param buff: A whole message (header included).
+        """
+        self.writeSequence((buff,))
+
+    def flush(self):
+        """
+        Sends the messages waiting now, in one datagram.
+        """
+        self.cancel()
+        if self._buffs:
+            datagram = b''.join(self._buffs)
+            self._buffs = []
+            self._size = 0
+            self.writeDatagram(datagram)
+
+    def cancel(self):
+        """
+        Cancels the sending of the datagram in progress (its messages wait
+        for the next :py:meth:`flush`).
+        """
+        if self._call is not None and self._call.active():
+            self._call.cancel()
+        self._call = None
@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+
+
+class c2wCongestionWindow(object):
+
+    #: Number of messages which can wait for their ACK when the session
+    #: starts, and bounds of this number (at most the 64 messages a
+    #: :py:class:`~c2w.protocol.ack.c2wAckTracker` can acknowledge).
+    initialWindow = 4
+    minWindow = 1
+    maxWindow = 64
+
+    def __init__(self):
+        """
+        Limits the number of messages sent to one peer and not acknowledged
+        yet (AIMD, as the congestion window of TCP):
+
+        * each acknowledged message lets one more message be sent (slow
+          start) until :py:attr:`slowStartThreshold`, then one more per
+          window of acknowledged messages (additive increase),
+        * a message sent again because its ACK did not come in time halves
+          the window (multiplicative decrease).  The messages sent before
+          this decrease were lost together, their own timeouts do not
+          decrease the window again.
+
+        .. code-block:: python
+
+            while sendQueue and congestionWindow.canSend(len(inFlight)):
+                send(sendQueue.popleft())
+        """
+        #: Number of messages which can wait for their ACK (not rounded).
+        self.window = float(self.initialWindow)
+        self.slowStartThreshold = float(self.maxWindow)
+        #: When the window was last decreased, ``None`` if never.
+        self.decreasedAt = None
+
+    def __repr__(self):
+        return '<c2wCongestionWindow window={0:.2f}, ssthresh={1:.2f}>'.format(
+            self.window, self.slowStartThreshold)
+
+    def canSend(self, inFlight):
+        """
+        :param inFlight: The number of messages waiting for their ACK.
+        :returns: True if one more message can be sent now.
+        """
+        return inFlight < int(self.window)
+
+    def acknowledged(self, entry):
+        """
+        :param entry: The :py:class:`~c2w.protocol.retransmit.c2wRetransmitEntry`
+            of the acknowledged message (``None`` if it was not waiting for
+            an ACK).
+        """
+        if entry is None:
+            return
+        if self.window < self.slowStartThreshold:
+            self.window += 1
+        else:
+            self.window += 1 / self.window
+        self.window = min(self.window, float(self.maxWindow))
+
+    def timedOut(self, entry, now):
+        """
+        :param entry: The entry of the message sent again.
+        :param now: The time of the retransmission.
+        """
+        if self.decreasedAt is not None and entry.sentAt <= self.decreasedAt:
+            return
+        self.window = max(float(self.minWindow), self.window / 2)
+        self.slowStartThreshold = max(2.0, self.window)
+        self.decreasedAt = now
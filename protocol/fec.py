@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+import collections
+from twisted.internet import reactor
+from functions import SEQUENCE_NUMBER_MODULO
+from functions import HEADER_STRUCT
+from functions import prepareBuffFecParity
+
+
+class c2wFecEncoder(object):
+
+    #: Time (in seconds) an incomplete group waits for more messages before
+    #: its parity is sent anyway (a single chat line is protected too).
+    groupDelay = 0.02
+
+    def __init__(self, write, groupSize):
+        """
+        :param write: Called with the buffer of a parity message to send it
+            to the peer.
+        :param groupSize: Number of messages protected by one parity
+            message (the redundancy is 1 / groupSize).
+
+        Sends, after every group of consecutive messages sent to one peer,
+        the XOR of these messages (see
+        :py:func:`functions.prepareBuffFecParity`), so that the peer can
+        rebuild one lost message of the group at once instead of waiting
+        for its retransmission:
+
+        .. code-block:: python
+
+            # the message is sent for the first time
+            self.fecEncoder.add(sequenceNumber, buff)
+        """
+        self.write = write
+        self.groupSize = groupSize
+        self._firstSequenceNumber = None
+        self._datagrams = []
+        self._call = None
+
+    def add(self, sequenceNumber, datagram):
+        """
+        :param sequenceNumber: The sequence number of a message sent to the
+            peer (not a retransmission).
+        :param datagram: The whole message (bytes).
+        """
+        if (self._datagrams and sequenceNumber !=
+                (self._firstSequenceNumber + len(self._datagrams)) % SEQUENCE_NUMBER_MODULO):
+            self.flush()
+        if not self._datagrams:
+            self._firstSequenceNumber = sequenceNumber
+        self._datagrams.append(bytes(datagram))
+        if len(self._datagrams) >= self.groupSize:
+            self.flush()
+        elif self._call is None:
+            self._call = reactor.callLater(self.groupDelay, self.flush)
+
+    def flush(self):
+        """
+        Sends the parity of the current group now.
+        """
+        self.cancel()
+        if self._datagrams:
+            self.write(prepareBuffFecParity(self._firstSequenceNumber, self._datagrams))
+            self._datagrams = []
+
+    def cancel(self):
+        """
+        Cancels the parity of the current group (e.g. the peer has left).
+        """
+        if self._call is not None and self._call.active():
+            self._call.cancel()
+        self._call = None
+
+
+class c2wFecDecoder(object):
+
+    #: Number of messages of the peer kept to rebuild a lost one.
+    windowSize = 64
+
+    def __init__(self):
+        """
+        Keeps the last messages received from one peer and rebuilds the
+        only message missing from a group with its parity message:
+
+        .. code-block:: python
+
+            # a message is received
+            self.fecDecoder.add(sequenceNumber, datagram)
+            ...
+            # a parity message is received
+            datagram = self.fecDecoder.recover(decodedParity)
+            if datagram is not None:
+                self.datagramReceived(datagram, host_port)
+        """
+        self._datagrams = {}
+        self._order = collections.deque()
+
+    def add(self, sequenceNumber, datagram):
+        """
+        :param sequenceNumber: The sequence number of a message received
+            from the peer.
+        :param datagram: The whole message.
+        """
+        if sequenceNumber in self._datagrams:
+            return
+        self._datagrams[sequenceNumber] = bytes(datagram)
+        self._order.append(sequenceNumber)
+        if len(self._order) > self.windowSize:
+            del self._datagrams[self._order.popleft()]
+
+    def recover(self, parityMessage):
+        """
+        :param parityMessage: A decoded parity message
+            (:py:class:`functions.c2wFecParityMessage`).
+        :returns: The message of the group which was lost, ``None`` if no
+            message or more than one is missing.
+        """
+        group = [(parityMessage.sequenceNumber + i) % SEQUENCE_NUMBER_MODULO
+                 for i in range(parityMessage.count)]
+        missing = [sequenceNumber for sequenceNumber in group
+                   if sequenceNumber not in self._datagrams]
+        if len(missing) != 1:
+            return None
+        datagram = parityMessage.rebuild([self._datagrams[sequenceNumber]
+                                          for sequenceNumber in group
+                                          if sequenceNumber != missing[0]])
+        if datagram is None or HEADER_STRUCT.unpack_from(datagram)[1] >> 4 != missing[0]:
+            return None
+        return datagram
@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+import struct
+import logging
+
+logging.basicConfig()
+moduleLogger = logging.getLogger('c2w.protocol.frame_reader')
+
+#: The first two bytes of every c2w frame give the length of the whole frame
+#: (header included).
+LENGTH_STRUCT = struct.Struct('!H')
+#: The smallest valid frame: a header without data.
+MIN_FRAME_LENGTH = 4
+
+
+class c2wFrameReader(object):
+
+    #: The consumed bytes are only removed from the buffer once there are at
+    #: least this many of them (and they are more than half of the buffer), or
+    #: when the whole buffer has been consumed.
+    compactThreshold = 65536
+
+    def __init__(self):
+        """
+        Reassembles the c2w frames received on a TCP connection.
+
+        The received data is appended to a single ``bytearray`` and a read
+        offset points to the first byte not yet consumed, so extracting a
+        frame never copies the rest of the buffer.  A length header split
+        across two segments is simply left in the buffer until the rest of
+        the frame arrives.
+
+        .. code-block:: python
+
+            def dataReceived(self, data):
+                self.frameReader.feed(data)
+                for frame in self.frameReader.frames():
+                    self.frameReceived(frame)
+        """
+        #: The received data.
+        self._buff = bytearray()
+        #: Position of the first byte not yet consumed in :py:attr:`_buff`.
+        self._offset = 0
+
+    def feed(self, data):
+        """
+        :param data: The data received on the connection (any number of
+            bytes, not necessarily a whole frame).
+        """
+        self._buff += data
+
+    def frames(self):
+        """
+        Yields every complete frame (as ``bytes``) available in the buffer,
+        in order.  Incomplete data is kept for the next call.
+
+        :raises: ValueError if a frame announces a length smaller than the
+            c2w header, the stream can then no longer be parsed.
+        """
+        buff = self._buff
+        try:
+            while len(buff) - self._offset >= LENGTH_STRUCT.size:
+                lenMessage = LENGTH_STRUCT.unpack_from(buff, self._offset)[0]
+                if lenMessage < MIN_FRAME_LENGTH:
+                    moduleLogger.error('invalid frame length %s', lenMessage)
+                    raise ValueError('invalid c2w frame length')
+                end = self._offset + lenMessage
+                if len(buff) < end:
+                    break
+                with memoryview(buff) as view:
+                    frame = view[self._offset:end].tobytes()
+                self._offset = end
+                yield frame
+        finally:
+            self._compact()
+
+    def _compact(self):
+        if self._offset == len(self._buff):
+            del self._buff[:]
+            self._offset = 0
+        elif (self._offset >= self.compactThreshold and
+                self._offset * 2 >= len(self._buff)):
+            del self._buff[:self._offset]
+            self._offset = 0
+
+    def __len__(self):
+        """
+        Returns the number of bytes received but not consumed yet.
+        """
+        return len(self._buff) - self._offset
@@ -0,0 +1,332 @@
+# -*- coding: utf-8 -*-
+import collections
+import ipaddress
+from twisted.internet import reactor
+from twisted.internet.protocol import DatagramProtocol
+from functions import SEQUENCE_NUMBER_MODULO
+from functions import prepareBuffMulticastChat
+
+#: The multicast group of the main room when the chat is sent by multicast
+#: (administratively scoped, it does not leave the site), the room of the
+#: movie of id n uses the n-th next address.
+MULTICAST_CHAT_GROUP = '239.192.74.0'
+
+
+def multicastGroupOf(firstGroup, roomId):
+    """
+    :param firstGroup: The multicast group of the main room.
+    :param roomId: The id of the room (0 for the main room, the movie id
+        otherwise).
+    :returns: The multicast group of the chat of the room.
+    """
+    return str(ipaddress.IPv4Address(firstGroup) + roomId)
+
+
+def multicastPortOf(serverPort):
+    """
+    Returns the UDP port of the multicast chat of a server (the next one,
+    the server port itself is already bound on a client running on the
+    same machine as the server).
+    """
+    return serverPort + 1
+
+
+class c2wMulticastRoom(object):
+
+    #: Number of messages of the room kept to repair the losses of the
+    #: clients (less than half of the 4096 sequence numbers).
+    historySize = 256
+    #: Times (in seconds) after the last message of the room at which a
+    #: heartbeat tells its number, so that a client which lost it asks
+    #: for it without waiting for the next message.
+    heartbeatDelays = (0.1, 0.5, 2.0)
+
+    def __init__(self, write, roomId, address):
+        """
+        :param write: Called with (buffer, address) to send a datagram.
+        :param roomId: The id of the room (0 for the main room).
+        :param address: The (multicast group, port) of the room.
+
+        Sends the chat of one room once to its multicast group instead of
+        once to each client of the room:
+
+        .. code-block:: python
+
+            room.send(prepareBuffChatMessage(userName, message))
+            ...
+            # a client lost some messages (NACK)
+            for buff in room.repair(decodedNack.missingSequenceNumbers):
+                self.transport.write(buff, host_port)
+
+        The messages are numbered per room (12 bits) and never
+        acknowledged: a client which sees a gap in the numbers asks for
+        the missing ones, which are sent to it alone.
+
+        A client entering the room first proves that it receives the
+        group: it is sent a heartbeat by :py:meth:`sendHeartbeat` and
+        answers with its sequence number (see :py:meth:`hasSent`).
+        """
+        self.write = write
+        self.roomId = roomId
+        self.address = address
+        #: The sequence number of the last message sent to the room.
+        self.sequenceNumber = SEQUENCE_NUMBER_MODULO - 1
+        self._history = collections.OrderedDict()
+        self._heartbeatCall = None
+        self._heartbeatIndex = 0
+
+    def __repr__(self):
+        return '<c2wMulticastRoom address={0}, seq={1}>'.format(
+            self.address, self.sequenceNumber)
+
+    def send(self, chatPayload):
+        """
+        :param chatPayload: The data of a chat message (see
+            :py:func:`functions.prepareBuffChatMessage`).
+        """
+        self.sequenceNumber = (self.sequenceNumber + 1) % SEQUENCE_NUMBER_MODULO
+        buff = prepareBuffMulticastChat(self.roomId, chatPayload, self.sequenceNumber)
+        self._history[self.sequenceNumber] = buff
+        if len(self._history) > self.historySize:
+            self._history.popitem(last=False)
+        self.write(buff, self.address)
+        self._heartbeatIndex = 0
+        self._scheduleHeartbeat()
+
+    def heartbeat(self, sequenceNumber=None):
+        """
+        Returns the heartbeat of the room: it gives the sequence number of
+        the last message sent to the room (or ``sequenceNumber``).
+        """
+        if sequenceNumber is None:
+            sequenceNumber = self.sequenceNumber
+        return prepareBuffMulticastChat(self.roomId, b'', sequenceNumber)
+
+    def sendHeartbeat(self):
+        """
+        Sends the heartbeat of the room to its group now.
+        """
+        self.write(self.heartbeat(), self.address)
+
+    def hasSent(self, sequenceNumber):
+        """
+        :param sequenceNumber: A sequence number given by a client.
+        :returns: True if it is the one of the last heartbeat of the room
+            or of a message still kept to repair the losses.
+        """
+        return (sequenceNumber == self.sequenceNumber or
+                sequenceNumber in self._history)
+
+    def repair(self, sequenceNumbers):
+        """
+        :param sequenceNumbers: Sequence numbers lost by a client.
+        :returns: The messages which can still be sent again (the others
+            are too old, the client gives them up).
+        """
+        return [self._history[sequenceNumber] for sequenceNumber in sequenceNumbers
+                if sequenceNumber in self._history]
+
+    def _scheduleHeartbeat(self):
+        if self._heartbeatCall is not None and self._heartbeatCall.active():
+            self._heartbeatCall.cancel()
+        self._heartbeatCall = None
+        if self._heartbeatIndex < len(self.heartbeatDelays):
+            delay = self.heartbeatDelays[self._heartbeatIndex]
+            if self._heartbeatIndex > 0:
+                delay -= self.heartbeatDelays[self._heartbeatIndex - 1]
+            self._heartbeatCall = reactor.callLater(delay, self._sendHeartbeat)
+
+    def _sendHeartbeat(self):
+        self._heartbeatCall = None
+        self.sendHeartbeat()
+        self._heartbeatIndex += 1
+        self._scheduleHeartbeat()
+
+    def cancel(self):
+        """
+        Cancels the heartbeats (e.g. the server stops).
+        """
+        self._heartbeatIndex = len(self.heartbeatDelays)
+        self._scheduleHeartbeat()
+
+
+class c2wMulticastReceiver(object):
+
+    #: Time (in seconds) a gap waits before its NACK (the missing messages
+    #: may only be late), and between two NACKs of a message not repaired.
+    nackDelay = 0.02
+    nackInterval = 0.5
+    #: Number of NACKs after which a missing message is not asked for any
+    #: more (its repair is still shown if it arrives late, the NACKs wait
+    #: behind the other requests of the client).
+    maxNacks = 5
+    #: Largest number of sequence numbers in one NACK.
+    maxNackSize = 256
+
+    def __init__(self, sendNack):
+        """
+        :param sendNack: Called with the list of the missing sequence
+            numbers to ask the server for them.
+
+        Follows the sequence numbers of the multicast chat of the room of
+        the client and asks for the missing messages (NACK), again every
+        :py:attr:`nackInterval` until they are received:
+
+        .. code-block:: python
+
+            # the client enters the room: it asks the server for a
+            # heartbeat of the group (again until one is received)
+            receiver.nack()
+            ...
+            # a heartbeat received from the group: the client sends its
+            # sequence number back (again until the answer is received),
+            # the server then sends the chat to the group and answers by
+            # unicast with the sequence number of the last message the
+            # client received by unicast
+            receiver.heartbeat(decodedHeartbeat.sequenceNumber)
+            ...
+            receiver.sync(decodedHeartbeat.sequenceNumber)
+            ...
+            if receiver.received(decodedMessage.sequenceNumber):
+                ...  # show the message (received once)
+
+        The messages received before :py:meth:`sync` are ignored: the
+        server still sends them to the client by unicast (the client
+        stays on unicast if the group never reaches it).  The heartbeats
+        of the room (:py:meth:`heartbeat`) reveal the messages lost at the
+        end of a conversation.
+        """
+        self.sendNack = sendNack
+        #: The highest sequence number of the room known, ``None`` before
+        #: :py:meth:`sync`.
+        self.highestSequenceNumber = None
+        #: The missing sequence numbers, with the number of NACKs sent for
+        #: each.
+        self.missing = collections.OrderedDict()
+        self._givenUp = collections.OrderedDict()
+        #: The sequence number of the last heartbeat received from the
+        #: group before :py:meth:`sync`, ``None`` if none.
+        self.groupSequenceNumber = None
+        self._syncNacks = 0
+        self._call = None
+
+    def __repr__(self):
+        return '<c2wMulticastReceiver highest={0}, missing={1}>'.format(
+            self.highestSequenceNumber, list(self.missing))
+
+    def _advance(self, sequenceNumber):
+        """
+        Records the messages between the highest sequence number and
+        ``sequenceNumber`` (excluded) as missing.  Returns False if
+        ``sequenceNumber`` is not after the highest one.
+        """
+        ahead = (sequenceNumber - self.highestSequenceNumber) % SEQUENCE_NUMBER_MODULO
+        if ahead == 0 or ahead >= SEQUENCE_NUMBER_MODULO // 2:
+            return False
+        for i in range(1, ahead + 1):
+            self._givenUp.pop((self.highestSequenceNumber + i) % SEQUENCE_NUMBER_MODULO, None)
+        for i in range(1, ahead):
+            self.missing[(self.highestSequenceNumber + i) % SEQUENCE_NUMBER_MODULO] = 0
+        self.highestSequenceNumber = sequenceNumber
+        if self.missing and self._call is None:
+            self._call = reactor.callLater(self.nackDelay, self.nack)
+        return True
+
+    def received(self, sequenceNumber):
+        """
+        :param sequenceNumber: The sequence number of a chat message of the
+            room.
+        :returns: True the first time the message is received.
+        """
+        if self.highestSequenceNumber is None:
+            return False
+        if self.missing.pop(sequenceNumber, None) is not None:
+            return True
+        if self._advance(sequenceNumber):
+            return True
+        return self._givenUp.pop(sequenceNumber, None) is not None
+
+    def sync(self, sequenceNumber):
+        """
+        :param sequenceNumber: The sequence number of the last message sent
+            to the room before the client was told to receive its chat by
+            multicast (the previous messages are not expected).
+        """
+        if self.highestSequenceNumber is None:
+            self.cancel()
+            self.highestSequenceNumber = sequenceNumber
+        else:
+            self.heartbeat(sequenceNumber)
+
+    def heartbeat(self, sequenceNumber):
+        """
+        :param sequenceNumber: The sequence number of the last message sent
+            to the room.
+
+        Before :py:meth:`sync`, the first heartbeat received from the group
+        is sent back to the server at once.
+        """
+        if self.highestSequenceNumber is None:
+            first = self.groupSequenceNumber is None
+            self.groupSequenceNumber = sequenceNumber
+            if first:
+                self._syncNacks = 0
+                self.nack()
+            return
+        if self._advance((sequenceNumber + 1) % SEQUENCE_NUMBER_MODULO):
+            # the heartbeat is not a message: the last one is missing too
+            self.highestSequenceNumber = sequenceNumber
+
+    def nack(self):
+        """
+        Asks for the missing messages now.  Before :py:meth:`sync`, asks
+        for a heartbeat of the group with an empty NACK, or sends back the
+        sequence number of the heartbeat received from the group.
+        """
+        self.cancel()
+        if self.highestSequenceNumber is None:
+            if self._syncNacks < self.maxNacks:
+                self._syncNacks += 1
+                if self.groupSequenceNumber is None:
+                    self.sendNack([])
+                else:
+                    self.sendNack([self.groupSequenceNumber])
+                self._call = reactor.callLater(self.nackInterval, self.nack)
+            return
+        for sequenceNumber, nacks in list(self.missing.items()):
+            if nacks >= self.maxNacks:
+                del self.missing[sequenceNumber]
+                self._givenUp[sequenceNumber] = True
+                if len(self._givenUp) > self.maxNackSize:
+                    self._givenUp.popitem(last=False)
+        if not self.missing:
+            return
+        sequenceNumbers = list(self.missing)[:self.maxNackSize]
+        for sequenceNumber in sequenceNumbers:
+            self.missing[sequenceNumber] += 1
+        self.sendNack(sequenceNumbers)
+        self._call = reactor.callLater(self.nackInterval, self.nack)
+
+    def cancel(self):
+        """
+        Cancels the next NACK (e.g. the client leaves the room).
+        """
+        if self._call is not None and self._call.active():
+            self._call.cancel()
+        self._call = None
+
+
+class c2wMulticastChatListener(DatagramProtocol):
+
+    def __init__(self, datagramReceived):
+        """
+        :param datagramReceived: Called with (datagram, host_port) for each
+            datagram received from the multicast groups.
+
+        The protocol of the UDP port on which a client receives the chat by
+        multicast (the groups are joined with ``transport.joinGroup``).
+        """
+        self.datagramReceivedFunction = datagramReceived
+
+    def datagramReceived(self, datagram, host_port):
+        self.datagramReceivedFunction(datagram, host_port)
@@ -0,0 +1,279 @@
+# -*- coding: utf-8 -*-
+import collections
+import logging
+from zope.interface import implementer
+from twisted.internet.interfaces import IPushProducer
+from functions import HEADER_STRUCT
+
+logging.basicConfig()
+moduleLogger = logging.getLogger('c2w.protocol.outbox')
+
+#: Types of the messages the outbox handles differently for a slow client.
+USERS_LIST_TYPE = 6
+CHAT_MESSAGE_TYPE = 9
+USERS_LIST_UPDATE_TYPE = 10
+
+
+class c2wWriteBatch(object):
+
+    def __init__(self):
+        """
+        Delimits the processing of the data received on a connection
+        (usually one call of ``dataReceived``).  The frames written to the
+        outboxes while the batch is open are kept and every outbox is flushed
+        once, with a single ``writeSequence``, when the batch is closed.
+
+        .. code-block:: python
+
+            with writeBatch:
+                for frame in self.frameReader.frames():
+                    self.frameReceived(frame)
+
+        Batches can be nested, only the outermost one flushes the outboxes.
+        """
+        #: Number of batches currently open.
+        self._depth = 0
+        #: The outboxes with pending frames, in the order of their first frame.
+        self._pending = []
+
+    def __enter__(self):
+        self._depth += 1
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+        self._depth -= 1
+        if self._depth == 0:
+            self.flush()
+        return False
+
+    def isOpen(self):
+        return self._depth > 0
+
+    def add(self, outbox):
+        """
+        :param outbox: An outbox which has just got its first pending frame.
+        """
+        self._pending.append(outbox)
+
+    def flush(self):
+        """
+        Flushes every outbox with pending frames.
+        """
+        pending = self._pending
+        self._pending = []
+        for outbox in pending:
+            outbox.flush()
+
+
+#: The batch shared by all the connections (there is only one reactor).
+writeBatch = c2wWriteBatch()
+
+
+class c2wOutboxEntry(object):
+
+    __slots__ = ('key', 'typeNumber', 'sequenceNumber', 'pieces', 'size')
+
+    def __init__(self, pieces):
+        """
+        :param pieces: The pieces (bytes) of one frame, header first.
+        """
+        seqType = HEADER_STRUCT.unpack_from(pieces[0])[1]
+        self.typeNumber = seqType & 0xF
+        self.sequenceNumber = seqType >> 4
+        #: The ACKs are never merged, the other frames are identified by
+        #: their type and sequence number (a retransmission has the same key).
+        if self.typeNumber == 0:
+            self.key = None
+        else:
+            self.key = (self.typeNumber, self.sequenceNumber)
+        self.pieces = pieces
+        self.size = sum(len(piece) for piece in pieces)
+
+
+@implementer(IPushProducer)
+class c2wOutbox(object):
+
+    #: Above this number of queued bytes the client is considered slow: the
+    #: chat messages for it are held back until the queue goes below
+    #: :py:attr:`lowWaterMark`.
+    highWaterMark = 256 * 1024
+    lowWaterMark = 64 * 1024
+    #: Above this number of queued bytes (held back messages included) the
+    #: client is disconnected.
+    disconnectLimit = 4 * 1024 * 1024
+
+    def __init__(self, transport, batch=writeBatch, dropCallback=None):
+        """
+        :param transport: The transport of the connection.
+        :param batch: The :py:class:`c2wWriteBatch` delimiting the frames
+            written together.
+        :param dropCallback: Called with the sequence number of a message
+            which will never be sent (superseded by a newer one), to stop
+            its retransmission.
+
+        The send queue of one connection.  The frames written while a batch
+        is open (the ACK, the answer, the broadcasts triggered by other
+        clients...) are written with one ``writeSequence`` when the batch is
+        closed.  Outside a batch (e.g. a retransmission) the frames are
+        written immediately.
+
+        The outbox is registered as the (push) producer of the transport.
+        When the transport cannot keep up and pauses it, the frames are kept
+        in the outbox, where a slow client costs at most
+        :py:attr:`disconnectLimit` bytes:
+
+        * a frame already queued is not queued again when it is retransmitted,
+        * a whole user list replaces the user lists and user list updates
+          still queued (whether the outbox is paused, in a batch or still
+          draining its queue),
+        * above :py:attr:`highWaterMark` the chat messages are held back,
+        * above :py:attr:`disconnectLimit` the connection is closed.
+        """
+        self.transport = transport
+        self.batch = batch
+        self.dropCallback = dropCallback
+        #: The frames not written yet.
+        self._queue = collections.deque()
+        #: The chat messages held back while the client is slow.
+        self._heldBack = collections.deque()
+        #: The keys of the frames in the two queues.
+        self._queuedKeys = set()
+        #: Number of bytes in the queue and held back (for monitoring).
+        self.queuedBytes = 0
+        self.heldBackBytes = 0
+        #: True while the transport has paused the outbox.
+        self.paused = False
+        #: True from the moment the queue went above the high water mark
+        #: until it goes below the low water mark.
+        self.slow = False
+        self.closed = False
+        self._scheduled = False
+        registerProducer = getattr(transport, 'registerProducer', None)
+        if registerProducer is not None:
+            registerProducer(self, True)
+
+    def write(self, data):
+        self._add([data])
+
+    def writeSequence(self, buffSequence):
+        self._add(list(buffSequence))
+
+    def _add(self, pieces):
+        if self.closed:
+            return
+        if not self._queue and not self.paused and not self.batch.isOpen():
+            self.transport.writeSequence(pieces)
+            return
+        entry = c2wOutboxEntry(pieces)
+        if entry.key is not None and entry.key in self._queuedKeys:
+            return
+        if entry.typeNumber == USERS_LIST_TYPE:
+            self._dropSuperseded()
+        if self.slow and entry.typeNumber == CHAT_MESSAGE_TYPE:
+            self._heldBack.append(entry)
+            self.heldBackBytes += entry.size
+        else:
+            self._queue.append(entry)
+            self.queuedBytes += entry.size
+        if entry.key is not None:
+            self._queuedKeys.add(entry.key)
+        self._checkWaterMarks()
+        if self.paused or self.closed:
+            return
+        if not self.batch.isOpen():
+            self.flush()
+        elif not self._scheduled:
+            self._scheduled = True
+            self.batch.add(self)
+
+    def _dropSuperseded(self):
+        kept = collections.deque()
+        for entry in self._queue:
+            if entry.typeNumber in (USERS_LIST_TYPE, USERS_LIST_UPDATE_TYPE):
+                self._forget(entry)
+                self.queuedBytes -= entry.size
+                if self.dropCallback is not None:
+                    self.dropCallback(entry.sequenceNumber)
+            else:
+                kept.append(entry)
+        self._queue = kept
+
+    def _forget(self, entry):
+        if entry.key is not None:
+            self._queuedKeys.discard(entry.key)
+
+    def _checkWaterMarks(self):
+        if self.queuedBytes + self.heldBackBytes > self.disconnectLimit:
+            moduleLogger.warning('send queue over %s bytes, closing the ' +
+                                 'connection', self.disconnectLimit)
+            self.stopProducing()
+            self._unregister()
+            abortConnection = getattr(self.transport, 'abortConnection', None)
+            if abortConnection is not None:
+                abortConnection()
+            else:
+                self.transport.loseConnection()
+        elif not self.slow and self.queuedBytes > self.highWaterMark:
+            moduleLogger.warning('send queue over %s bytes, holding back ' +
+                                 'the chat messages', self.highWaterMark)
+            self.slow = True
+        elif self.slow and self.queuedBytes <= self.lowWaterMark:
+            self.slow = False
+            while self._heldBack:
+                entry = self._heldBack.popleft()
+                self.heldBackBytes -= entry.size
+                self._queue.append(entry)
+                self.queuedBytes += entry.size
+
+    def flush(self):
+        """
+        Writes the queued frames until the transport pauses the outbox (at
+        most :py:attr:`lowWaterMark` bytes per ``writeSequence``).
+        """
+        self._scheduled = False
+        while self._queue and not self.paused and not self.closed:
+            pieces = []
+            size = 0
+            while self._queue and (not pieces or size < self.lowWaterMark):
+                entry = self._queue.popleft()
+                self._forget(entry)
+                pieces.extend(entry.pieces)
+                size += entry.size
+            self.queuedBytes -= size
+            self._checkWaterMarks()
+            self.transport.writeSequence(pieces)
+
+    def close(self):
+        """
+        Writes what can still be written and unregisters the outbox, so that
+        the transport can be closed.
+        """
+        self.flush()
+        self.closed = True
+        self._unregister()
+
+    def _unregister(self):
+        unregisterProducer = getattr(self.transport, 'unregisterProducer', None)
+        if unregisterProducer is not None and self.transport.producer is self:
+            unregisterProducer()
+
+    def __len__(self):
+        """
+        Returns the number of frames not written yet (held back included).
+        """
+        return len(self._queue) + len(self._heldBack)
+
+    def pauseProducing(self):
+        self.paused = True
+
+    def resumeProducing(self):
+        self.paused = False
+        self.flush()
+
+    def stopProducing(self):
+        self.closed = True
+        self._queue.clear()
+        self._heldBack.clear()
+        self._queuedKeys.clear()
+        self.queuedBytes = 0
+        self.heldBackBytes = 0
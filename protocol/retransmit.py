@@ -0,0 +1,234 @@
+# -*- coding: utf-8 -*-
+import logging
+from twisted.internet import reactor
+
+logging.basicConfig()
+moduleLogger = logging.getLogger('c2w.protocol.retransmit')
+
+
+class c2wRetransmitEntry(object):
+
+    __slots__ = ('key', 'function', 'args', 'interval', 'backoff', 'deadline',
+                 'slot', 'sentAt', 'retransmissions')
+
+    def __init__(self, key, interval, function, args, backoff=None):
+        #: The key given by the protocol (usually the sequence number).
+        self.key = key
+        #: The time until the next sending.
+        self.interval = interval
+        #: Called with the entry when the message is sent again, returns the
+        #: new interval (``None``: the interval does not change).
+        self.backoff = backoff
+        self.function = function
+        self.args = args
+        #: When the message must be sent again.
+        self.deadline = None
+        #: The slot of the wheel holding the entry.
+        self.slot = None
+        #: When the message was sent for the first time.
+        self.sentAt = None
+        #: Number of times the message has been sent again.
+        self.retransmissions = 0
+
+
+class c2wRetransmitScheduler(object):
+
+    #: Duration (in seconds) of a slot of the wheel.  The messages due within
+    #: the same tick are sent again by the same reactor call.
+    tickInterval = 0.01
+    #: Number of slots of the wheel.  A message due later than one turn of
+    #: the wheel stays in its slot for the next turns.
+    wheelSize = 512
+
+    def __init__(self):
+        """
+        Retransmits every message sent by a protocol instance until it is
+        acknowledged, replacing one ``task.LoopingCall`` per message:
+
+        .. code-block:: python
+
+            self.retransmitScheduler.start(sequenceNumber, 1.0,
+                                           self.transport.write, buff)
+            ...
+            # ACK received
+            self.retransmitScheduler.stop(sequenceNumber)
+
+        The messages are kept in a hashed timer wheel (a slot per
+        :py:attr:`tickInterval`), so starting and stopping a retransmission
+        are O(1), and a single reactor call is pending, for the first slot
+        with a message due.  A stopped message is removed from the
+        scheduler.
+
+        The time of the scheduler is the reactor's ``seconds()``, but never
+        earlier than the time of the reactor call being run (the protocol
+        tests drive ``reactor.callLater`` with a ``task.Clock``).
+        """
+        self._slots = [{} for i in range(self.wheelSize)]
+        #: The messages not acknowledged yet, by key.
+        self._entries = {}
+        self._now = 0.0
+        #: The last tick whose slot has been run.
+        self._lastTick = 0
+        #: The pending reactor call and the time it was scheduled for.
+        self._call = None
+        self._callTime = None
+
+    def now(self):
+        """
+        Returns the current time of the scheduler (in seconds).
+        """
+        self._now = max(self._now, reactor.seconds())
+        return self._now
+
+    def _tickOf(self, time):
+        return int(time // self.tickInterval)
+
+    def start(self, key, interval, function, *args, backoff=None):
+        """
+        :param key: Identifies the message (e.g. its sequence number), a
+            message already scheduled with this key is replaced.
+        :param interval: The time (in seconds) between two sendings.
+        :param function: Called with ``args`` to send the message, now and
+            then every ``interval`` seconds until :py:meth:`stop` is called.
+        :param backoff: If given, called with the entry each time the message
+            is sent again, returns the time until the next sending (e.g.
+            :py:meth:`~c2w.protocol.rto.c2wRtoEstimator.backoff`).
+        """
+        self.stop(key)
+        now = self.now()
+        if not self._entries:
+            self._lastTick = self._tickOf(now) - 1
+        entry = c2wRetransmitEntry(key, interval, function, args, backoff)
+        entry.sentAt = now
+        function(*args)
+        entry.deadline = now + interval
+        self._insert(entry)
+        self._entries[key] = entry
+        # the pending reactor call, if any, is never later than the first
+        # deadline: it only has to move for an earlier one
+        if self._call is None or not self._call.active() or entry.deadline < self._callTime:
+            self._schedule()
+        return entry
+
+    def stop(self, key):
+        """
+        :param key: Identifies the message (given to :py:meth:`start`).
+        :returns: The entry of the message (with its
+            :py:attr:`~c2wRetransmitEntry.sentAt` and
+            :py:attr:`~c2wRetransmitEntry.retransmissions`), ``None`` if
+            it was not scheduled.
+        """
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return None
+        del self._slots[entry.slot][key]
+        if not self._entries:
+            self._cancelCall()
+        return entry
+
+    def stopAll(self):
+        """
+        Stops every retransmission (e.g. the connection is lost).
+        """
+        for slot in self._slots:
+            slot.clear()
+        self._entries.clear()
+        self._cancelCall()
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def __iter__(self):
+        """
+        Iterates over the keys of the messages not acknowledged yet (they
+        can be stopped meanwhile).
+        """
+        return iter(list(self._entries))
+
+    def __len__(self):
+        """
+        Returns the number of messages not acknowledged yet.
+        """
+        return len(self._entries)
+
+    def _insert(self, entry):
+        tick = self._tickOf(entry.deadline)
+        entry.slot = tick % self.wheelSize
+        self._slots[entry.slot][entry.key] = entry
+        # a deadline in a tick already run (an interval shorter than a
+        # tick): the tick is run again
+        if tick <= self._lastTick:
+            self._lastTick = tick - 1
+
+    def _dueIn(self, tick):
+        """
+        Returns the entries of the slot of ``tick`` which are due in this
+        tick or earlier (the other ones are due in a later turn of the
+        wheel).
+        """
+        return [e for e in self._slots[tick % self.wheelSize].values()
+                if self._tickOf(e.deadline) <= tick]
+
+    def _cancelCall(self):
+        if self._call is not None and self._call.active():
+            self._call.cancel()
+        self._call = None
+        self._callTime = None
+
+    def _nextTime(self):
+        """
+        Returns the deadline of the first message due, looking at most one
+        turn of the wheel ahead (after which the wheel is looked at again).
+        """
+        firstTick = self._lastTick + 1
+        for tick in range(firstTick, firstTick + self.wheelSize):
+            if not self._slots[tick % self.wheelSize]:
+                continue
+            due = self._dueIn(tick)
+            if due:
+                return min(e.deadline for e in due)
+        return (firstTick + self.wheelSize) * self.tickInterval
+
+    def _schedule(self):
+        if not self._entries:
+            self._cancelCall()
+            return
+        nextTime = self._nextTime()
+        if self._call is not None and self._call.active():
+            if self._callTime <= nextTime:
+                return
+            self._call.cancel()
+        self._callTime = nextTime
+        self._call = reactor.callLater(max(0.0, nextTime - self.now()), self._run)
+
+    def _run(self):
+        now = max(self.now(), self._callTime)
+        self._now = now
+        self._call = None
+        self._callTime = None
+        #: the slots are run up to the current tick, each one entirely: the
+        #: messages due later in the tick are sent with this call
+        lastTick = self._tickOf(now)
+        firstTick = max(self._lastTick + 1, lastTick - self.wheelSize + 1)
+        due = []
+        for tick in range(firstTick, lastTick + 1):
+            if self._slots[tick % self.wheelSize]:
+                due.extend(self._dueIn(tick))
+        self._lastTick = lastTick
+        for entry in due:
+            # stopped or replaced by the function of an entry sent before
+            if self._entries.get(entry.key) is not entry:
+                continue
+            del self._slots[entry.slot][entry.key]
+            entry.retransmissions += 1
+            if entry.backoff is not None:
+                entry.interval = entry.backoff(entry)
+            entry.deadline = now + entry.interval
+            self._insert(entry)
+            try:
+                entry.function(*entry.args)
+            except Exception:
+                moduleLogger.exception('retransmission of %r failed, ' +
+                                       'stopping it', entry.key)
+                self.stop(entry.key)
+        self._schedule()
@@ -0,0 +1,135 @@
+# -*- coding: utf-8 -*-
+import random
+
+
+class c2wRtoEstimator(object):
+
+    #: The timeout used until a first round-trip time has been measured.
+    initialRto = 1.0
+    #: Bounds of the timeout (in seconds).
+    minRto = 1.0
+    maxRto = 60.0
+    #: Gains of the smoothed round-trip time and of its variation, and the
+    #: weight of the variation in the timeout (RFC 6298).
+    alpha = 1.0 / 8
+    beta = 1.0 / 4
+    k = 4
+    #: The timeout is shortened by a random fraction (at most this one) so
+    #: that the messages lost together are not sent again all together.
+    jitter = 0.1
+
+    def __init__(self, minRto=None, randomFunction=random.random):
+        """
+        :param minRto: The smallest timeout (in seconds), the class
+            attribute :py:attr:`minRto` if ``None``.
+        :param randomFunction: Returns a float in [0, 1), used for the
+            jitter.
+
+        Estimates the round-trip time to one peer and derives from it the
+        retransmission timeout of the messages sent to this peer (RFC 6298):
+
+        .. code-block:: python
+
+            # the message is sent
+            entry = scheduler.start(
+                key, rtoEstimator.timeout(), send, buff,
+                backoff=lambda e: rtoEstimator.backoff(e, scheduler.now()))
+            ...
+            # its ACK is received
+            rtoEstimator.acknowledged(scheduler.stop(key), scheduler.now())
+
+        Only the messages acknowledged without having been sent again give a
+        round-trip time (Karn's rule: the ACK of a message sent twice cannot
+        be matched to one sending).  Each retransmission doubles the timeout
+        of the message.  The timeout of the next messages is doubled once per
+        loss event, until a message is acknowledged: the messages sent before
+        the last doubling were lost with the same event and do not double it
+        again.
+
+        The default bounds keep the timeout of the c2w specification (one
+        second); a peer on a LAN only gets tens of milliseconds with a lower
+        :py:attr:`minRto`.
+        """
+        if minRto is not None:
+            self.minRto = minRto
+        self.randomFunction = randomFunction
+        #: The smoothed round-trip time and its variation, ``None`` until a
+        #: first round-trip time has been measured.
+        self.srtt = None
+        self.rttvar = None
+        #: The timeout (in seconds) without backoff nor jitter.
+        self.rto = max(self.minRto, self.initialRto)
+        #: Number of times the timeout has been doubled since the last
+        #: acknowledged message.
+        self.backoffCount = 0
+        #: When :py:attr:`backoffCount` was last increased, ``None`` if never.
+        self.backedOffAt = None
+
+    def __repr__(self):
+        return '<c2wRtoEstimator srtt={0}, rttvar={1}, rto={2}>'.format(
+            self.srtt, self.rttvar, self.currentRto())
+
+    def _bound(self, rto):
+        return min(self.maxRto, max(self.minRto, rto))
+
+    def _jittered(self, rto):
+        return rto * (1.0 - self.jitter * self.randomFunction())
+
+    def currentRto(self):
+        """
+        Returns the timeout (in seconds) with the backoff, without jitter.
+        """
+        return self._bound(self.rto * 2 ** self.backoffCount)
+
+    def timeout(self):
+        """
+        Returns the time (in seconds) to wait for the ACK of a new message
+        before sending it again.
+        """
+        return self._jittered(self.currentRto())
+
+    def sample(self, rtt):
+        """
+        :param rtt: A measured round-trip time (in seconds).
+        """
+        rtt = max(0.0, rtt)
+        if self.srtt is None:
+            self.srtt = rtt
+            self.rttvar = rtt / 2
+        else:
+            self.rttvar = ((1 - self.beta) * self.rttvar +
+                           self.beta * abs(self.srtt - rtt))
+            self.srtt = (1 - self.alpha) * self.srtt + self.alpha * rtt
+        self.rto = self._bound(self.srtt + self.k * self.rttvar)
+        self.backoffCount = 0
+
+    def acknowledged(self, entry, now):
+        """
+        :param entry: The :py:class:`~c2w.protocol.retransmit.c2wRetransmitEntry`
+            of the acknowledged message (``None`` if it was not waiting for
+            an ACK, e.g. a duplicate ACK).
+        :param now: When the ACK was received.
+        """
+        if entry is None:
+            return
+        if entry.retransmissions == 0:
+            self.sample(now - entry.sentAt)
+        else:
+            # the peer answers again: back to the estimated timeout
+            self.backoffCount = 0
+
+    def backoff(self, entry, now):
+        """
+        :param entry: The :py:class:`~c2w.protocol.retransmit.c2wRetransmitEntry`
+            of the message sent again.
+        :param now: The time of the retransmission.
+
+        Called when the message of ``entry`` is sent again, returns the time
+        (in seconds) until it is sent once more: twice its own interval.
+        """
+        if self.backedOffAt is not None and entry.sentAt <= self.backedOffAt:
+            return self._jittered(self._bound(entry.interval * 2))
+        if self.currentRto() < self.maxRto:
+            self.backoffCount += 1
+            self.backedOffAt = now
+        return self._jittered(self._bound(entry.interval * 2))
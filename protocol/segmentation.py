@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+import collections
+from functions import decodeReassembledMessage
+
+
+class c2wReassembler(object):
+
+    #: Number of messages of the peer which can be partly received at the
+    #: same time (the oldest one is given up beyond, e.g. a users list
+    #: replaced by a newer one before all its segments were sent).
+    maxMessages = 8
+
+    def __init__(self):
+        """
+        Rebuilds the messages which the peer has split into segments (see
+        :py:func:`functions.prepareBuffSegments`), each segment having its
+        own sequence number and its own ACK:
+
+        .. code-block:: python
+
+            # a segment is received (once, duplicates are already ignored)
+            decodedMessage = self.reassembler.add(decodedSegment)
+            if decodedMessage is None:
+                return  # other segments of the message are missing
+
+        Only the segments which are lost are sent again, not the whole
+        message.
+        """
+        self._messages = collections.OrderedDict()
+
+    def add(self, decodedSegment):
+        """
+        :param decodedSegment: A decoded segment
+            (:py:class:`functions.c2wSegmentMessage`).
+        :returns: The decoded message once all its segments have been
+            received (with the sequence number of its first segment),
+            ``None`` before.
+        """
+        typeNumber, index, count = decodedSegment.segmentHeader
+        if index >= count:
+            return None
+        firstSequenceNumber = decodedSegment.firstSequenceNumber
+        key = (firstSequenceNumber, typeNumber, count)
+        chunks = self._messages.get(key)
+        if chunks is None:
+            chunks = self._messages[key] = [None] * count
+            if len(self._messages) > self.maxMessages:
+                self._messages.popitem(last=False)
+        chunks[index] = decodedSegment.data
+        if any(chunk is None for chunk in chunks):
+            return None
+        del self._messages[key]
+        return decodeReassembledMessage(typeNumber, firstSequenceNumber, b''.join(chunks))
+
+    def reset(self):
+        """
+        Forgets the messages partly received (the session with the peer is
+        over).
+        """
+        self._messages.clear()
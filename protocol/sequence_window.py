@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+from functions import SEQUENCE_NUMBER_MODULO
+
+
+class c2wSequenceWindow(object):
+
+    #: Number of sequence numbers remembered below the highest one received
+    #: (less than half of the 4096 sequence numbers).
+    windowSize = 1024
+
+    def __init__(self):
+        """
+        Detects the messages of one peer received twice (the peer sent them
+        again because their ACK was lost), in constant time and memory:
+
+        .. code-block:: python
+
+            if not self.receiveWindow.add(senderSequenceNumber):
+                return  # already treated
+
+        The window remembers the highest sequence number received and, in a
+        bitmap, which of the :py:attr:`windowSize` previous ones have been
+        received.  The sequence numbers have 12 bits, they are compared with
+        serial number arithmetic (RFC 1982): a sequence number less than
+        2048 after the highest one is newer, even if it has wrapped around
+        to 0.  A message older than the window is considered as treated.
+        """
+        #: The highest sequence number received, ``None`` before the first
+        #: message.
+        self.highestSequenceNumber = None
+        #: Bit i set: the message highestSequenceNumber - i has been received.
+        self.bitmap = 0
+
+    def __repr__(self):
+        return '<c2wSequenceWindow highest={0}>'.format(self.highestSequenceNumber)
+
+    def add(self, sequenceNumber):
+        """
+        :param sequenceNumber: The sequence number of a message received
+            from the peer.
+        :returns: True if the message must be treated, False if it has
+            already been received (or is older than the window).
+        """
+        if self.highestSequenceNumber is None:
+            self.highestSequenceNumber = sequenceNumber
+            self.bitmap = 1
+            return True
+        ahead = (sequenceNumber - self.highestSequenceNumber) % SEQUENCE_NUMBER_MODULO
+        if 0 < ahead < SEQUENCE_NUMBER_MODULO // 2:
+            self.bitmap = ((self.bitmap << ahead) | 1) & ((1 << self.windowSize) - 1)
+            self.highestSequenceNumber = sequenceNumber
+            return True
+        behind = (self.highestSequenceNumber - sequenceNumber) % SEQUENCE_NUMBER_MODULO
+        if behind >= self.windowSize:
+            return False
+        bit = 1 << behind
+        if self.bitmap & bit:
+            return False
+        self.bitmap |= bit
+        return True
+
+    def reset(self):
+        """
+        Forgets every message (the session with the peer is over).
+        """
+        self.highestSequenceNumber = None
+        self.bitmap = 0
@@ -1,21 +1,27 @@
 # -*- coding: utf-8 -*-
 from twisted.internet.protocol import Protocol
 from functions import prepareBuffHeader
-from functions import prepareBuff
-from functions import decodeBuffHeader
-from functions import decodeBuffMovieList
-from functions import decodeBuffUsersList
+from functions import SEQUENCE_NUMBER_MODULO
+from functions import decodeMessage
+from functions import applyUsersListUpdate
 from functions import prepareBuffChatMessage
-from functions import decodeBuffChatMessage
 from c2w.main.constants import ROOM_IDS
-import struct
-from twisted.internet import task
+from c2w.protocol.frame_reader import c2wFrameReader
+from c2w.protocol.retransmit import c2wRetransmitScheduler
+from c2w.protocol.sequence_window import c2wSequenceWindow
 import logging
 logging.basicConfig()
 moduleLogger = logging.getLogger('c2w.protocol.tcp_chat_client_protocol')
 
 class c2wTcpChatClientProtocol(Protocol):
 
+    #: When True, TCP is trusted to deliver every message: each message is
+    #: written once, no retransmission timer is armed and duplicates are not
+    #: tracked.  The sequence number is then incremented when a message is
+    #: sent, so the next one does not wait for the ACK of the previous one.
+    #: Off by default, the messages on the wire are the same in both modes.
+    reliableTransport = False
+
     def __init__(self, clientProxy, serverAddress, serverPort):
 
         """
@@ -51,8 +57,8 @@ prepareBuff
         #: The clientProxy, which the protocol must use
         #: to interact with the Graphical User Interface
         self.clientProxy = clientProxy
-        #: Task would be a dic of all the buff to retransmit everysecond with sequence number as key.
-        self.tasks = {}
+        #: Retransmits every second the messages not acknowledged yet, with their sequence number as key.
+        self.retransmitScheduler = c2wRetransmitScheduler()
         #: The dictionnary of idMovie: title of movie or MAINROOM, useful to update status of user
         self.movieIdNameDic = {0: ROOM_IDS.MAIN_ROOM}
         #: The sequence number to handle lost sent buff.
@@ -63,17 +69,36 @@ prepareBuff
         self.userList = []
         #: username of the client connected to the server
         self.userName = ""
-        #: The total  data received usefull to wait until we received at least one full message from server.
-        self.totalBuff = bytes()
-        #: Lenght of the last message received.
-        self.lenMessage = 0
+        #: Keeps the data received until at least one full message from the server is received.
+        self.frameReader = c2wFrameReader()
         #: The next three attributs are important to store the sequence number of
         #: the quit request the joinroom request and the leave movie room request.
         self.quitRequestNumber = -1
         self.validateJoinRoom = -1
         self.validateJoinMainRoom = -1
-        #: The list of treated client sequence number, use to ignore message already received if an ack is lost.
-        self.sequenceNumberTreated = []
+        #: The sequence numbers already treated (fixed-size sliding window), used to ignore a message
+        #: already received if its ack is lost.
+        self.receiveWindow = c2wSequenceWindow()
+
+    def sendUntilAck(self, requestType, buffData):
+        """
+        :param requestType: The type of the message.
+        :param buffData: The data of the message (bytes).
+
+        Sends the message, with the current sequence number, every second
+        until its ACK is received or, with a reliable transport, only once.
+        The header and the data are written with ``writeSequence``: the
+        message is never copied into one buffer.
+
+        :returns: The header and the data sent.
+        """
+        buffSequence = [prepareBuffHeader(requestType, buffData, self.sequenceNumber), buffData]
+        if self.reliableTransport:
+            self.transport.writeSequence(buffSequence)
+            self.sequenceNumber = (self.sequenceNumber + 1) % SEQUENCE_NUMBER_MODULO
+        else:
+            self.retransmitScheduler.start(self.sequenceNumber, 1.0, self.transport.writeSequence, buffSequence)
+        return buffSequence
 
     def sendLoginRequestOIE(self, userName):
         """
@@ -81,17 +106,10 @@ prepareBuff
         The client proxy calls this function when the user clicks on
         the login button.
         """
-        lenUsername = len(userName)
-        buffData = struct.pack("!" + str(lenUsername) + "s", userName.encode('utf-8'))
         requestType = 1
-        data = userName
         self.userName = userName
 
-        buffHeader = prepareBuffHeader(requestType, data, self.sequenceNumber)
-        buffPacket = prepareBuff(buffHeader, buffData)
-
-        self.tasks[self.sequenceNumber] = task.LoopingCall(self.transport.write, buffPacket)
-        self.tasks[self.sequenceNumber].start(1.0)
+        buffPacket = self.sendUntilAck(requestType, userName.encode('utf-8'))
         moduleLogger.debug('loginRequest called with username=%s', userName)
         print("login data sent to the server : ", buffPacket)
 
@@ -111,13 +129,8 @@ prepareBuff
            message is handled properly, i.e., it is shown only by the
            client(s) who are in the same room.
         """
-        buffPacket = prepareBuffChatMessage(self.userName, message)
-        requestType = 9
-        buffHeader = prepareBuffHeader(requestType, buffPacket, self.sequenceNumber)
-        buff = prepareBuff(buffHeader, buffPacket)
-        self.tasks[self.sequenceNumber] = task.LoopingCall(self.transport.write, buff)
-        self.tasks[self.sequenceNumber].start(1.0)
-        print("chat message data sent to the server : ", buffPacket)
+        buff = self.sendUntilAck(9, prepareBuffChatMessage(self.userName, message))
+        print("chat message data sent to the server : ", buff)
         pass
 
     def sendJoinRoomRequestOIE(self, roomName):
@@ -138,21 +151,12 @@ prepareBuff
         if roomName == ROOM_IDS.MAIN_ROOM:
             roomName = "0"
             requestType = 4
-        lenRoomName = len(roomName)
-        buffData = struct.pack("!" + str(lenRoomName) + "s", roomName.encode('utf-8'))
-
-        data = roomName
-        
-        buffHeader = prepareBuffHeader(requestType, data, self.sequenceNumber)
-        buffPacket = prepareBuff(buffHeader, buffData)
-        
-        self.tasks[self.sequenceNumber] = task.LoopingCall(self.transport.write, buffPacket)
-        self.tasks[self.sequenceNumber].start(1.0)
-        print("sending request of movie room : ", buffPacket)
         if roomName == "0":
             self.validateJoinMainRoom = self.sequenceNumber
         else:
             self.validateJoinRoom = self.sequenceNumber
+        buffPacket = self.sendUntilAck(requestType, roomName.encode('utf-8'))
+        print("sending request of movie room : ", buffPacket)
         
         
         pass
@@ -162,128 +166,127 @@ prepareBuff
         Called by the client proxy  when the user
         has clicked on the leave button in the main room.
         """
-        buffHeader = prepareBuffHeader(2,  self.userName, self.sequenceNumber)
-        buffUserName = struct.pack("!" + str(len(self.userName)) + "s", self.userName.encode('utf-8'))
-        buff = prepareBuff(buffHeader, buffUserName)
-        self.tasks[self.sequenceNumber] = task.LoopingCall(self.transport.write, buff)
-        self.tasks[self.sequenceNumber].start(1.0)
-        print("sending leave request to the server : ", buff )
         self.quitRequestNumber = self.sequenceNumber
+        buff = self.sendUntilAck(2, self.userName.encode('utf-8'))
+        print("sending leave request to the server : ", buff )
 
         pass
 
+    def sendUserListRequest(self):
+        """
+        Ask the server for the whole user list (type 11), used when an
+        update of the user list does not match our list.
+        """
+        buff = self.sendUntilAck(11, b'')
+        print("sending user list request to the server : ", buff)
+
     def dataReceived(self, data):
+        """
+        :param data: The data received from the server (not necessarily
+                     an entire message!)
+        Twisted calls this method whenever new data is received on this
+        connection.
+        """
 
-    
         print("data received from the server : ", data)
-        self.totalBuff += data
+        #: The frame reader keeps the data until a whole message is received,
+        #: every complete message is then treated in order by frameReceived.
+        self.frameReader.feed(data)
+        try:
+            for frame in self.frameReader.frames():
+                self.frameReceived(frame)
+        except ValueError:
+            moduleLogger.error('invalid frame received from the server, closing the connection')
+            self.transport.loseConnection()
+
+    def frameReceived(self, frame):
+        """
+        :param frame: One complete message received from the server.
+        """
+        decodedDatagram = decodeMessage(frame)
+        print("message receive from server :")
+        print(decodedDatagram)
+        senderSequenceNumber = decodedDatagram.sequenceNumber
+        typeOfRequest = decodedDatagram.typeNumber
         
-        #: If the data received is longer than when byte that means we can store the lenght of the message
-        if len(self.totalBuff) > 1:
-            self.lenMessage = int(struct.unpack("!H", self.totalBuff[0:2])[0])
+        #: If message received not an ACK then send ACK
+        if typeOfRequest != 0:   
+            buffHeader = prepareBuffHeader(0, "", senderSequenceNumber)
+            self.transport.write(buffHeader) 
+            print("sending ", buffHeader, "to the server")
             
-            #: If total buff received longer than one message we can then treat the message
-            if len(self.totalBuff) >= self.lenMessage:
-                print("totalBuff : ", self.totalBuff)
-                separatedDatagram = decodeBuffHeader(self.totalBuff[:self.lenMessage])
-                print("message receive from server :")
-                print(separatedDatagram)
-                senderSequenceNumber = separatedDatagram[1]
-                typeOfRequest = separatedDatagram[2]
+            #: Then we check if the message has been already treated (received once and ack sent lost).
+            #: if it is we ignore it. A reliable transport never delivers a message twice.
+            if self.reliableTransport:
+                pass
+            #: If not it is added to the window and we treat the message
+            elif not self.receiveWindow.add(senderSequenceNumber) and typeOfRequest != 1:
+                return
                 
-                #: If message received not an ACK then send ACK
-                if typeOfRequest != 0:   
-                    buffHeader = prepareBuffHeader(0, "", senderSequenceNumber)
-                    self.transport.write(buffHeader) 
-                    print("sending ", buffHeader, "to the server")
-                    
-                    #: Then we check if the message has been already treated (received once and ack sent lost).
-                    #: if it is we ignore it
-                    if senderSequenceNumber in self.sequenceNumberTreated and typeOfRequest != 1:
-                        
-                        #: If there is data left to treat (total buff > one message) 
-                        #: we call recursively datareceivde with the rest of the data
-                        if len(self.totalBuff[self.lenMessage:]) > 0 :
-                            data = self.totalBuff[self.lenMessage:]
-                            self.totalBuff = bytes()  
-                            self.dataReceived(data)
-                        else:
-                            return
-                        
-                    #: If not we add the sender sequence number to the treated one and we then treat the message
-                    else: 
-                        self.sequenceNumberTreated.append(senderSequenceNumber)
-                        
-                #: If message received ACK increment sequence number, stop task    
-                if typeOfRequest == 0: 
-                    if senderSequenceNumber == self.sequenceNumber:
-                        self.tasks[senderSequenceNumber].stop()
-                        self.sequenceNumber = self.sequenceNumber + 1
-                        
-                        # If ack of quit request is received we empty the userList to  and leave the system
-                        if self.quitRequestNumber == senderSequenceNumber:
-                            self.userList = []
-                            self.clientProxy.leaveSystemOKONE()
-                        
-                        #: If ack of validateJoinRoom received we call the client proxy to join the room    
-                        if senderSequenceNumber == self.validateJoinRoom:
-                            self.clientProxy.joinRoomOKONE()
-
-                        #: If ack of validateJoinMainRoom received we call the client proxy to join the main room
-                        if senderSequenceNumber == self.validateJoinMainRoom:
-                            self.clientProxy.joinRoomOKONE()
-
-                #: if message received  list of movies available we store the movie list and create the dictionnary of movie id: title            
-                if typeOfRequest == 5:   
-                    self.movieList = decodeBuffMovieList(self.totalBuff[:self.lenMessage])
-                    print("la liste des films est la suivante", self.movieList)
-                    #on créer le dictionnaire id-> nom film
-                    for movie in self.movieList:
-                        self.movieIdNameDic[movie[3]] = movie[0]
-                    print("voici le dictionnaire des films : ", self.movieIdNameDic)
-                
-                #if message received list of users: we create the userList with movie title or MAIN_ROOM thanks to the dictionnary
-                if typeOfRequest == 6:
-                        newUserList = decodeBuffUsersList(self.totalBuff[:self.lenMessage])
-                        userListwithMovieTitle = []
-                        for user in newUserList:
-                            userListwithMovieTitle.append((user[0], self.movieIdNameDic[user[1]]))
-                        
-                        #: If it's the first time the client receive userList we display main room
-                        if self.userList ==[]:
-                            self.userList = userListwithMovieTitle
-                            self.clientProxy.initCompleteONE(userListwithMovieTitle, self.movieList)
-                        
-                        #: If not we set the new userList with position of user to update satus
-                        else:
-                            self.userList = userListwithMovieTitle
-                            self.clientProxy.setUserListONE(userListwithMovieTitle)
-                            print("userList has been updated : ", self.userList)
+        #: If message received ACK increment sequence number, stop task    
+        #: (with a reliable transport the sequence number has already been incremented)
+        if typeOfRequest == 0: 
+            if self.reliableTransport or senderSequenceNumber == self.sequenceNumber:
+                if self.retransmitScheduler.stop(senderSequenceNumber) is not None:
+                    self.sequenceNumber = (self.sequenceNumber + 1) % SEQUENCE_NUMBER_MODULO
                 
-                #: If message received connection refused request we display it calling the proxy
-                if typeOfRequest == 8:
-                    self.clientProxy.connectionRejectedONE("userName already used")
-                    
-                #if message received is send message request we call the proxy to display the message
-                if typeOfRequest == 9:
-                    userName, message = decodeBuffChatMessage(self.totalBuff[:self.lenMessage])
-                    if userName != self.userName:
-                        self.clientProxy.chatMessageReceivedONE(userName, message)
+                # If ack of quit request is received we empty the userList to  and leave the system
+                if self.quitRequestNumber == senderSequenceNumber:
+                    self.userList = []
+                    self.receiveWindow.reset()
+                    self.clientProxy.leaveSystemOKONE()
                 
-                #if datagram longer than one message : call dataReceived with the rest of the data
-                if len(self.totalBuff[self.lenMessage:]) > 0 :
+                #: If ack of validateJoinRoom received we call the client proxy to join the room    
+                if senderSequenceNumber == self.validateJoinRoom:
+                    self.clientProxy.joinRoomOKONE()
 
-                    data = self.totalBuff[self.lenMessage:]
-                    self.totalBuff = bytes()  
-                    self.dataReceived(data)
-
-                self.totalBuff = bytes() 
+                #: If ack of validateJoinMainRoom received we call the client proxy to join the main room
+                if senderSequenceNumber == self.validateJoinMainRoom:
+                    self.clientProxy.joinRoomOKONE()
 
+        #: if message received  list of movies available we store the movie list and create the dictionnary of movie id: title            
+        if typeOfRequest == 5:   
+            self.movieList = decodedDatagram.movieList
+            print("la liste des films est la suivante", self.movieList)
+            #on créer le dictionnaire id-> nom film
+            for movie in self.movieList:
+                self.movieIdNameDic[movie[3]] = movie[0]
+            print("voici le dictionnaire des films : ", self.movieIdNameDic)
+        
+        #if message received list of users: we create the userList with movie title or MAIN_ROOM thanks to the dictionnary
+        if typeOfRequest == 6:
+                newUserList = decodedDatagram.usersList
+                userListwithMovieTitle = []
+                for user in newUserList:
+                    userListwithMovieTitle.append((user[0], self.movieIdNameDic[user[1]]))
+                
+                #: If it's the first time the client receive userList we display main room
+                if self.userList ==[]:
+                    self.userList = userListwithMovieTitle
+                    self.clientProxy.initCompleteONE(userListwithMovieTitle, self.movieList)
+                
+                #: If not we set the new userList with position of user to update satus
+                else:
+                    self.userList = userListwithMovieTitle
+                    self.clientProxy.setUserListONE(userListwithMovieTitle)
+                    print("userList has been updated : ", self.userList)
 
-        """
-        :param data: The data received from the client (not necessarily
-                     an entire message!)
-        Twisted calls this method whenever new data is received on this
-        connection.
-        """
-        pass
+        #: if message received is an update of the user list we only update the users concerned.
+        #: It is ignored until the whole list is received, as the whole list already contains it.
+        if typeOfRequest == 10 and self.userList != []:
+            changes, consistent = applyUsersListUpdate(self.userList, decodedDatagram.usersListUpdate, self.movieIdNameDic)
+            for userName, roomName in changes:
+                self.clientProxy.userUpdateReceivedONE(userName, roomName)
+            print("userList has been updated : ", self.userList)
+            if not consistent:
+                self.sendUserListRequest()
+        
+        #: If message received connection refused request we display it calling the proxy
+        if typeOfRequest == 8:
+            self.clientProxy.connectionRejectedONE("userName already used")
+            
+        #if message received is send message request we call the proxy to display the message
+        if typeOfRequest == 9:
+            userName, message = decodedDatagram.chatMessage
+            if userName != self.userName:
+                self.clientProxy.chatMessageReceivedONE(userName, message)
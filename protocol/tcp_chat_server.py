@@ -1,20 +1,37 @@
 # -*- coding: utf-8 -*-
 from twisted.internet.protocol import Protocol
 import logging
-import struct
-from twisted.internet import task
-from functions import decodeBuffHeader
-from functions import prepareBuff
+from functions import decodeMessage
+from functions import c2wBroadcast
 from functions import prepareBuffHeader
+from functions import SEQUENCE_NUMBER_MODULO
 from functions import prepareBuffMovieList
 from functions import prepareBuffUsersList
-from functions import decodeBuffChatMessage
+from functions import prepareBuffUsersListUpdate
+from functions import USER_ADDED
+from functions import USER_MOVED
+from functions import USER_REMOVED
 from functions import prepareBuffChatMessage
 from c2w.main.constants import ROOM_IDS
+from c2w.protocol.frame_reader import c2wFrameReader
+from c2w.protocol.outbox import c2wOutbox
+from c2w.protocol.outbox import writeBatch
+from c2w.protocol.retransmit import c2wRetransmitScheduler
+from c2w.protocol.sequence_window import c2wSequenceWindow
 logging.basicConfig()
 moduleLogger = logging.getLogger('c2w.protocol.tcp_chat_server_protocol')
 
 class c2wTcpChatServerProtocol(Protocol):
+
+    #: When True, TCP is trusted to deliver every message: each message is
+    #: written once, no retransmission timer is armed and duplicates are not
+    #: tracked.  The ACKs are still sent and used to go on with the login.
+    #: Off by default, the messages on the wire are the same in both modes.
+    reliableTransport = False
+    #: The messages are already coalesced by the outbox (one write per
+    #: connection and per received data), so Nagle's algorithm would only
+    #: delay them: TCP_NODELAY is set on every connection.
+    tcpNoDelay = True
     
     def __init__(self, serverProxy, clientAddress, clientPort):
         """
@@ -66,38 +83,100 @@ class c2wTcpChatServerProtocol(Protocol):
         self.serverProxy = serverProxy
         #: The sequence number to handle lost sent buff.
         self.sequenceNumber = 0
-        #: Task would be a dic of all the buff to retransmit everysecond with sequence number as key.
-        self.tasks = {}
-        #: The total  data received usefull to wait until we received at least one full message from server.
-        self.totalBuff = bytes()
-        #: Lenght of the last message received.
-        self.lenMessage = 0
+        #: Retransmits every second the messages not acknowledged yet, with their sequence number as key.
+        self.retransmitScheduler = c2wRetransmitScheduler()
+        #: Keeps the data received until at least one full message from the client is received.
+        self.frameReader = c2wFrameReader()
+        #: The send queue of the client (see c2wOutbox), created with the connection.
+        self.outbox = None
         #: The next two attributs are important to store the sequence number of
         #: the validation connection and the movieList after connection.
         self.validateConnectionNumber = -1
         self.validateMovieListNumber = -1
         #: The userName of the client connect to the server.
         self.userName = ""
-        #: The list of treated client sequence number, use to ignore message already received if an ack is lost.
-        self.sequenceNumberTreated = []
+        #: The sequence numbers already treated (fixed-size sliding window), used to ignore a message
+        #: already received if its ack is lost.
+        self.receiveWindow = c2wSequenceWindow()
     
     
-    #: Function that sore the send every seond a message until the ack of client in task, increment sequence number.
+    def connectionMade(self):
+        self.outbox = c2wOutbox(self.transport, dropCallback=self.stopRetransmission)
+        setTcpNoDelay = getattr(self.transport, 'setTcpNoDelay', None)
+        if setTcpNoDelay is not None:
+            setTcpNoDelay(self.tcpNoDelay)
+
+    def connectionLost(self, reason):
+        """
+        :param reason: Why the connection was lost.
+
+        Stops every retransmission and, if the client had not left the
+        system, removes its user and tells it to the other clients.
+        """
+        moduleLogger.info('connection with %s:%s lost', self.clientAddress, self.clientPort)
+        self.retransmitScheduler.stopAll()
+        self.receiveWindow.reset()
+        if self.outbox is not None:
+            self.outbox.stopProducing()
+        if self.factory is not None:
+            self.factory.protocolInstances.discard(self)
+
+        #: The userName is also set when the login is refused, so the user must belong to this connection
+        user = self.serverProxy.getUserByName(self.userName)
+        if user is not None and user.userChatInstance is self:
+            self.serverProxy.removeUser(self.userName)
+            with writeBatch:
+                self.updateUserList(USER_REMOVED, user)
+
+    #: Function that send every second a message until the ack of client, increment sequence number.
+    #: With a reliable transport the message is only written once.
     def sendUntilAck(self, buff, sequenceNumber):
-        self.tasks[sequenceNumber] = task.LoopingCall(self.transport.write, buff)
-        self.tasks[sequenceNumber].start(1.0)
-        self.sequenceNumber = self.sequenceNumber + 1
+        if self.reliableTransport:
+            self.outbox.write(buff)
+        else:
+            self.retransmitScheduler.start(sequenceNumber, 1.0, self.outbox.write, buff)
+        self.sequenceNumber = (self.sequenceNumber + 1) % SEQUENCE_NUMBER_MODULO
+
+    #: Same as sendUntilAck for a broadcast message: buffSequence is [header, shared payload]
+    #: and is written with writeSequence, so the payload is never copied per recipient.
+    def sendSequenceUntilAck(self, buffSequence, sequenceNumber):
+        if self.reliableTransport:
+            self.outbox.writeSequence(buffSequence)
+        else:
+            self.retransmitScheduler.start(sequenceNumber, 1.0, self.outbox.writeSequence, buffSequence)
+        self.sequenceNumber = (self.sequenceNumber + 1) % SEQUENCE_NUMBER_MODULO
     
-    #: Function that send the user list to every client. We camm it everytime there is a change of status.
-    def updateUserList(self):
+    #: Function that stop the retransmission of a message: called when its ack is received or
+    #: when the outbox drops it for a slow client (superseded by a newer user list).
+    def stopRetransmission(self, sequenceNumber):
+        self.retransmitScheduler.stop(sequenceNumber)
+
+    def getSendQueueDepth(self):
+        """
+        Returns the number of messages and the number of bytes waiting in
+        the send queue of this client, for monitoring.
+        """
+        return len(self.outbox), self.outbox.queuedBytes + self.outbox.heldBackBytes
+
+    #: Function that send the whole user list to this client only (at login or when the client asks for a resync).
+    def sendUserList(self):
+        buffUsersList = self.serverProxy.getEncodedUserList(prepareBuffUsersList)
+        buffSequence = [prepareBuffHeader(6, buffUsersList, self.sequenceNumber), buffUsersList]
+        self.sendSequenceUntilAck(buffSequence, self.sequenceNumber)
+        print("sending users list : ", buffSequence, "to ", self.userName)
+
+    #: Function that send only the change of one user (type 10) to every client. We call it everytime there is a change of status.
+    #: The changed user only receives it when he has changed room.
+    def updateUserList(self, action, changedUser):
         usersList = self.serverProxy.getUserList()
-        print ("userList to send : ", usersList)
-        buffUsersList = prepareBuffUsersList(usersList)
+        print ("userList update to send : ", action, changedUser)
+        broadcast = c2wBroadcast(10, prepareBuffUsersListUpdate([(action, changedUser)]))
         for user in usersList:
-            buffHeader = prepareBuffHeader(6, buffUsersList, user.userChatInstance.sequenceNumber)
-            buff = prepareBuff(buffHeader, buffUsersList)
-            user.userChatInstance.sendUntilAck(buff, user.userChatInstance.sequenceNumber)
-            print("sending users list : ", buff, "to ", user.userName)    
+            if user is changedUser and action != USER_MOVED:
+                continue
+            buffSequence = broadcast.prepareBuffSequence(user.userChatInstance.sequenceNumber)
+            user.userChatInstance.sendSequenceUntilAck(buffSequence, user.userChatInstance.sequenceNumber)
+            print("sending users list update : ", buffSequence, "to ", user.userName)    
         
         
     def dataReceived(self, data):
@@ -109,141 +188,133 @@ class c2wTcpChatServerProtocol(Protocol):
         """
 
         print("data received from the client : ", data)
-        self.totalBuff += data
-        
-        #: If the data received is longer than when byte that means we can store the lenght of the message
-        if len(self.totalBuff) > 1:
-            self.lenMessage = int(struct.unpack("!H", self.totalBuff[0:2])[0])
+        #: The frame reader keeps the data until a whole message is received,
+        #: every complete message is then treated in order by frameReceived.
+        #: Everything written to the clients meanwhile is flushed at the end of the batch.
+        self.frameReader.feed(data)
+        with writeBatch:
+            try:
+                for frame in self.frameReader.frames():
+                    self.frameReceived(frame)
+            except ValueError:
+                moduleLogger.error('invalid frame received from the client, closing the connection')
+                self.outbox.close()
+                self.transport.loseConnection()
+
+    def frameReceived(self, frame):
+        """
+        :param frame: One complete message received from the client.
+        """
+        decodedDatagram = decodeMessage(frame)
+        print("message receive from client :")
+        print(decodedDatagram)
+        senderSequenceNumber = decodedDatagram.sequenceNumber
+        typeOfRequest = decodedDatagram.typeNumber
+
+        #: If message received not an ACK then send ACK
+        if typeOfRequest != 0:   
+            buffHeader = prepareBuffHeader(0, "", senderSequenceNumber)
+            self.outbox.write(buffHeader)
+            print("sending ", buffHeader, "to the client")
             
-            #: If total buff received longer than one message we can then treat the message
-            if len(self.totalBuff) >= self.lenMessage:
-                print("totalBuff : ", self.totalBuff)
-
-                separatedDatagram = decodeBuffHeader(self.totalBuff[:self.lenMessage])
-                print("message receive from client :")
-                print(separatedDatagram)
-                senderSequenceNumber = separatedDatagram[1]
-                typeOfRequest = separatedDatagram[2]
-
-                #: If message received not an ACK then send ACK
-                if typeOfRequest != 0:   
-                    buffHeader = prepareBuffHeader(0, "", senderSequenceNumber)
-                    self.transport.write(buffHeader)
-                    print("sending ", buffHeader, "to the client")
-                    
-                    #: Then we check if the message has been already treated (received once and ack sent lost).
-                    #: if it is we ignore it
-                    if senderSequenceNumber in self.sequenceNumberTreated and typeOfRequest != 1:
-                        #: If there is data left to treat (total buff > one message) 
-                        #: we call recursively datareceivde with the rest of the data
-                        if len(self.totalBuff[self.lenMessage:]) > 0 :
-                            data = self.totalBuff[self.lenMessage:]
-                            self.totalBuff = bytes()  
-                            self.dataReceived(data)
-                        else:
-                            return
-                        
-                    #: If not we add the sender sequence number to the treated one and we after treat the message
-                    else: 
-                        self.sequenceNumberTreated.append(senderSequenceNumber)
-                        
-                #: If data received ACK we stop sending the message according to the sequence number
-                if typeOfRequest == 0: 
-                    self.tasks[senderSequenceNumber].stop()
-                    
-                    #: If ACK of connection validation is received then we send movieList to the client
-                    if self.validateConnectionNumber == senderSequenceNumber:
-                        movies = self.serverProxy.getMovieList()
-                        buffMovieList = prepareBuffMovieList(movies)
-                        buffHeader = prepareBuffHeader(5, buffMovieList, self.sequenceNumber)
-                        buff = prepareBuff(buffHeader, buffMovieList)
-                        self.validateMovieListNumber = self.sequenceNumber
-                        self.sendUntilAck(buff, self.sequenceNumber)
-                        print("sending ", buff, "to the client")
-
-                    #:  if ACK of sent movie list is received then we send new  userList to every client
-                    if self.validateMovieListNumber == senderSequenceNumber:
-                       self.updateUserList()
-                        
-                #: If data received is connection request we store the username
-                if typeOfRequest == 1: 
-                    userName = separatedDatagram[3]
-                    self.userName = userName
-                    
-                    #: if userName already used send a connection refused
-                    if self.serverProxy.userExists(userName): 
-                        buffHeader = prepareBuffHeader(8, "", senderSequenceNumber)
-                        self.sendUntilAck(buffHeader, senderSequenceNumber)
-                    
-                    #: If not send connection successfull and add user to server proxy
-                    else:  
-                        buffHeader = prepareBuffHeader(7, "", senderSequenceNumber)
-                        self.sendUntilAck(buffHeader, senderSequenceNumber)
-                        print("sending ", buffHeader, " to the client")                       
-                        self.validateConnectionNumber = senderSequenceNumber                 
-                        self.serverProxy.addUser(userName, ROOM_IDS.MAIN_ROOM, userChatInstance=self)
-                        
-                #If leave Mainroom request we remove user from the proxy and send the new user list to every client.
-                if typeOfRequest == 2:
-                    userName = separatedDatagram[3]
-                    print("the username of the person who wants to leave :", userName)
-                    print("userList : ", self.serverProxy.getUserList())
-                    self.serverProxy.removeUser(userName)
-                    self.updateUserList()
-        
-                #: If join movie room request we start stream the movie, 
-                #: update the user list of server proxy and send it to every client.
-                if typeOfRequest == 3:
-                    movieTitle = separatedDatagram[3]
-                    self.serverProxy.startStreamingMovie(movieTitle)
-                    movie = self.serverProxy.getMovieByTitle(movieTitle)
-                    idRoom = movie.movieId
-                    self.serverProxy.updateUserChatroom(self.userName, str(idRoom))
-                    self.updateUserList()
-                    print("userList has been updated", self.serverProxy.getUserList())
-                    
-                #If leave movie room request we update the user list of server proxy and send it to every client.
-                if typeOfRequest == 4:
-                    """#userRoom = self.serverProxy.getUserByAddress(self.clientAddress).userChatRoom
-                    #userList = self.serverProxy.getUserList()
-                    #numberUserInMovieRoom = 0
-                    #we go through the list of user top see if there is anybody left in the room
-                    #for user in userList:
-                    #    if user.userChatRoom == userRoom:
-                    #        numberUserInMovieRoom += 1
-                    #if there is just the user who wants to leave the room we stop streaming video
-                    #if numberUserInMovieRoom == 1:
-                    #   self.serverProxy.stopStreamingMovie(self.serverProxy.getMovieById(userRoom).movieTitle)"""
-                    self.serverProxy.updateUserChatroom(self.userName, ROOM_IDS.MAIN_ROOM)
-                    self.updateUserList()
-                    print("userList has been updated", self.serverProxy.getUserList())
+            #: Then we check if the message has been already treated (received once and ack sent lost).
+            #: if it is we ignore it. A reliable transport never delivers a message twice.
+            if self.reliableTransport:
+                pass
+            #: If not it is added to the window and we treat the message
+            elif not self.receiveWindow.add(senderSequenceNumber) and typeOfRequest != 1:
+                return
                 
-                #: If send message request we get the room of the sender and
-                #: send the message to every client in the same room
-                if typeOfRequest == 9:
-
-                    userList = self.serverProxy.getUserList()
-                    userName, message = decodeBuffChatMessage(self.totalBuff[:self.lenMessage])
-                    senderRoom = self.serverProxy.getUserByName(userName).userChatRoom
-                    buffPacket = prepareBuffChatMessage(userName, message)
-                    requestType = 9
-                    for user in userList:
-                        if senderRoom == user.userChatRoom:
-                            buffHeader = prepareBuffHeader(requestType, buffPacket, user.userChatInstance.sequenceNumber)
-                            buff = prepareBuff(buffHeader, buffPacket)
-                            user.userChatInstance.sendUntilAck(buff, user.userChatInstance.sequenceNumber)
-                            print("sending chat message to : ", user.userName , self.totalBuff[:self.lenMessage])
+        #: If data received ACK we stop sending the message according to the sequence number
+        #: (there is no task with a reliable transport)
+        if typeOfRequest == 0: 
+            self.stopRetransmission(senderSequenceNumber)
+            
+            #: If ACK of connection validation is received then we send movieList to the client
+            if self.validateConnectionNumber == senderSequenceNumber:
+                #: The encoded movie list is cached by the movie store, only the header is built here
+                buffMovieList = self.serverProxy.getEncodedMovieList(prepareBuffMovieList)
+                buffSequence = [prepareBuffHeader(5, buffMovieList, self.sequenceNumber), buffMovieList]
+                self.validateMovieListNumber = self.sequenceNumber
+                self.sendSequenceUntilAck(buffSequence, self.sequenceNumber)
+                print("sending ", buffSequence, "to the client")
+
+            #:  if ACK of sent movie list is received then we send the whole userList to the new client
+            #:  and only its arrival to the other ones
+            if self.validateMovieListNumber == senderSequenceNumber:
+               self.sendUserList()
+               self.updateUserList(USER_ADDED, self.serverProxy.getUserByName(self.userName))
+                
+        #: If data received is connection request we store the username
+        if typeOfRequest == 1: 
+            userName = decodedDatagram.text
+            self.userName = userName
+            
+            #: if userName already used send a connection refused
+            if self.serverProxy.userExists(userName): 
+                buffHeader = prepareBuffHeader(8, "", senderSequenceNumber)
+                self.sendUntilAck(buffHeader, senderSequenceNumber)
+            
+            #: If not send connection successfull and add user to server proxy
+            else:  
+                buffHeader = prepareBuffHeader(7, "", senderSequenceNumber)
+                self.sendUntilAck(buffHeader, senderSequenceNumber)
+                print("sending ", buffHeader, " to the client")                       
+                self.validateConnectionNumber = senderSequenceNumber                 
+                self.serverProxy.addUser(userName, ROOM_IDS.MAIN_ROOM, userChatInstance=self)
                 
-                #: If there is data left to treat (total buff > one message) 
-                #: we call recursively datareceivde with the rest of the data
-                if len(self.totalBuff[self.lenMessage:]) > 0 :
-                    data = self.totalBuff[self.lenMessage:]
-                    self.totalBuff = bytes()  
-                    self.dataReceived(data)
-                    
-                self.totalBuff = bytes()
+        #If leave Mainroom request we remove user from the proxy and send the new user list to every client.
+        if typeOfRequest == 2:
+            userName = decodedDatagram.text
+            print("the username of the person who wants to leave :", userName)
+            print("userList : ", self.serverProxy.getUserList())
+            leavingUser = self.serverProxy.getUserByName(userName)
+            self.serverProxy.removeUser(userName)
+            self.updateUserList(USER_REMOVED, leavingUser)
+
+        #: If join movie room request we start stream the movie, 
+        #: update the user list of server proxy and send it to every client.
+        if typeOfRequest == 3:
+            movieTitle = decodedDatagram.text
+            self.serverProxy.startStreamingMovie(movieTitle)
+            movie = self.serverProxy.getMovieByTitle(movieTitle)
+            idRoom = movie.movieId
+            self.serverProxy.updateUserChatroom(self.userName, str(idRoom))
+            self.updateUserList(USER_MOVED, self.serverProxy.getUserByName(self.userName))
+            print("userList has been updated", self.serverProxy.getUserList())
             
+        #If leave movie room request we update the user list of server proxy and send it to every client.
+        if typeOfRequest == 4:
+            """#userRoom = self.serverProxy.getUserByAddress(self.clientAddress).userChatRoom
+            #userList = self.serverProxy.getUserList()
+            #numberUserInMovieRoom = 0
+            #we go through the list of user top see if there is anybody left in the room
+            #for user in userList:
+            #    if user.userChatRoom == userRoom:
+            #        numberUserInMovieRoom += 1
+            #if there is just the user who wants to leave the room we stop streaming video
+            #if numberUserInMovieRoom == 1:
+            #   self.serverProxy.stopStreamingMovie(self.serverProxy.getMovieById(userRoom).movieTitle)"""
+            self.serverProxy.updateUserChatroom(self.userName, ROOM_IDS.MAIN_ROOM)
+            self.updateUserList(USER_MOVED, self.serverProxy.getUserByName(self.userName))
+            print("userList has been updated", self.serverProxy.getUserList())
         
+        #: If the client asks for a resync of the user list we send it the whole list
+        if typeOfRequest == 11:
+            self.sendUserList()
+
+        #: If send message request we get the room of the sender and
+        #: send the message to every client in the same room
+        if typeOfRequest == 9:
 
-        pass
+            userList = self.serverProxy.getUserList()
+            userName, message = decodedDatagram.chatMessage
+            senderRoom = self.serverProxy.getUserByName(userName).userChatRoom
+            requestType = 9
+            broadcast = c2wBroadcast(requestType, prepareBuffChatMessage(userName, message))
+            for user in userList:
+                if senderRoom == user.userChatRoom:
+                    buffSequence = broadcast.prepareBuffSequence(user.userChatInstance.sequenceNumber)
+                    user.userChatInstance.sendSequenceUntilAck(buffSequence, user.userChatInstance.sequenceNumber)
+                    print("sending chat message to : ", user.userName , message)
 
@@ -1,17 +1,38 @@
     # -*- coding: utf-8 -*-
 from twisted.internet.protocol import DatagramProtocol
+from twisted.internet import reactor
 from c2w.main.lossy_transport import LossyTransport
-from twisted.internet import task
+import collections
 from c2w.main.constants import ROOM_IDS
+from c2w.protocol.retransmit import c2wRetransmitScheduler
+from c2w.protocol.rto import c2wRtoEstimator
+from c2w.protocol.ack import c2wAckTracker
+from c2w.protocol.sequence_window import c2wSequenceWindow
+from c2w.protocol.fec import c2wFecEncoder
+from c2w.protocol.fec import c2wFecDecoder
+from c2w.protocol.segmentation import c2wReassembler
+from c2w.protocol.coalesce import c2wCoalescer
+from c2w.protocol.multicast import c2wMulticastReceiver
+from c2w.protocol.multicast import c2wMulticastChatListener
+from c2w.protocol.multicast import multicastGroupOf
+from c2w.protocol.multicast import multicastPortOf
 import logging
-import struct
 from functions import prepareBuffHeader
-from functions import prepareBuff
-from functions import decodeBuffHeader
-from functions import decodeBuffMovieList
-from functions import decodeBuffUsersList
-from functions import prepareBuffChatMessage
-from functions import decodeBuffChatMessage
+from functions import prepareBuffPacket
+from functions import prepareBuffLogin
+from functions import decodeMessage
+from functions import applyUsersListUpdate
+from functions import prepareBuffChatMessagePacket
+from functions import SEQUENCE_NUMBER_MODULO
+from functions import FEC_PARITY_TYPE
+from functions import SEGMENT_TYPE
+from functions import HEADER_SIZE
+from functions import HEADER_STRUCT
+from functions import prepareBuffSegments
+from functions import prepareBuffMulticastNack
+from functions import MULTICAST_CHAT_TYPE
+from functions import MULTICAST_NACK_TYPE
+from functions import splitDatagram
 
 logging.basicConfig()
 moduleLogger = logging.getLogger('c2w.protocol.udp_chat_client_protocol')
@@ -19,6 +40,33 @@ moduleLogger = logging.getLogger('c2w.protocol.udp_chat_client_protocol')
 
 class c2wUdpChatClientProtocol(DatagramProtocol):
 
+    #: The smallest retransmission timeout (in seconds), see
+    #: :py:class:`~c2w.protocol.rto.c2wRtoEstimator`.
+    minRto = c2wRtoEstimator.minRto
+    #: The maximum number of messages sent to the server and not acknowledged
+    #: yet (at most :py:data:`~c2w.protocol.udp_session.RECEIVE_WINDOW`).
+    sendWindow = 8
+    #: Acknowledge the messages of the server with cumulative and selective
+    #: ACKs (see :py:class:`~c2w.protocol.ack.c2wAckTracker`), the server
+    #: then does the same.  Only for a server which understands them.
+    selectiveAcks = False
+    #: Number of messages protected by one parity message (forward error
+    #: correction, see :py:class:`~c2w.protocol.fec.c2wFecEncoder`), 0 for
+    #: none.  The server then protects its messages to this client too.
+    fecGroupSize = 0
+    #: The largest datagram sent (header included), a longer chat message
+    #: is sent as segments acknowledged one by one.
+    maxDatagramSize = 1400
+    #: The multicast group of the chat of the main room (the one of the
+    #: server), ``None`` to receive the chat by unicast.  See
+    #: :py:class:`~c2w.protocol.multicast.c2wMulticastReceiver`.
+    multicastChatGroup = None
+    #: Time (in seconds) the messages sent to the server wait for the next
+    #: ones to leave in the same datagram (see
+    #: :py:class:`~c2w.protocol.coalesce.c2wCoalescer`), ``None`` to send
+    #: one datagram per message.
+    coalesceWindow = None
+
     def __init__(self, serverAddress, serverPort, clientProxy, lossPr):
         """
         :param serverAddress: The IP address (or the name) of the c2w server,
@@ -59,8 +107,11 @@ class c2wUdpChatClientProtocol(DatagramProtocol):
             protocol.
         """
 
+        #: Retransmits the messages not acknowledged yet, with their sequence number as key.
+        self.retransmitScheduler = c2wRetransmitScheduler()
+        #: The retransmission timeout, derived from the round-trip time to the server.
+        self.rtoEstimator = c2wRtoEstimator(self.minRto)
         #: The IP address of the c2w server.
-        self.tasks = {}
         self.serverAddress = serverAddress
         #: The port number of the c2w server.
         self.serverPort = serverPort
@@ -68,7 +119,28 @@ class c2wUdpChatClientProtocol(DatagramProtocol):
         #: to interact with the Graphical User Interface.
         self.clientProxy = clientProxy
         self.lossPr = lossPr
+        #: The sequence number of the next message sent to the server.
         self.sequenceNumber = 0
+        #: The messages (sequence number, buffer) waiting for a place in the
+        #: send window, in order.
+        self.sendQueue = collections.deque()
+        #: Acknowledges the messages of the server (only with selectiveAcks).
+        self.ackTracker = None
+        #: Send and use the parity messages (only with fecGroupSize).
+        self.fecEncoder = None
+        self.fecDecoder = None
+        #: Rebuilds the messages of the server sent as segments.
+        self.reassembler = c2wReassembler()
+        #: Packs the messages sent to the server within coalesceWindow into
+        #: one datagram, ``None`` without coalescing window.
+        self.coalescer = None
+        #: Receive the chat of the room by multicast (only with
+        #: multicastChatGroup): the UDP port of the groups, the room
+        #: (id and group) and its sequence numbers.
+        self.multicastPort = None
+        self.multicastRoomId = None
+        self.multicastGroup = None
+        self.multicastReceiver = None
         self.movieList = []
         self.movieIdNameDic = {0: ROOM_IDS.MAIN_ROOM}
         self.userList = []
@@ -76,9 +148,9 @@ class c2wUdpChatClientProtocol(DatagramProtocol):
         self.quitRequestNumber = -1
         self.validateJoinRoom = -1
         self.validateJoinMainRoom = -1
-        # La liste des numéros de séquence des clients traités, permet 
-        # d'ignorer les messages déjà reçus en cas de perte d'un chèque.
-        self.sequenceNumberTreated = []
+        # Les numéros de séquence des messages du serveur déjà traités (fenêtre glissante de taille fixe), permet 
+        # d'ignorer les messages déjà reçus en cas de perte d'un ack.
+        self.receiveWindow = c2wSequenceWindow()
         
     def startProtocol(self):
         """
@@ -94,6 +166,118 @@ class c2wUdpChatClientProtocol(DatagramProtocol):
         
         pass
 
+    #envoie un message au serveur, dans le même datagramme que les suivants s'ils arrivent pendant la fenêtre de regroupement
+    def write(self, buff, host_port):
+        if self.coalescer is None:
+            self.transport.write(buff, host_port)
+            return
+        self.coalescer.write(buff)
+
+    #envoie un message au serveur (préparé avec self.sequenceNumber, le numéro de séquence suivant est alors utilisé)
+    #maintenant puis à chaque timeout (doublé à chaque envoi) jusqu'à la réception de son ack.
+    #Au plus sendWindow messages attendent leur ack, les suivants attendent dans sendQueue et partent dans l'ordre
+    def sendUntilAck(self, buff):
+        sequenceNumber = self.sequenceNumber
+        self.sequenceNumber = (self.sequenceNumber + 1) % SEQUENCE_NUMBER_MODULO
+        if self.sendQueue or not self.canSend(sequenceNumber):
+            self.sendQueue.append((sequenceNumber, buff))
+            return
+        self.startRetransmission(sequenceNumber, buff)
+
+    def startRetransmission(self, sequenceNumber, buff):
+        self.retransmitScheduler.start(sequenceNumber, self.rtoEstimator.timeout(), self.write, buff,
+                                       (self.serverAddress, self.serverPort), backoff=self.retransmissionTimedOut)
+        if self.fecEncoder is not None:
+            self.fecEncoder.add(sequenceNumber, buff)
+
+    #un message est renvoyé faute d'ack : son timeout est doublé, et celui des messages suivants une fois par perte
+    def retransmissionTimedOut(self, entry):
+        return self.rtoEstimator.backoff(entry, self.retransmitScheduler.now())
+
+    #même chose que sendUntilAck pour un message qui peut être trop long pour un datagramme : il est alors envoyé
+    #en segments, chacun avec son numéro de séquence et son ack (un message trop long pour 255 segments n'est pas envoyé)
+    def sendSegmentsUntilAck(self, buff):
+        requestType = HEADER_STRUCT.unpack_from(buff)[1] & 15
+        try:
+            segments = prepareBuffSegments(requestType, memoryview(buff)[HEADER_SIZE:], self.maxDatagramSize)
+        except ValueError:
+            moduleLogger.error('message of %s bytes too long to be sent', len(buff))
+            return
+        if not segments:
+            self.sendUntilAck(buff)
+        for buffData in segments:
+            self.sendUntilAck(prepareBuffPacket(SEGMENT_TYPE, buffData, self.sequenceNumber))
+
+    #un message peut partir s'il y a de la place dans la fenêtre d'envoi et si son numéro de séquence reste à moins de
+    #c2wAckTracker.windowSize du plus ancien message pas encore acquitté : au-delà, un serveur qui utilise les acks
+    #cumulatifs et sélectifs considère le plus ancien comme abandonné et l'acquitte sans l'avoir reçu
+    def canSend(self, sequenceNumber):
+        if len(self.retransmitScheduler) >= self.sendWindow:
+            return False
+        for oldestSequenceNumber in self.retransmitScheduler:
+            return (sequenceNumber - oldestSequenceNumber) % SEQUENCE_NUMBER_MODULO < c2wAckTracker.windowSize
+        return True
+
+    #envoie les messages en attente tant qu'il y a de la place dans la fenêtre d'envoi
+    def sendQueuedMessages(self):
+        while self.sendQueue and self.canSend(self.sendQueue[0][0]):
+            sequenceNumber, buff = self.sendQueue.popleft()
+            self.startRetransmission(sequenceNumber, buff)
+
+    #Le client reçoit le chat de sa room en multicast : il quitte le groupe de l'ancienne room, rejoint celui de la nouvelle
+    #et demande au serveur un heartbeat du groupe (la demande est traitée après le changement de room). Le chat lui
+    #arrive en unicast tant qu'il n'a pas renvoyé au serveur le numéro d'un heartbeat reçu du groupe
+    def enterMulticastRoom(self, roomId):
+        if self.multicastChatGroup is None:
+            return
+        if self.multicastPort is None:
+            self.multicastPort = reactor.listenMulticast(multicastPortOf(self.serverPort),
+                                                         c2wMulticastChatListener(self.multicastDatagramReceived),
+                                                         listenMultiple=True)
+        self.leaveMulticastRoom()
+        self.multicastRoomId = roomId
+        self.multicastGroup = multicastGroupOf(self.multicastChatGroup, roomId)
+        self.multicastPort.joinGroup(self.multicastGroup)
+        self.multicastReceiver = c2wMulticastReceiver(self.sendMulticastNack)
+        self.multicastReceiver.nack()
+
+    #quitte le groupe multicast de la room (changement de room ou départ du système)
+    def leaveMulticastRoom(self):
+        if self.multicastGroup is not None:
+            self.multicastPort.leaveGroup(self.multicastGroup)
+            self.multicastGroup = None
+        if self.multicastReceiver is not None:
+            self.multicastReceiver.cancel()
+            self.multicastReceiver = None
+        self.multicastRoomId = None
+
+    #demande au serveur les messages multicast manquants de la room (aucun : un heartbeat du groupe ; avant la
+    #synchronisation, le numéro du heartbeat reçu du groupe confirme que le client reçoit le groupe)
+    def sendMulticastNack(self, sequenceNumbers):
+        buff = prepareBuffPacket(MULTICAST_NACK_TYPE, prepareBuffMulticastNack(self.multicastRoomId, sequenceNumbers),
+                                 self.sequenceNumber)
+        self.sendUntilAck(buff)
+
+    #Un message du chat de la room reçu en multicast, ou envoyé par le serveur à ce client seul (message réparé ou numéro du
+    #dernier message de la room, qui synchronise le client après sa confirmation). Il n'est pas acquitté : un message
+    #perdu est redemandé quand le suivant arrive
+    def multicastDatagramReceived(self, datagram, host_port, unicast=False):
+        decodedDatagram = decodeMessage(datagram)
+        if (decodedDatagram.typeNumber != MULTICAST_CHAT_TYPE or self.multicastReceiver is None
+                or decodedDatagram.roomId != self.multicastRoomId):
+            return
+        if decodedDatagram.isHeartbeat:
+            if unicast:
+                self.multicastReceiver.sync(decodedDatagram.sequenceNumber)
+            else:
+                self.multicastReceiver.heartbeat(decodedDatagram.sequenceNumber)
+            return
+        if not self.multicastReceiver.received(decodedDatagram.sequenceNumber):
+            return
+        userName, message = decodedDatagram.chatMessage
+        if userName != self.userName:
+            self.clientProxy.chatMessageReceivedONE(userName, message)
+
     #Le client envoie une demande de connexion au serveur en rentrant son userName
     def sendLoginRequestOIE(self, userName):
         """
@@ -102,17 +286,29 @@ class c2wUdpChatClientProtocol(DatagramProtocol):
         The client proxy calls this function when the user clicks on
         the login button.
         """    
-        lenUsername = len(userName)
-        buffData = struct.pack("!" + str(lenUsername) + "s", userName.encode('utf-8'))#l'username (ici les donées) est encodé en binaire pour l'envoie au serveur 
         requestType = 1
-        data = userName
         self.userName = userName
+        #une nouvelle connexion (éventuellement après un refus) repart du numéro de séquence 0, 
+        #comme les messages du serveur pour ce client
+        self.sequenceNumber = 0
+        self.receiveWindow.reset()
+        self.reassembler.reset()
+        if self.coalesceWindow is not None:
+            self.coalescer = c2wCoalescer(lambda buff: self.transport.write(buff, (self.serverAddress, self.serverPort)),
+                                          self.coalesceWindow, self.maxDatagramSize)
+        if self.selectiveAcks:
+            self.ackTracker = c2wAckTracker(lambda buff: self.write(buff, (self.serverAddress, self.serverPort)),
+                                            SEQUENCE_NUMBER_MODULO - 1)
+        if self.fecGroupSize:
+            self.fecEncoder = c2wFecEncoder(lambda buff: self.write(buff, (self.serverAddress, self.serverPort)),
+                                            self.fecGroupSize)
+            self.fecDecoder = c2wFecDecoder()
    
-        buffHeader = prepareBuffHeader(requestType, data, self.sequenceNumber)
-        buffPacket = prepareBuff(buffHeader, buffData)
+        #l'username (ici les donées) est encodé en binaire et écrit avec le header dans un seul buffer pour l'envoie au serveur,
+        #suivi de la taille des groupes de la correction d'erreurs : le serveur l'utilise aussi dès la connexion
+        buffPacket = prepareBuffPacket(requestType, prepareBuffLogin(userName, self.fecGroupSize), self.sequenceNumber)
         
-        self.tasks[self.sequenceNumber] = task.LoopingCall(self.transport.write, buffPacket, (self.serverAddress, self.serverPort)) #le client envoie la tache a effectuer au serveur
-        self.tasks[self.sequenceNumber].start(1.0) # l'envoie est répéter chaque seconde jusqu'à l'envoie de l'ack
+        self.sendUntilAck(buffPacket) # l'envoie est répéter chaque seconde jusqu'à la réception de l'ack
         moduleLogger.debug('loginRequest called with username=%s', userName)
         print("login data sent to the server : ", buffPacket)
 
@@ -136,14 +332,10 @@ class c2wUdpChatClientProtocol(DatagramProtocol):
            client(s) who are in the same room.
         """       
         #le message envoyé par un utilisateur et son nom associé est alors transformé au format binaire par prepareBuffChatMessage
-        buffPacket = prepareBuffChatMessage(self.userName, message)
-        requestType = 9
-        buffHeader = prepareBuffHeader(requestType, buffPacket, self.sequenceNumber)
-        buff = prepareBuff(buffHeader, buffPacket)
+        buff = prepareBuffChatMessagePacket(self.userName, message, self.sequenceNumber)
         #voie de la tache au serveur, le serveur va diffusé le message à tous les autres utilisateurs qui sont dans sa room
-        self.tasks[self.sequenceNumber] = task.LoopingCall(self.transport.write, buff, (self.serverAddress, self.serverPort)) 
-        self.tasks[self.sequenceNumber].start(1.0)
-        print("chat message data sent to the server : ", buffPacket)
+        self.sendSegmentsUntilAck(buff)
+        print("chat message data sent to the server : ", buff)
         
         pass
     #Le client envoie une requête d'accès à une room au serveur
@@ -166,21 +358,21 @@ class c2wUdpChatClientProtocol(DatagramProtocol):
         if roomName == ROOM_IDS.MAIN_ROOM:
             roomName = "0"
             requestType = 4
-        lenRoomName = len(roomName)
-        buffData = struct.pack("!" + str(lenRoomName) + "s", roomName.encode('utf-8'))
-
-        data = roomName
-        
-        buffHeader = prepareBuffHeader(requestType, data, self.sequenceNumber)
-        buffPacket = prepareBuff(buffHeader, buffData)
-        
-        self.tasks[self.sequenceNumber] = task.LoopingCall(self.transport.write, buffPacket, (self.serverAddress, self.serverPort))
-        self.tasks[self.sequenceNumber].start(1.0)
-        print("sending request of movie room : ", buffPacket)
+        buffPacket = prepareBuffPacket(requestType, roomName.encode('utf-8'), self.sequenceNumber)
         if roomName == "0":
             self.validateJoinMainRoom = self.sequenceNumber
         else:
             self.validateJoinRoom = self.sequenceNumber
+        
+        self.sendUntilAck(buffPacket)
+        print("sending request of movie room : ", buffPacket)
+        #le chat de la nouvelle room arrive par son groupe multicast
+        if roomName == "0":
+            self.enterMulticastRoom(0)
+        else:
+            for movieId, movieTitle in self.movieIdNameDic.items():
+                if movieTitle == roomName:
+                    self.enterMulticastRoom(movieId)
 
         pass
 
@@ -191,16 +383,20 @@ class c2wUdpChatClientProtocol(DatagramProtocol):
         has clicked on the leave button in the main room.
         """
         
-        buffHeader = prepareBuffHeader(2,  self.userName, self.sequenceNumber)
-        buffUserName = struct.pack("!" + str(len(self.userName)) + "s", self.userName.encode('utf-8'))
-        buff = prepareBuff(buffHeader, buffUserName)
-        self.tasks[self.sequenceNumber] = task.LoopingCall(self.transport.write, buff, (self.serverAddress, self.serverPort))
-        self.tasks[self.sequenceNumber].start(1.0)
-        print("sending leave request to the server : ", buff )
+        buff = prepareBuffPacket(2, self.userName.encode('utf-8'), self.sequenceNumber)
         self.quitRequestNumber = self.sequenceNumber
+        self.sendUntilAck(buff)
+        print("sending leave request to the server : ", buff )
         
         pass
 
+    #Le client demande la liste complète des utilisateurs au serveur (type 11) quand une mise à jour
+    #ne correspond pas à sa liste
+    def sendUserListRequest(self):
+        buff = prepareBuffPacket(11, b'', self.sequenceNumber)
+        self.sendUntilAck(buff)
+        print("sending user list request to the server : ", buff)
+
     def datagramReceived(self, datagram, host_port):
          
         """:param string datagram: the payload of the UDP packet.
@@ -209,46 +405,86 @@ class c2wUdpChatClientProtocol(DatagramProtocol):
         Called **by Twisted** when the client has received a UDP
         packet."""
         
-        separatedDatagram = decodeBuffHeader(datagram) #on attribut separatedDatagram à l'intégralité des données transmis
+        #un datagramme qui contient plusieurs messages à la suite (voir c2wCoalescer) : chacun est traité comme s'il était
+        #reçu seul, avec son propre ack
+        messages = splitDatagram(datagram)
+        if len(messages) > 1:
+            for message in messages:
+                self.datagramReceived(message, host_port)
+            return
+        
+        decodedDatagram = decodeMessage(datagram) #on attribut decodedDatagram au message décodé (les données ne sont décodées qu'à la demande)
         print("message receive from server :")
-        print(separatedDatagram)
+        print(decodedDatagram)
         
         
-        senderSequenceNumber = separatedDatagram[1]
-        typeOfRequest = separatedDatagram[2]
+        senderSequenceNumber = decodedDatagram.sequenceNumber
+        typeOfRequest = decodedDatagram.typeNumber
+        
+        #Un message du chat multicast envoyé à ce client seul n'est pas acquitté non plus
+        if typeOfRequest == MULTICAST_CHAT_TYPE:
+            self.multicastDatagramReceived(datagram, host_port, unicast=True)
+            return
+        
+        #Un message de parité (correction d'erreurs) n'est pas acquitté : si un seul message de son groupe manque, 
+        #il est reconstruit et traité comme s'il était reçu
+        if typeOfRequest == FEC_PARITY_TYPE:
+            if self.fecDecoder is not None:
+                rebuiltDatagram = self.fecDecoder.recover(decodedDatagram)
+                if rebuiltDatagram is not None:
+                    print("message rebuilt from the parity : ", rebuiltDatagram)
+                    self.datagramReceived(rebuiltDatagram, host_port)
+            return
         
         if typeOfRequest != 0:   #Si ce qu'on reçoit ce n'est pas un ack on renvoie un ack au serveur (data='')
-            buffHeader = prepareBuffHeader(0, "", senderSequenceNumber)
-            self.transport.write(buffHeader, (host_port)) 
-            print("sending ack to the server: ", buffHeader)
-            #: On regarde ensuite si le numéro de séquence est dans la liste des numéros de séquence
-            #: déjà traité (dans le cas d'un ack perdu). Si c'est le cas on sort de la fonction sans traiter le message
-            if senderSequenceNumber in self.sequenceNumberTreated and typeOfRequest != 1:
+            if self.fecDecoder is not None:
+                self.fecDecoder.add(senderSequenceNumber, datagram)
+            if self.ackTracker is not None: #ou un ack cumulatif et sélectif un peu plus tard
+                self.ackTracker.received(senderSequenceNumber)
+            else:
+                buffHeader = prepareBuffHeader(0, "", senderSequenceNumber)
+                self.write(buffHeader, (host_port)) 
+                print("sending ack to the server: ", buffHeader)
+            #: On regarde ensuite si le numéro de séquence est dans la fenêtre des numéros de séquence
+            #: déjà traités (dans le cas d'un ack perdu). Si c'est le cas on sort de la fonction sans traiter le message,
+            #: sinon il y est ajouté et on va traiter le message
+            if not self.receiveWindow.add(senderSequenceNumber) and typeOfRequest != 1:
+                return
+        
+        #Un segment d'un message découpé : le message n'est traité qu'une fois tous ses segments reçus
+        if typeOfRequest == SEGMENT_TYPE:
+            decodedDatagram = self.reassembler.add(decodedDatagram)
+            if decodedDatagram is None:
                 return
-             #: Sinon on va traiter le message donc on ajoute le numéro de séquence de l'envoyeur dans la liste des numéros de séquences traités.
-            else: 
-                self.sequenceNumberTreated.append(senderSequenceNumber)
+            typeOfRequest = decodedDatagram.typeNumber
         
-        if typeOfRequest == 0: #Si on reçoit un l'ack on incrémente le sequence number, et on stop la demande
-            if senderSequenceNumber == self.sequenceNumber:
-                self.tasks[senderSequenceNumber].stop()
-                self.sequenceNumber = self.sequenceNumber + 1
+        if typeOfRequest == 0: #Si on reçoit l'ack de messages en attente on stop leurs demandes (un ack en double est ignoré)
+            for sequenceNumber in decodedDatagram.acknowledgedAmong(self.retransmitScheduler):
+                #le temps d'aller-retour du message met à jour le timeout des suivants
+                entry = self.retransmitScheduler.stop(sequenceNumber)
+                self.rtoEstimator.acknowledged(entry, self.retransmitScheduler.now())
                 
-                if self.quitRequestNumber == senderSequenceNumber:
+                if self.quitRequestNumber == sequenceNumber:
                     self.userList == []
+                    self.receiveWindow.reset()
+                    self.leaveMulticastRoom()
+                    if self.multicastPort is not None:
+                        self.multicastPort.stopListening()
+                        self.multicastPort = None
                     self.clientProxy.leaveSystemOKONE()
 
                 
-                if senderSequenceNumber == self.validateJoinRoom:
+                if sequenceNumber == self.validateJoinRoom:
                     self.clientProxy.joinRoomOKONE()
 
-                if senderSequenceNumber == self.validateJoinMainRoom:
+                if sequenceNumber == self.validateJoinMainRoom:
                     self.clientProxy.joinRoomOKONE()
+            self.sendQueuedMessages()
                     
         
         #Si on reçoit la liste des films disponible            
         if typeOfRequest == 5:   
-            self.movieList = decodeBuffMovieList(datagram)
+            self.movieList = decodedDatagram.movieList
             print("la liste des films est la suivante", self.movieList)
             #on créer le dictionnaire id-> nom film
             for movie in self.movieList:
@@ -260,7 +496,7 @@ class c2wUdpChatClientProtocol(DatagramProtocol):
         
         #Si on reçoit la liste des utilisateurs 
         if typeOfRequest == 6:
-            newUserList = decodeBuffUsersList(datagram)
+            newUserList = decodedDatagram.usersList
             userListwithMovieTitle = []
             for user in newUserList:
                 userListwithMovieTitle.append((user[0], self.movieIdNameDic[user[1]]))
@@ -268,12 +504,23 @@ class c2wUdpChatClientProtocol(DatagramProtocol):
             if self.userList ==[]:
                 self.userList = userListwithMovieTitle
                 self.clientProxy.initCompleteONE(userListwithMovieTitle, self.movieList)
+                self.enterMulticastRoom(0)
 
             else:
                 self.userList = userListwithMovieTitle
                 self.clientProxy.setUserListONE(userListwithMovieTitle)
                 print("userList has been updated : ", self.userList)
 
+        #Si on reçoit une mise à jour de la liste des utilisateurs, on ne modifie que les utilisateurs concernés.
+        #Le serveur n'envoie une mise à jour qu'après l'ack de la liste complète et de la mise à jour précédente : elles
+        #arrivent dans l'ordre, après la liste (une mise à jour reçue sans liste, après le départ du système, est ignorée)
+        if typeOfRequest == 10 and self.userList != []:
+            changes, consistent = applyUsersListUpdate(self.userList, decodedDatagram.usersListUpdate, self.movieIdNameDic)
+            for userName, roomName in changes:
+                self.clientProxy.userUpdateReceivedONE(userName, roomName)
+            print("userList has been updated : ", self.userList)
+            if not consistent:
+                self.sendUserListRequest()
                 
         
         #Si l'username est déjà utilisé, la connexion est rejeté
@@ -282,7 +529,7 @@ class c2wUdpChatClientProtocol(DatagramProtocol):
             
         #Si l'utilisateur envoie un message, on prend l'username et le message comme données et on envoie au serveur 
         if typeOfRequest == 9:
-            userName, message = decodeBuffChatMessage(datagram)
+            userName, message = decodedDatagram.chatMessage
             if userName != self.userName: #Pas de Ré-envoi à sois même parceque c'est gérer directement 
                 self.clientProxy.chatMessageReceivedONE(userName, message)
             
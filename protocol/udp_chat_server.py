@@ -1,16 +1,34 @@
 # -*- coding: utf-8 -*-
 from twisted.internet.protocol import DatagramProtocol
+from twisted.python import log
 from c2w.main.lossy_transport import LossyTransport
 import logging
-from functions import decodeBuffHeader
-from functions import prepareBuff
+from functions import decodeMessage
+from functions import c2wBroadcast
 from functions import prepareBuffHeader
 from functions import prepareBuffMovieList
 from functions import prepareBuffUsersList
+from functions import prepareBuffUsersListUpdate
+from functions import USER_ADDED
+from functions import USER_MOVED
+from functions import USER_REMOVED
+from functions import SEQUENCE_NUMBER_MODULO
+from functions import HEADER_SIZE
+from functions import FEC_PARITY_TYPE
+from functions import SEGMENT_TYPE
+from functions import MULTICAST_NACK_TYPE
+from functions import splitDatagram
 from functions import prepareBuffChatMessage
-from functions import decodeBuffChatMessage
-from twisted.internet import task
 from c2w.main.constants import ROOM_IDS
+from c2w.protocol.udp_session import c2wUdpSession
+from c2w.protocol.retransmit import c2wRetransmitScheduler
+from c2w.protocol.rto import c2wRtoEstimator
+from c2w.protocol.multicast import c2wMulticastRoom
+from c2w.protocol.multicast import multicastGroupOf
+from c2w.protocol.multicast import multicastPortOf
+from c2w.protocol.udp_session import LOGIN_ACCEPTED
+from c2w.protocol.udp_session import MOVIE_LIST_SENT
+from c2w.protocol.udp_session import LOGGED_IN
 
 logging.basicConfig()
 moduleLogger = logging.getLogger('c2w.protocol.udp_chat_server_protocol')
@@ -18,6 +36,30 @@ moduleLogger = logging.getLogger('c2w.protocol.udp_chat_server_protocol')
 
 class c2wUdpChatServerProtocol(DatagramProtocol):
 
+    #: The smallest retransmission timeout (in seconds), see
+    #: :py:class:`~c2w.protocol.rto.c2wRtoEstimator`.
+    minRto = c2wRtoEstimator.minRto
+    #: Number of messages protected by one parity message for the clients
+    #: using forward error correction, see
+    #: :py:class:`~c2w.protocol.fec.c2wFecEncoder`.
+    fecGroupSize = 4
+    #: The largest datagram sent (header included): a longer message, e.g.
+    #: the users list with hundreds of users, is sent as segments which are
+    #: acknowledged and sent again one by one instead of being fragmented
+    #: by IP.
+    maxDatagramSize = 1400
+    #: The multicast group of the chat of the main room (see
+    #: :py:func:`~c2w.protocol.multicast.multicastGroupOf`), ``None`` to
+    #: send the chat by unicast only.  Only the clients which ask for it
+    #: receive the chat by multicast.
+    multicastChatGroup = None
+    #: Time (in seconds) the messages sent to a client wait for the next
+    #: ones to leave in the same datagram (see
+    #: :py:class:`~c2w.protocol.coalesce.c2wCoalescer`), ``None`` to send
+    #: one datagram per message.  The clients must split such datagrams
+    #: (:py:func:`functions.splitDatagram`).
+    coalesceWindow = None
+
     def __init__(self, serverProxy, lossPr):
         """
         :param serverProxy: The serverProxy, which the protocol must use
@@ -48,18 +90,20 @@ class c2wUdpChatServerProtocol(DatagramProtocol):
             to have a working and complete implementation of the c2w
             protocol.
         """
-        self.tasks = {}
         #: The serverProxy, which the protocol must use
         #: to interact with the server (to access the movie list and to 
         #: access and modify the user list).
         self.serverProxy = serverProxy
         self.lossPr = lossPr
-        #attribution des numéros de séquences (relatif binaire) pour l'interaction serveur <-> clients
-        self.sequenceNumber = 0
-        #alidate pour vérifier la réception d'ack (-1 pour éviter le conflit avec le typeofRequest==0) 
-        self.validateConnectionNumber = -1 
-        self.validateMovieListNumber = -1
-        self.sequenceNumberTreatedPerUser  = {}
+        #les sessions des clients (numéros de séquence, messages en attente d'ack...) avec leur (host, port) comme clé
+        self.sessions = {}
+        #un seul ordonnanceur pour les retransmissions de tous les clients
+        self.retransmitScheduler = c2wRetransmitScheduler()
+        #les sessions qui ont des mises à jour de la liste des utilisateurs à recevoir à la fin du lot de datagrammes
+        #en cours (None en dehors d'un lot, les mises à jour partent alors tout de suite)
+        self.usersListUpdates = None
+        #le chat envoyé en multicast, avec l'id de la room comme clé
+        self.multicastRooms = {}
 
     def startProtocol(self):
         """
@@ -74,164 +118,418 @@ class c2wUdpChatServerProtocol(DatagramProtocol):
 
         pass
 
+    #envoie un message à un client, dans le même datagramme que les suivants s'ils arrivent pendant la fenêtre de regroupement
+    def write(self, buff, host_port):
+        session = self.sessions.get(host_port)
+        if session is None or session.coalescer is None:
+            self.transport.write(buff, host_port)
+            return
+        session.coalescer.write(buff)
+
+    #Un datagramme doit être contigu : writeSequence assemble le header et les données partagées juste avant l'envoi
+    #(ou les ajoute au datagramme en cours de regroupement)
+    def writeSequence(self, buffSequence, host_port):
+        session = self.sessions.get(host_port)
+        if session is None or session.coalescer is None:
+            self.transport.write(b''.join(buffSequence), host_port)
+            return
+        session.coalescer.writeSequence(buffSequence)
+
+    #même chose que sendUntilAck pour un message diffusé : on ne garde que [header, données partagées]
+    #et le datagramme n'est assemblé qu'au moment de l'envoi
+    def sendSequenceUntilAck(self, buffSequence, typeNumber, sequenceNumber, session):
+        session.startRetransmission(sequenceNumber, typeNumber, self.writeSequence, buffSequence, session.hostPort)
+        session.sequenceNumber = (session.sequenceNumber + 1) % SEQUENCE_NUMBER_MODULO
+        if session.fecEncoder is not None:
+            session.fecEncoder.add(sequenceNumber, b''.join(buffSequence))
+
+    #les messages diffusés (listes des utilisateurs, mises à jour, chat) passent par la file du client : ils ne sont 
+    #envoyés que s'il y a de la place dans sa fenêtre de congestion, les autres attendent les acks.
+    #Un message trop long pour un datagramme est envoyé en segments (découpés une fois pour tous les destinataires),
+    #un message trop long pour 255 segments n'est pas envoyé (l'erreur est journalisée)
+    def sendBroadcast(self, broadcast, session):
+        try:
+            segments = broadcast.segments(self.maxDatagramSize)
+        except ValueError:
+            log.err(None, "message of type {0} not sent to {1}".format(broadcast.messageType, session))
+            return
+        session.queueBroadcast(segments)
+        self.sendQueued(session)
 
+    #envoie les messages de la file du client tant que sa fenêtre de congestion le permet, le numéro de séquence
+    #n'est donné qu'au moment de l'envoi
+    def sendQueued(self, session):
+        broadcast = session.nextBroadcast()
+        while broadcast is not None:
+            buffSequence = broadcast.prepareBuffSequence(session.sequenceNumber)
+            self.sendSequenceUntilAck(buffSequence, broadcast.messageType, session.sequenceNumber, session)
+            print("sending ", buffSequence, "to ", session.user.userName)
+            broadcast = session.nextBroadcast()
+
+    #renvoie la room multicast du chat d'une room, créée quand un premier client de cette room reçoit le chat en multicast
+    def multicastRoom(self, roomId):
+        room = self.multicastRooms.get(roomId)
+        if room is None:
+            address = (multicastGroupOf(self.multicastChatGroup, roomId), multicastPortOf(self.transport.getHost().port))
+            room = c2wMulticastRoom(lambda buff, address: self.transport.write(buff, address), roomId, address)
+            self.multicastRooms[roomId] = room
+        return room
+
+    #Un lot de datagrammes lus d'un coup sur la socket (voir c2wBatchUdpPort) : un datagramme reçu plusieurs fois
+    #d'un même client dans le lot (requête retransmise, ack en double) n'est traité qu'une fois, et les mises à jour 
+    #de la liste des utilisateurs du lot (par exemple les arrivées d'une vague de connexions) partent ensemble à la fin,
+    #en un seul message par client. Un datagramme qui lève une exception est journalisé et ne fait pas perdre
+    #le reste du lot
+    def datagramsReceived(self, datagrams):
+        self.usersListUpdates = {}
+        try:
+            received = set()
+            for datagram, host_port in datagrams:
+                if (datagram, host_port) in received:
+                    continue
+                received.add((datagram, host_port))
+                try:
+                    self.datagramReceived(datagram, host_port)
+                except Exception:
+                    log.err()
+        finally:
+            usersListUpdates = self.usersListUpdates
+            self.usersListUpdates = None
+            self.sendUsersListUpdates(usersListUpdates)
+
+    #envoie à chaque session ses mises à jour regroupées, encodées une seule fois pour les clients qui ont les mêmes.
+    #Celles d'un client qui n'a pas encore acquitté la liste ou la mise à jour précédente restent en attente
+    def sendUsersListUpdates(self, sessions):
+        broadcasts = {}
+        for session in sessions:
+            if session.usersListInTransit() and self.sessions.get(session.hostPort) is session:
+                continue
+            updates = tuple(session.pendingUpdates)
+            session.pendingUpdates = []
+            if not updates or self.sessions.get(session.hostPort) is not session:
+                continue
+            broadcast = broadcasts.get(updates)
+            if broadcast is None:
+                broadcast = broadcasts[updates] = c2wBroadcast(10, prepareBuffUsersListUpdate(updates))
+            print("sending users list update to ", session.user.userName)
+            self.sendBroadcast(broadcast, session)
         
         
     #Côté serveur tout dépend de la fonction datagramReceived car le serveur agit 
     #uniquement en fonction des données qu'il reçoit pour chaque client (host_port)
     def datagramReceived(self, datagram, host_port):
         
-        separatedDatagram = decodeBuffHeader(datagram)
+        #un datagramme qui contient plusieurs messages à la suite (voir c2wCoalescer) : chacun est traité comme s'il était
+        #reçu seul, avec son propre ack
+        messages = splitDatagram(datagram)
+        if len(messages) > 1:
+            for message in messages:
+                self.datagramReceived(message, host_port)
+            return
+        
+        decodedDatagram = decodeMessage(datagram)
         print("meesage receive from client :")
-        print(separatedDatagram)
+        print(decodedDatagram)
         
-        senderSequenceNumber = separatedDatagram[1]
-        typeOfRequest = separatedDatagram[2]
+        senderSequenceNumber = decodedDatagram.sequenceNumber
+        typeOfRequest = decodedDatagram.typeNumber
         
-
+        #la session du client est retrouvée directement grâce à son adresse, elle n'est créée qu'à la connexion.
+        #Un client qui utilise la correction d'erreurs (FEC) le dit dans sa requête de connexion : on l'utilise aussi
+        #pour lui dès maintenant, sa requête de connexion compte déjà dans ses groupes
+        session = self.sessions.get(host_port)
+        if session is None and typeOfRequest == 1:
+            session = c2wUdpSession(host_port, self.retransmitScheduler, c2wRtoEstimator(self.minRto))
+            self.sessions[host_port] = session
+            if self.coalesceWindow is not None:
+                session.startCoalescing(lambda buff: self.transport.write(buff, host_port), self.coalesceWindow,
+                                        self.maxDatagramSize)
+            if decodedDatagram.fecGroupSize:
+                session.startFec(lambda buff: self.write(buff, host_port), self.fecGroupSize)
         
         #fonction qui envoie chaque seconde un buffer jusqu'à reception d'un ack, 
-        #chaque fois le sequenceNumber est incrémenter 
-        def sendUntilAck(buff, sequenceNumber, host_port):
-            self.tasks[sequenceNumber] = task.LoopingCall(self.transport.write, buff, (host_port))
-            self.tasks[sequenceNumber].start(1.0)
-            self.sequenceNumber = self.sequenceNumber + 1
-            
-            
+        #chaque fois le sequenceNumber du client est incrémenté
+        def sendUntilAck(buff, typeNumber, sequenceNumber, session):
+            session.startRetransmission(sequenceNumber, typeNumber, self.write, buff, session.hostPort)
+            session.sequenceNumber = (session.sequenceNumber + 1) % SEQUENCE_NUMBER_MODULO
+            if session.fecEncoder is not None:
+                session.fecEncoder.add(sequenceNumber, buff)
+        
+        #fonction qui envoie la liste complète des utilisateurs à un seul utilisateur (à la connexion ou 
+        #quand le client demande une resynchronisation)
+        def sendUserList(session):
+                #la liste est encodée une seule fois et gardée tant qu'elle ne change pas
+                buffUsersList = self.serverProxy.getEncodedUserList(prepareBuffUsersList)
+                print("sending users list to ", session.user.userName)
+                self.sendBroadcast(c2wBroadcast(6, buffUsersList), session)
         
-        #fonction qui envoie la liste des utilisateurs (en l'actualisant) à chaque fois que 
-        #un d'eux rentre ou quitte une room 
-        def updateUserList():
+        #fonction qui envoie seulement la modification (type 10) à chaque fois qu'un utilisateur arrive, 
+        #change de room ou quitte le système : on n'envoie plus toute la liste à tout le monde.
+        #L'utilisateur modifié ne la reçoit que s'il a changé de room, un utilisateur en cours de connexion
+        #ne la reçoit pas (la liste complète qu'il recevra est à jour).
+        #Pendant un lot de datagrammes la modification est seulement ajoutée à celles que chaque client recevra à la fin du lot.
+        #Un client qui n'a pas encore acquitté la liste complète ou la mise à jour précédente la reçoit après cet ack :
+        #les mises à jour s'appliquent dans l'ordre à la liste qu'il a déjà
+        def updateUserList(action, changedUser):
                 usersList = self.serverProxy.getUserList()
-                print ("userList to send : ", usersList)
-                buffUsersList = prepareBuffUsersList(usersList)
+                print ("userList update to send : ", action, changedUser)
+                broadcast = c2wBroadcast(10, prepareBuffUsersListUpdate([(action, changedUser)]))
                 for user in usersList:
-                    buffHeader = prepareBuffHeader(6, buffUsersList, self.sequenceNumber)
-                    buff = prepareBuff(buffHeader, buffUsersList)
-                    sendUntilAck(buff, self.sequenceNumber, user.userAddress)
-                    print("sending users list : ", buff, "to ", user.userName)
+                    if user is changedUser and action != USER_MOVED:
+                        continue
+                    userSession = self.sessions[user.userAddress]
+                    if not userSession.isLoggedIn():
+                        continue
+                    if self.usersListUpdates is not None or userSession.usersListInTransit():
+                        userSession.pendingUpdates.append((action, changedUser))
+                        if self.usersListUpdates is not None:
+                            self.usersListUpdates[userSession] = None
+                        continue
+                    print("sending users list update to ", user.userName)
+                    self.sendBroadcast(broadcast, userSession)
         
         
-        #Si ce qu'on reçoit ce n'est pas un ack on renvoie un ack (juste un header) au client (data='')
+        #fonction qui traite une requête d'un client connecté (quitter le système, changer de room, 
+        #resynchroniser la liste des utilisateurs, envoyer un message), dans l'ordre de leurs numéros de séquence
+        def treatRequest(decodedDatagram, session):
+            typeOfRequest = decodedDatagram.typeNumber
+            
+            #un segment d'une requête découpée : la requête n'est traitée qu'une fois tous ses segments reçus
+            if typeOfRequest == SEGMENT_TYPE:
+                decodedDatagram = session.reassembler.add(decodedDatagram)
+                if decodedDatagram is None:
+                    return
+                typeOfRequest = decodedDatagram.typeNumber
+            
+            #Si le serveur reçoit une requête pour quitter la mainRoom, le nom de l'utilisateur est supprimer de l'userlist 
+            # la liste des utilisateurs est actualisé et la session du client est supprimée
+            if typeOfRequest == 2:
+                leavingUser = session.user
+                print("the username of the person who wants to leave :", leavingUser.userName)
+                print("userList : ", self.serverProxy.getUserList())
+                self.serverProxy.removeUser(leavingUser.userName)
+                session.close()
+                del self.sessions[session.hostPort]
+                updateUserList(USER_REMOVED, leavingUser)
+        
+            #Si le serveur reçoit une requête pour rentrer dans une movie room, on démarre automatiquement le film 
+            if typeOfRequest == 3:
+                movieTitle = decodedDatagram.text
+                self.serverProxy.startStreamingMovie(movieTitle)
+                movie = self.serverProxy.getMovieByTitle(movieTitle)
+                idMovie = movie.movieId
+                # On actualise alors la liste des utilisateurs dans la movie room et on l'envoie à tous les autres
+                userName = session.user.userName
+                self.serverProxy.updateUserChatroom(userName, str(idMovie))
+                #le chat de la nouvelle room lui est envoyé en unicast tant qu'il n'a pas rejoint son groupe multicast
+                session.multicastChat = False
+                updateUserList(USER_MOVED, session.user)
+                print("userList has been updated", self.serverProxy.getUserList())
+
+            #Si le serveur reçoit une requête pour sortir d'une une movie room,On actualise alors la liste des utilisateurs 
+            #ns la movie room et on l'envoie à tous les autres
+            if typeOfRequest == 4:
+                '''#we want to see if the user is the last one in the room
+                #userRoom = self.serverProxy.getUserByAddress(host_port).userChatRoom
+                #userList = self.serverProxy.getUserList()
+                #numberUserInMovieRoom = 0
+                #we go through the list of user top see if there is anybody left in the room
+                #for user in userList:
+                #   if user.userChatRoom == userRoom:
+                #       numberUserInMovieRoom += 1
+                #if there is just the user who wants to leave the room we stop streaming video
+                #if numberUserInMovieRoom == 1:
+                 #   self.serverProxy.stopStreamingMovie(self.serverProxy.getMovieById(userRoom).movieTitle)'''
+                userName = session.user.userName
+                self.serverProxy.updateUserChatroom(userName, ROOM_IDS.MAIN_ROOM)
+                session.multicastChat = False
+                updateUserList(USER_MOVED, session.user)
+                print("userList has been updated", self.serverProxy.getUserList())
+
+        
+            #Si le client demande une resynchronisation de la liste des utilisateurs on lui renvoie la liste complète
+            if typeOfRequest == 11:
+                sendUserList(session)
+
+            #Si le serveur reçoit une requête d'un client pour envoyer un message, le serveur envoie ce message à tout les autres utilisateurs
+            # où il est présent (if dans la videoRomm ou si mainRoom) et attend les ack
+            if typeOfRequest == 9:
+
+                userList = self.serverProxy.getUserList()
+                userName, message = decodedDatagram.chatMessage
+                senderRoom = session.user.userChatRoom
+                requestType = 9
+                broadcast = c2wBroadcast(requestType, prepareBuffChatMessage(userName, message))
+                multicast = False
+                for user in userList:
+                    if senderRoom == user.userChatRoom:
+                        userSession = self.sessions[user.userAddress]
+                        if not userSession.isLoggedIn():
+                            continue
+                        if userSession.multicastChat:
+                            multicast = True
+                            continue
+                        print("sending chat message to client : " , datagram)
+                        self.sendBroadcast(broadcast, userSession)
+                #les clients qui reçoivent le chat en multicast le reçoivent tous avec un seul envoi au groupe de la room
+                if multicast:
+                    print("sending chat message to the multicast group of the room : ", session.roomId())
+                    self.multicastRoom(session.roomId()).send(broadcast.buffData)
+
+            #Un client qui reçoit le chat de sa room en multicast a perdu des messages, ils lui sont renvoyés à lui seul,
+            #suivis du numéro du dernier message qu'il a reçu en unicast (il se synchronise dessus tant qu'il ne l'a pas reçu).
+            #Un client qui vient d'entrer dans la room reçoit encore le chat en unicast : sans numéro de séquence, on envoie
+            #le numéro du dernier message au groupe de la room ; quand le client renvoie ce numéro, il reçoit le groupe et
+            #le chat lui est envoyé en multicast à partir de maintenant
+            if typeOfRequest == MULTICAST_NACK_TYPE:
+                if self.multicastChatGroup is None or decodedDatagram.roomId != session.roomId():
+                    return
+                room = self.multicastRoom(decodedDatagram.roomId)
+                missing = decodedDatagram.missingSequenceNumbers
+                if not session.multicastChat:
+                    if not missing:
+                        room.sendHeartbeat()
+                        return
+                    if len(missing) != 1 or not room.hasSent(missing[0]):
+                        return
+                    print("multicast group confirmed by client : ", session.user.userName)
+                    session.multicastChat = True
+                    session.multicastSequenceNumber = room.sequenceNumber
+                    missing = []
+                for buff in room.repair(missing):
+                    self.write(buff, session.hostPort)
+                self.write(room.heartbeat(session.multicastSequenceNumber), session.hostPort)
+
+        #Un message de parité d'un client connecté qui a demandé la correction d'erreurs (FEC) à la connexion : si une seule
+        #requête de son groupe manque elle est reconstruite et traitée comme si elle était reçue
+        if typeOfRequest == FEC_PARITY_TYPE:
+            if session is None or session.user is None or session.fecDecoder is None:
+                return
+            rebuiltDatagram = session.fecDecoder.recover(decodedDatagram)
+            if rebuiltDatagram is not None:
+                print("request rebuilt from the parity : ", rebuiltDatagram)
+                self.datagramReceived(rebuiltDatagram, host_port)
+            return
+        
+        #Un ack ou une requête d'un client sans session (il a déjà quitté le système) n'est pas traité,
+        #on renvoie seulement l'ack d'une requête au cas où le premier aurait été perdu
+        if session is None:
+            if typeOfRequest != 0:
+                self.transport.write(prepareBuffHeader(0, "", senderSequenceNumber), (host_port))
+            return
+        
+        #Si ce qu'on reçoit ce n'est pas un ack on renvoie un ack (juste un header) au client (data=''),
+        #ou un ack cumulatif et sélectif un peu plus tard si le client les utilise
         if typeOfRequest != 0:   
-            buffHeader = prepareBuffHeader(0, "", senderSequenceNumber)
-            self.transport.write(buffHeader, (host_port))
-            print("sending ack to the client : ", buffHeader)
+            if session.fecDecoder is not None:
+                session.fecDecoder.add(senderSequenceNumber, datagram)
+            if session.ackTracker is not None:
+                session.ackTracker.received(senderSequenceNumber)
+            else:
+                buffHeader = prepareBuffHeader(0, "", senderSequenceNumber)
+                self.write(buffHeader, (host_port))
+                print("sending ack to the client : ", buffHeader)
             
-            #: On regarde ensuite si le numéro de séquence est dans la liste des numéros de séquence
-            #: déjà traité (dans le cas d'un ack perdu). Si c'est le cas on sort de la fonction sans traiter le message
+            #: Les requêtes d'un client connecté sont traitées dans l'ordre de leurs numéros de séquence : le client peut
+            #: en envoyer plusieurs sans attendre les acks, une requête arrivée trop tôt attend les précédentes et une
+            #: requête déjà traitée (dans le cas d'un ack perdu) est ignorée
             if typeOfRequest != 1:
-                senderName = self.serverProxy.getUserByAddress(host_port).userName
-                if senderSequenceNumber in  self.sequenceNumberTreatedPerUser[senderName]:
+                if session.user is None:
                     return
-             #: Sinon on va traiter le message donc on ajoute le numéro de séquence de l'envoyeur dans la liste des numéros de séquences traités.
-                else: 
-                    senderName = self.serverProxy.getUserByAddress(host_port).userName
-                    self.sequenceNumberTreatedPerUser[senderName].append(senderSequenceNumber)
+                for message in session.receiveInOrder(decodedDatagram):
+                    if self.sessions.get(host_port) is not session: #le client a quitté le système
+                        break
+                    treatRequest(message, session)
+                return
         
         
         #Si on reçoit un ack on stop le looping et on envoie le paquet
+        #(un ack en double est ignoré)
         if typeOfRequest == 0: 
-            self.tasks[senderSequenceNumber].stop()
+            #le client utilise les acks cumulatifs et sélectifs : on lui répond de la même façon
+            if decodedDatagram.lenPacket > HEADER_SIZE and session.ackTracker is None and session.user is not None:
+                session.startSelectiveAcks(lambda buff: self.write(buff, host_port))
+            acknowledged = session.acknowledge(decodedDatagram)
+            if not acknowledged:
+                return
+            #la fenêtre de congestion s'est agrandie : les messages en attente peuvent partir
+            self.sendQueued(session)
+            #les mises à jour de la liste des utilisateurs retenues jusqu'à l'ack de la liste ou de la mise à jour précédente
+            if session.pendingUpdates:
+                if self.usersListUpdates is not None:
+                    self.usersListUpdates[session] = None
+                else:
+                    self.sendUsersListUpdates([session])
+            
+            #l'ack d'une connexion refusée : le client n'a plus rien à attendre du serveur
+            if session.user is None:
+                if not session.inFlight:
+                    del self.sessions[host_port]
+                return
+            
+            if not session.loginStepAcknowledged(acknowledged):
+                return
             
-            if self.validateConnectionNumber == senderSequenceNumber:
+            if session.loginState == LOGIN_ACCEPTED:
                 #Si l'ack de connection est bien reçu on envoie la liste des films 
                 #que client (requestType=5) et on attend l'ack
-                movies = self.serverProxy.getMovieList()
-                buffMovieList = prepareBuffMovieList(movies)
-                buffHeader = prepareBuffHeader(5, buffMovieList, self.sequenceNumber)
-                buff = prepareBuff(buffHeader, buffMovieList)
-                print("sending movie list : ", buff, "to the client")
-                self.validateMovieListNumber = self.sequenceNumber
-                sendUntilAck(buff, self.sequenceNumber, host_port)
+                #la liste des films n'est encodée qu'une seule fois tant qu'elle ne change pas, seul le header est propre au client.
+                #Si elle est trop longue elle est envoyée en segments, la connexion continue quand tous sont acquittés
+                buffMovieList = self.serverProxy.getEncodedMovieList(prepareBuffMovieList)
+                try:
+                    segments = c2wBroadcast(5, buffMovieList).segments(self.maxDatagramSize)
+                except ValueError:
+                    log.err(None, "movie list not sent to {0}".format(session))
+                    return
+                session.loginState = MOVIE_LIST_SENT
+                session.loginSequenceNumbers = set()
+                for segment in segments:
+                    buffSequence = segment.prepareBuffSequence(session.sequenceNumber)
+                    print("sending movie list : ", buffSequence, "to the client")
+                    session.loginSequenceNumbers.add(session.sequenceNumber)
+                    self.sendSequenceUntilAck(buffSequence, 5, session.sequenceNumber, session)
                 
                 
             
             
-            #Si l'ack du client pour la liste des films est reçu on envoie alors la liste des utilisateurs est actualisé    
-            if self.validateMovieListNumber == senderSequenceNumber:
-               updateUserList()
+            #Si l'ack du client pour la liste des films est reçu on envoie alors la liste complète des utilisateurs au
+            #nouveau client, et seulement son arrivée aux autres. Il reçoit le chat tout de suite, les mises à jour de la
+            #liste seulement après l'ack de la liste complète
+            elif session.loginState == MOVIE_LIST_SENT:
+               session.loginState = LOGGED_IN
+               session.loginSequenceNumbers = set()
+               sendUserList(session)
+               updateUserList(USER_ADDED, session.user)
                 
             
         
         # Si le serveur reçoit une requête de login, on vérifie d'abord si l'userName est disponible, si c'est le cas 
-        # connection est autorisé et l'utilisateur est ajouter à l'userList et on instancie la liste des numéro de séquences traités liée à l'utilisateur
+        # connection est autorisé et l'utilisateur est ajouter à l'userList et à la session du client
         if typeOfRequest == 1:
-            userName = separatedDatagram[3]
+            userName = decodedDatagram.text
+            
+            #le client a déjà été accepté : c'est une retransmission de sa requête (notre ack a été perdu),
+            #l'ack a été renvoyé et l'acceptation est toujours retransmise
+            if session.user is not None:
+                pass
             
-            if self.serverProxy.userExists(userName): #Si l'userName est déjà utilisé la connection est refusé -> Message connection refused!
+            elif self.serverProxy.userExists(userName): #Si l'userName est déjà utilisé la connection est refusé -> Message connection refused!
                 buffHeader = prepareBuffHeader(8, "", senderSequenceNumber)
-                sendUntilAck(buffHeader, senderSequenceNumber, host_port) #attente de l'ack de l'utilisateur 
+                sendUntilAck(buffHeader, 8, senderSequenceNumber, session) #attente de l'ack de l'utilisateur 
                 print("sending conection refused to the client : ", buffHeader )
                 
             
             else:  # userName disponible -> connection autorisé 
                 buffHeader = prepareBuffHeader(7, "", senderSequenceNumber)
-                sendUntilAck(buffHeader, senderSequenceNumber, host_port)
+                sendUntilAck(buffHeader, 7, senderSequenceNumber, session)
                 print("sending conection accepted to the client : ", buffHeader )
-                self.validateConnectionNumber = senderSequenceNumber
+                session.loginState = LOGIN_ACCEPTED
+                session.loginSequenceNumbers = {senderSequenceNumber}
+                session.nextSequenceNumber = (senderSequenceNumber + 1) % SEQUENCE_NUMBER_MODULO
                 self.serverProxy.addUser(userName, ROOM_IDS.MAIN_ROOM, userChatInstance=None, userAddress=host_port)
-                self.sequenceNumberTreatedPerUser[userName] = []
+                session.user = self.serverProxy.getUserByName(userName)
                 
         
-        #Si le serveur reçoit une requête pour quitter la mainRoom, le nom de l'utilisateur est supprimer de l'userlist 
-        # la liste des utilisateurs est actualisé
-        if typeOfRequest == 2:
-            userName = separatedDatagram[3]
-            print("the username of the person who wants to leave :", userName)
-            print("userList : ", self.serverProxy.getUserList())
-            self.serverProxy.removeUser(userName)
-            updateUserList()
-        
-        #Si le serveur reçoit une requête pour rentrer dans une movie room, on démarre automatiquement le film 
-        if typeOfRequest == 3:
-            movieTitle = separatedDatagram[3]
-            self.serverProxy.startStreamingMovie(movieTitle)
-            movie = self.serverProxy.getMovieByTitle(movieTitle)
-            idMovie = movie.movieId
-            # On actualise alors la liste des utilisateurs dans la movie room et on l'envoie à tous les autres
-            userName = self.serverProxy.getUserByAddress(host_port).userName
-            self.serverProxy.updateUserChatroom(userName, str(idMovie))
-            updateUserList()
-            print("userList has been updated", self.serverProxy.getUserList())
-
-        #Si le serveur reçoit une requête pour sortir d'une une movie room,On actualise alors la liste des utilisateurs 
-        #ns la movie room et on l'envoie à tous les autres
-        if typeOfRequest == 4:
-            '''#we want to see if the user is the last one in the room
-            #userRoom = self.serverProxy.getUserByAddress(host_port).userChatRoom
-            #userList = self.serverProxy.getUserList()
-            #numberUserInMovieRoom = 0
-            #we go through the list of user top see if there is anybody left in the room
-            #for user in userList:
-            #   if user.userChatRoom == userRoom:
-            #       numberUserInMovieRoom += 1
-            #if there is just the user who wants to leave the room we stop streaming video
-            #if numberUserInMovieRoom == 1:
-             #   self.serverProxy.stopStreamingMovie(self.serverProxy.getMovieById(userRoom).movieTitle)'''
-            userName = self.serverProxy.getUserByAddress(host_port).userName
-            self.serverProxy.updateUserChatroom(userName, ROOM_IDS.MAIN_ROOM)
-            updateUserList()
-            print("userList has been updated", self.serverProxy.getUserList())
-
-        
-        #Si le serveur reçoit une requête d'un client pour envoyer un message, le serveur envoie ce message à tout les autres utilisateurs
-        # où il est présent (if dans la videoRomm ou si mainRoom) et attend les ack
-        if typeOfRequest == 9:
-
-            userList = self.serverProxy.getUserList()
-            userName, message = decodeBuffChatMessage(datagram)
-            senderRoom = self.serverProxy.getUserByName(userName).userChatRoom
-            buffPacket = prepareBuffChatMessage(userName, message)
-            requestType = 9
-            for user in userList:
-                if senderRoom == user.userChatRoom:
-                    buffHeader = prepareBuffHeader(requestType, buffPacket, self.sequenceNumber)
-                    buff = prepareBuff(buffHeader, buffPacket)
-                    sendUntilAck(buff, self.sequenceNumber, user.userAddress)
-                    print("sending chat message to client : " , datagram)
-                    
-        
         """
         :param string datagram: the payload of the UDP packet.
         :param host_port: a touple containing the source IP address and port.
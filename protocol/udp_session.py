@@ -0,0 +1,301 @@
+# -*- coding: utf-8 -*-
+import collections
+from functions import SEQUENCE_NUMBER_MODULO
+from c2w.main.constants import ROOM_IDS
+from c2w.protocol.ack import c2wAckTracker
+from c2w.protocol.congestion import c2wCongestionWindow
+from c2w.protocol.fec import c2wFecEncoder
+from c2w.protocol.fec import c2wFecDecoder
+from c2w.protocol.segmentation import c2wReassembler
+from c2w.protocol.coalesce import c2wCoalescer
+from c2w.protocol.outbox import USERS_LIST_TYPE
+from c2w.protocol.outbox import USERS_LIST_UPDATE_TYPE
+
+#étapes de la connexion d'un client : acceptation envoyée, liste des films envoyée, liste des utilisateurs envoyée
+LOGIN_ACCEPTED = 1
+MOVIE_LIST_SENT = 2
+LOGGED_IN = 3
+
+#nombre de requêtes d'un client qui peuvent attendre les précédentes (au moins la fenêtre d'envoi des clients)
+RECEIVE_WINDOW = 64
+
+
+class c2wUdpSession(object):
+
+    def __init__(self, hostPort, retransmitScheduler, rtoEstimator):
+        """
+        :param hostPort: The (IP address, port number) of the client.
+        :param retransmitScheduler: The
+            :py:class:`~c2w.protocol.retransmit.c2wRetransmitScheduler` of
+            the server, the messages of the session are scheduled with
+            (hostPort, sequence number) as key.
+        :param rtoEstimator: The
+            :py:class:`~c2w.protocol.rto.c2wRtoEstimator` of this client,
+            giving the retransmission timeout of its messages.
+
+        Everything the UDP server keeps for one client.  The sessions are
+        stored in a dictionary with the (host, port) of the client as key,
+        so the client of a datagram is found in O(1).
+
+        .. attribute:: user
+
+            The corresponding user (instance of
+            :py:class:`~c2w.main.user.c2wUser`), ``None`` until the login is
+            accepted.
+
+        .. attribute:: sequenceNumber
+
+            The sequence number of the next message sent to this client.
+
+        .. attribute:: inFlight
+
+            The messages sent to this client and not acknowledged yet: their
+            type with their sequence number as key.
+
+        .. attribute:: sendQueue
+
+            The broadcast messages (instances of
+            :py:class:`functions.c2wBroadcast`) waiting for a place in the
+            congestion window, in order.  They get their sequence number
+            when they are sent.  A message too long for one datagram is
+            queued as its segments.
+
+        .. attribute:: congestionWindow
+
+            The :py:class:`~c2w.protocol.congestion.c2wCongestionWindow`
+            limiting the number of messages in :py:attr:`inFlight`.
+
+        .. attribute:: pendingUpdates
+
+            The changes of the users list, (action, user), which this client
+            receives together at the end of the batch of datagrams being
+            treated (see
+            :py:meth:`~c2w.protocol.udp_chat_server.c2wUdpChatServerProtocol.datagramsReceived`),
+            or once the users list or update sent before is acknowledged
+            (see :py:meth:`usersListInTransit`).
+
+        .. attribute:: nextSequenceNumber
+
+            The sequence number of the next request of this client to treat
+            (the one following its login), ``None`` until the login is
+            accepted.  The client may send several requests without waiting
+            for their ACKs, they are treated in the order of their sequence
+            numbers.
+
+        .. attribute:: heldRequests
+
+            The requests (decoded messages) received before the previous
+            ones, with their sequence number as key.
+
+        .. attribute:: ackTracker
+
+            The :py:class:`~c2w.protocol.ack.c2wAckTracker` acknowledging
+            the requests of this client with cumulative and selective ACKs,
+            ``None`` (one ACK per request) until the client sends such an
+            ACK itself.
+
+        .. attribute:: fecEncoder
+
+            The :py:class:`~c2w.protocol.fec.c2wFecEncoder` sending parity
+            messages for the messages sent to this client, and the
+            :py:class:`~c2w.protocol.fec.c2wFecDecoder` (``fecDecoder``)
+            rebuilding its lost requests.  ``None`` until the client sends
+            a parity message itself.
+
+        .. attribute:: reassembler
+
+            The :py:class:`~c2w.protocol.segmentation.c2wReassembler`
+            rebuilding the requests which this client has split into
+            segments.
+
+        .. attribute:: multicastChat
+
+            True when this client receives the chat of its room by
+            multicast (it has sent back the sequence number of a heartbeat
+            of the group of the room, see
+            :py:class:`~c2w.protocol.multicast.c2wMulticastRoom`), the
+            chat messages are then not sent to it by unicast.
+
+        .. attribute:: multicastSequenceNumber
+
+            The sequence number of the last message of the room sent to the
+            group before :py:attr:`multicastChat` (the client has received
+            it by unicast), ``None`` before.
+
+        .. attribute:: coalescer
+
+            The :py:class:`~c2w.protocol.coalesce.c2wCoalescer` packing the
+            messages sent to this client within a short window into one
+            datagram, ``None`` (one datagram per message) unless the server
+            has a coalescing window.
+
+        .. attribute:: loginState
+
+            Where the client is in the login (``None``,
+            :py:data:`LOGIN_ACCEPTED`, :py:data:`MOVIE_LIST_SENT` or
+            :py:data:`LOGGED_IN`).  Each client goes through the login on
+            its own, whatever the number of logins in progress.
+
+        .. attribute:: loginSequenceNumbers
+
+            The sequence numbers of the message (acceptance or movie list)
+            whose ACK moves the login to the next step: one, or one per
+            segment if the message was split.
+        """
+        self.hostPort = hostPort
+        self.user = None
+        self.sequenceNumber = 0
+        self.retransmitScheduler = retransmitScheduler
+        self.rtoEstimator = rtoEstimator
+        self.inFlight = {}
+        self.sendQueue = collections.deque()
+        self.congestionWindow = c2wCongestionWindow()
+        self.pendingUpdates = []
+        self.nextSequenceNumber = None
+        self.heldRequests = {}
+        self.ackTracker = None
+        self.fecEncoder = None
+        self.fecDecoder = None
+        self.reassembler = c2wReassembler()
+        self.multicastChat = False
+        self.multicastSequenceNumber = None
+        self.coalescer = None
+        self.loginState = None
+        self.loginSequenceNumbers = set()
+
+    def __repr__(self):
+        return '<c2wUdpSession hostPort={0}, user={1}>'.format(
+            self.hostPort, self.user.userName if self.user else None)
+
+    #True quand la liste des utilisateurs a été envoyée au client : il peut recevoir les messages, et les mises à jour
+    #de la liste après l'ack de la liste (voir usersListInTransit)
+    def isLoggedIn(self):
+        return self.loginState == LOGGED_IN
+
+    #l'id de la room du client : 0 pour la main room, l'id du film sinon
+    def roomId(self):
+        if self.user.userChatRoom == ROOM_IDS.MAIN_ROOM:
+            return 0
+        return int(self.user.userChatRoom)
+
+    #envoie un message maintenant puis à chaque timeout (doublé à chaque envoi) jusqu'à la réception de son ack
+    def startRetransmission(self, sequenceNumber, typeNumber, function, *args):
+        self.retransmitScheduler.start((self.hostPort, sequenceNumber), self.rtoEstimator.timeout(), function, *args,
+                                       backoff=self.retransmissionTimedOut)
+        self.inFlight[sequenceNumber] = typeNumber
+
+    #un message est renvoyé faute d'ack : la fenêtre de congestion diminue et le timeout suivant est doublé
+    def retransmissionTimedOut(self, entry):
+        self.congestionWindow.timedOut(entry, self.retransmitScheduler.now())
+        return self.rtoEstimator.backoff(entry, self.retransmitScheduler.now())
+
+    #arrête la retransmission d'un message, renvoie son entrée (None si ce message n'était pas en attente)
+    def stopRetransmission(self, sequenceNumber):
+        if self.inFlight.pop(sequenceNumber, None) is None:
+            return None
+        return self.retransmitScheduler.stop((self.hostPort, sequenceNumber))
+
+    #arrête toutes les retransmissions vers ce client (il a quitté le système)
+    def stopAllRetransmissions(self):
+        for sequenceNumber in self.inFlight:
+            self.retransmitScheduler.stop((self.hostPort, sequenceNumber))
+        self.inFlight.clear()
+
+    #le client quitte le système : plus de retransmission, l'ack en attente (celui de son départ) part tout de suite
+    def close(self):
+        self.stopAllRetransmissions()
+        self.sendQueue.clear()
+        if self.ackTracker is not None:
+            self.ackTracker.flush()
+        if self.fecEncoder is not None:
+            self.fecEncoder.cancel()
+        if self.coalescer is not None:
+            self.coalescer.flush()
+
+    #arrête la retransmission des messages acquittés par un ack (simple ou cumulatif et sélectif), renvoie leurs numéros de séquence.
+    #Le temps d'aller-retour met à jour le timeout et chaque message acquitté agrandit la fenêtre de congestion
+    def acknowledge(self, decodedAck):
+        acknowledged = decodedAck.acknowledgedAmong(self.inFlight)
+        now = self.retransmitScheduler.now()
+        for sequenceNumber in acknowledged:
+            entry = self.stopRetransmission(sequenceNumber)
+            self.rtoEstimator.acknowledged(entry, now)
+            self.congestionWindow.acknowledged(entry)
+        return acknowledged
+
+    #met un message diffusé (liste des utilisateurs, mise à jour de la liste, message du chat) dans la file du client,
+    #segments est la liste de ses segments (lui-même s'il n'est pas découpé).
+    #Une liste complète des utilisateurs remplace les listes et les mises à jour pas encore acquittées
+    def queueBroadcast(self, segments):
+        if segments[0].messageType == USERS_LIST_TYPE:
+            self.dropSuperseded()
+        self.sendQueue.extend(segments)
+
+    #oublie les listes des utilisateurs et les mises à jour en attente ou envoyées et pas encore acquittées (elles sont périmées)
+    def dropSuperseded(self):
+        self.pendingUpdates = []
+        superseded = (USERS_LIST_TYPE, USERS_LIST_UPDATE_TYPE)
+        self.sendQueue = collections.deque(broadcast for broadcast in self.sendQueue
+                                           if broadcast.messageType not in superseded)
+        for sequenceNumber, typeNumber in list(self.inFlight.items()):
+            if typeNumber in superseded:
+                self.stopRetransmission(sequenceNumber)
+
+    #True tant qu'une liste des utilisateurs ou une mise à jour de la liste envoyée à ce client attend son ack ou sa place
+    #dans la file : les mises à jour suivantes sont retenues dans pendingUpdates jusqu'à son ack, le client les reçoit
+    #donc après la liste complète et dans l'ordre
+    def usersListInTransit(self):
+        usersListTypes = (USERS_LIST_TYPE, USERS_LIST_UPDATE_TYPE)
+        if any(typeNumber in usersListTypes for typeNumber in self.inFlight.values()):
+            return True
+        return any(broadcast.messageType in usersListTypes for broadcast in self.sendQueue)
+
+    #True quand l'ack reçu termine l'étape de la connexion en cours : il acquitte le message (acceptation ou liste des films)
+    #ou le dernier de ses segments qui n'était pas encore acquitté
+    def loginStepAcknowledged(self, acknowledged):
+        if self.loginSequenceNumbers.isdisjoint(acknowledged):
+            return False
+        return self.loginSequenceNumbers.isdisjoint(self.inFlight)
+
+    #renvoie le prochain message de la file s'il y a de la place dans la fenêtre de congestion, None sinon.
+    #Son numéro de séquence reste aussi à moins de c2wAckTracker.windowSize du plus ancien message pas encore acquitté
+    #(inFlight est dans l'ordre d'envoi) : au-delà, un client qui utilise les acks cumulatifs et sélectifs considère
+    #le plus ancien comme abandonné et l'acquitte sans l'avoir reçu
+    def nextBroadcast(self):
+        if not self.sendQueue or not self.congestionWindow.canSend(len(self.inFlight)):
+            return None
+        for oldestSequenceNumber in self.inFlight:
+            if (self.sequenceNumber - oldestSequenceNumber) % SEQUENCE_NUMBER_MODULO >= c2wAckTracker.windowSize:
+                return None
+            break
+        return self.sendQueue.popleft()
+
+    #le client envoie des acks cumulatifs et sélectifs : ses requêtes sont acquittées de la même façon à partir de maintenant,
+    #en reprenant les requêtes déjà reçues (elles ont déjà eu leur ack simple)
+    def startSelectiveAcks(self, write):
+        self.ackTracker = c2wAckTracker(write, (self.nextSequenceNumber - 1) % SEQUENCE_NUMBER_MODULO)
+        for sequenceNumber in self.heldRequests:
+            self.ackTracker.bitmap |= 1 << ((sequenceNumber - self.nextSequenceNumber) % SEQUENCE_NUMBER_MODULO)
+
+    #les messages envoyés au client pendant window secondes partent ensemble dans un seul datagramme
+    def startCoalescing(self, write, window, maxDatagramSize):
+        self.coalescer = c2wCoalescer(write, window, maxDatagramSize)
+
+    #le client utilise la correction d'erreurs (FEC) : ses messages sont gardés pour reconstruire une requête perdue 
+    #et une parité est envoyée après chaque groupe de groupSize messages
+    def startFec(self, write, groupSize):
+        self.fecEncoder = c2wFecEncoder(write, groupSize)
+        self.fecDecoder = c2wFecDecoder()
+
+    #renvoie, dans l'ordre, les requêtes du client à traiter maintenant qu'une requête est reçue : aucune si elle arrive
+    #avant une requête perdue (elle est gardée) ou si elle a déjà été traitée (son ack a été perdu)
+    def receiveInOrder(self, decodedMessage):
+        offset = (decodedMessage.sequenceNumber - self.nextSequenceNumber) % SEQUENCE_NUMBER_MODULO
+        if offset >= RECEIVE_WINDOW:
+            return []
+        self.heldRequests[decodedMessage.sequenceNumber] = decodedMessage
+        requests = []
+        while self.nextSequenceNumber in self.heldRequests:
+            requests.append(self.heldRequests.pop(self.nextSequenceNumber))
+            self.nextSequenceNumber = (self.nextSequenceNumber + 1) % SEQUENCE_NUMBER_MODULO
+        return requests
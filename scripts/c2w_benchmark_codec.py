@@ -0,0 +1,228 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Micro-benchmarks for the c2w wire codec (scripts/functions.py).
+
+Every encoder/decoder is run over a range of payload sizes.  The results
+(throughput and allocations per call) are printed as JSON and can be saved
+and compared against a stored baseline:
+
+    python3 c2w_benchmark_codec.py --save baseline.json
+    python3 c2w_benchmark_codec.py --baseline baseline.json --max-regression 0.1
+"""
+
+import argparse
+import contextlib
+import json
+import sys
+import time
+import timeit
+import tracemalloc
+
+# Set path and import the codec (set_path prints, keep stdout for the JSON
+# report)
+from set_path import set_path
+with contextlib.redirect_stdout(sys.stderr):
+    set_path()
+from c2w.main.movie import c2wMovie
+from c2w.main.user import c2wUser
+from c2w.main.constants import ROOM_IDS
+import functions
+
+USERS_SIZES = [1, 10, 100, 1000, 10000, 100000]
+MOVIES_SIZES = [1, 16, 64, 255]
+# the chat frame is limited by the 16 bit length field of the header
+CHAT_SIZES = [1, 64, 1024, 16384, 65535 - 4 - 1 - len('bob')]
+HEADER_SIZES = [0, 64, 1024, 65535 - 4]
+
+
+def makeMovies(n):
+    return [c2wMovie('Movie number {0}'.format(i), '224.1.1.{0}'.format(i % 256),
+                     1024 + i, movieId=i + 1) for i in range(n)]
+
+
+def makeUsers(n):
+    users = []
+    for i in range(n):
+        if i % 3:
+            room = ROOM_IDS.MAIN_ROOM
+        else:
+            room = str(i % 255 + 1)
+        users.append(c2wUser('user{0}'.format(i), room))
+    return users
+
+
+def withHeader(buffData):
+    # the decodeBuff* functions expect a complete packet, header included
+    return b'\x00\x00\x00\x00' + buffData
+
+
+def prepareBuffUsersListCold(users):
+    """
+    Encodes the users list as for users never encoded before: the entries
+    kept in ``user.userEncodedEntry`` by the previous call are cleared
+    first (clearing them costs a small part of the encoding).
+    """
+    for user in users:
+        user.userEncodedEntry = None
+    return functions.prepareBuffUsersList(users)
+
+
+def buildCases():
+    """
+    Returns a list of (name, size, function, args, nbytes) tuples, one per
+    benchmark.
+    """
+    cases = []
+    for size in HEADER_SIZES:
+        buffData = b'x' * size
+        packet = functions.prepareBuffHeader(9, buffData, 1) + buffData
+        cases.append(('prepareBuffHeader', size, functions.prepareBuffHeader,
+                      (9, buffData, 1), len(packet)))
+        cases.append(('decodeBuffHeader', size, functions.decodeBuffHeader,
+                      (packet,), len(packet)))
+    for size in MOVIES_SIZES:
+        movies = makeMovies(size)
+        buff = functions.prepareBuffMovieList(movies)
+        cases.append(('prepareBuffMovieList', size,
+                      functions.prepareBuffMovieList, (movies,), len(buff)))
+        cases.append(('decodeBuffMovieList', size,
+                      functions.decodeBuffMovieList, (withHeader(buff),),
+                      len(buff)))
+    for size in USERS_SIZES:
+        users = makeUsers(size)
+        buff = functions.prepareBuffUsersList(users)
+        cases.append(('prepareBuffUsersList', size,
+                      prepareBuffUsersListCold, (users,), len(buff)))
+        # the same users again: their entries are kept from the previous call
+        cases.append(('prepareBuffUsersListCached', size,
+                      functions.prepareBuffUsersList, (users,), len(buff)))
+        cases.append(('decodeBuffUsersList', size,
+                      functions.decodeBuffUsersList, (withHeader(buff),),
+                      len(buff)))
+    for size in CHAT_SIZES:
+        message = 'm' * size
+        buff = functions.prepareBuffChatMessage('bob', message)
+        cases.append(('prepareBuffChatMessage', size,
+                      functions.prepareBuffChatMessage, ('bob', message),
+                      len(buff)))
+        cases.append(('decodeBuffChatMessage', size,
+                      functions.decodeBuffChatMessage, (withHeader(buff),),
+                      len(buff)))
+    return cases
+
+
+def measureTime(function, args, minTime):
+    """
+    Runs the function until at least minTime seconds have been spent and
+    returns the best time per call (in seconds).
+    """
+    timer = timeit.Timer(lambda: function(*args))
+    number, _ = timer.autorange()
+    number = max(1, int(number * minTime / 0.2))
+    best = min(timer.repeat(repeat=3, number=number))
+    return best / number, number
+
+
+def measureAllocations(function, args):
+    """
+    Returns the peak number of bytes allocated by one call and the number
+    of memory blocks still allocated afterwards (the result included).
+    """
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    before, _ = tracemalloc.get_traced_memory()
+    blocksBefore = sys.getallocatedblocks()
+    result = function(*args)
+    blocksAfter = sys.getallocatedblocks()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+    return peak - before, blocksAfter - blocksBefore
+
+
+def runBenchmarks(minTime, only=None):
+    results = []
+    for name, size, function, args, nbytes in buildCases():
+        if only and name not in only:
+            continue
+        perCall, number = measureTime(function, args, minTime)
+        peakBytes, blocks = measureAllocations(function, args)
+        results.append({
+            'name': name,
+            'size': size,
+            'bytes': nbytes,
+            'calls': number,
+            'secondsPerCall': perCall,
+            'callsPerSecond': 1.0 / perCall if perCall else None,
+            'megabytesPerSecond': nbytes / perCall / 1e6 if perCall else None,
+            'peakAllocatedBytes': peakBytes,
+            'allocatedBlocks': blocks,
+        })
+    return results
+
+
+def compareWithBaseline(results, baseline, maxRegression):
+    """
+    Adds the ratio current/baseline time to each result and returns the
+    list of the benchmarks slower than the baseline by more than
+    maxRegression (a fraction, e.g. 0.1 for 10%).
+    """
+    reference = dict(((r['name'], r['size']), r) for r in baseline['results'])
+    regressions = []
+    for r in results:
+        old = reference.get((r['name'], r['size']))
+        if old is None:
+            continue
+        r['baselineSecondsPerCall'] = old['secondsPerCall']
+        r['ratio'] = r['secondsPerCall'] / old['secondsPerCall']
+        if r['ratio'] > 1.0 + maxRegression:
+            regressions.append(r)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='c2w codec micro-benchmarks')
+    parser.add_argument('--min-time', dest='minTime', type=float, default=0.2,
+                        help='Minimum time (in seconds) spent measuring ' +
+                        'each benchmark.')
+    parser.add_argument('--only', dest='only', action='append',
+                        help='Only run the benchmarks of this function ' +
+                        '(can be given several times).')
+    parser.add_argument('--save', dest='save',
+                        help='Save the results (JSON) in this file.')
+    parser.add_argument('--baseline', dest='baseline',
+                        help='Compare the results with this JSON file.')
+    parser.add_argument('--max-regression', dest='maxRegression',
+                        type=float, default=0.1,
+                        help='With --baseline, exit with an error if a ' +
+                        'benchmark is slower than the baseline by more ' +
+                        'than this fraction.')
+    options = parser.parse_args()
+
+    report = {
+        'python': sys.version,
+        'timestamp': time.time(),
+        'results': runBenchmarks(options.minTime, options.only),
+    }
+    regressions = []
+    if options.baseline:
+        with open(options.baseline) as baselineFile:
+            baseline = json.load(baselineFile)
+        regressions = compareWithBaseline(report['results'], baseline,
+                                          options.maxRegression)
+        report['regressions'] = [(r['name'], r['size'], r['ratio'])
+                                 for r in regressions]
+
+    output = json.dumps(report, indent=2)
+    if options.save:
+        with open(options.save, 'w') as saveFile:
+            saveFile.write(output)
+    print(output)
+    if regressions:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Login benchmark for the UDP server (protocol/udp_chat_server.py).
+
+Simulated clients log in by waves of --concurrency clients whose logins
+are all in progress at the same time (their datagrams are interleaved,
+like after a restart of the server when every client reconnects).  Each
+client acknowledges every message it receives.  The sustained number of
+logins per second is printed as JSON, overall and for the last wave (with
+the largest user list), after checking that every client got its own
+acceptance, movie list and user list:
+
+    python3 c2w_benchmark_logins.py --users 1000 --concurrency 100
+
+With --batch, the datagrams of each round are handed to the server
+together, as c2wBatchUdpPort does with the datagrams waiting in its
+socket.
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import sys
+import time
+
+# Set path and import the server (set_path prints, keep stdout for the JSON
+# report)
+from set_path import set_path
+with contextlib.redirect_stdout(sys.stderr):
+    set_path()
+from twisted.internet import reactor
+from twisted.test import proto_helpers
+from c2w.main.server_model import c2wServerModel
+from c2w.main.server_proxy import c2wServerProxy
+from c2w.protocol.udp_chat_server import c2wUdpChatServerProtocol
+import functions
+
+
+class c2wNeverCalled(object):
+    """
+    No datagram is lost in the benchmark, so the retransmissions are never
+    due: they are not scheduled at all, the time spent arming and
+    cancelling them is then only the protocol's (the task.Clock of the
+    tests sorts all its calls each time one is added).  The call stays
+    pending until it is cancelled, like a reactor call.
+    """
+
+    def __init__(self):
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+    def active(self):
+        return not self.cancelled
+
+
+def neverCall(delay, function, *args, **kw):
+    return c2wNeverCalled()
+
+
+reactor.callLater = neverCall
+
+
+def makeServer():
+    serverProxy = c2wServerProxy(c2wServerModel())
+    serverProxy.initMovieStore(False, True)
+    serverProxy.removeAllMovies()
+    serverProxy.addMovie('3 Days to Kill', '128.12.12.12', 20000, '', 3)
+    transport = proto_helpers.FakeDatagramTransport()
+    protocol = c2wUdpChatServerProtocol(serverProxy, 0)
+    protocol.makeConnection(transport)
+    return protocol, transport
+
+
+def clientAddress(i):
+    return ('10.{0}.{1}.{2}'.format(i >> 16 & 255, i >> 8 & 255, i & 255),
+            1024 + i % 50000)
+
+
+def deliver(protocol, datagrams, batch):
+    """
+    Hands the (datagram, address) to the server, as one batch or one by
+    one.
+    """
+    if batch:
+        protocol.datagramsReceived(datagrams)
+        return
+    for datagram, address in datagrams:
+        protocol.datagramReceived(datagram, address)
+
+
+def runWave(protocol, transport, first, count, received, batch=False):
+    """
+    Logs in the clients first..first+count-1 at the same time and acks
+    every message until the server has nothing more to send.
+    """
+    logins = []
+    for i in range(first, first + count):
+        userName = 'user{0}'.format(i).encode('utf-8')
+        # a datagram read from the socket is bytes
+        logins.append((bytes(functions.prepareBuffPacket(1, userName, 0)),
+                       clientAddress(i)))
+    deliver(protocol, logins, batch)
+    while transport.written:
+        written = transport.written
+        transport.written = []
+        acks = []
+        for datagram, address in written:
+            message = functions.decodeMessage(datagram)
+            if message.typeNumber == 0:
+                continue
+            typeNumber = message.typeNumber
+            if typeNumber == functions.SEGMENT_TYPE:
+                # a long user list is sent as segments: count the message once
+                typeNumber, index, count = message.segmentHeader
+                if index != 0:
+                    typeNumber = None
+            if typeNumber is not None:
+                received.setdefault(address, []).append(typeNumber)
+            ack = functions.prepareBuffHeader(0, '', message.sequenceNumber)
+            acks.append((ack, address))
+        deliver(protocol, acks, batch)
+
+
+def checkLogins(protocol, received, users):
+    """
+    Returns the number of clients which did not get exactly one
+    acceptance, one movie list and one user list, in this order.
+    """
+    errors = 0
+    for i in range(users):
+        types = [t for t in received.get(clientAddress(i), []) if t != 10]
+        if types[:3] != [7, 5, 6] or 7 in types[3:] or 6 in types[3:]:
+            errors += 1
+    if len(protocol.serverProxy.getUserList()) != users:
+        errors += 1
+    return errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description='c2w UDP login benchmark')
+    parser.add_argument('--users', dest='users', type=int, default=500,
+                        help='Total number of clients logging in.')
+    parser.add_argument('--concurrency', dest='concurrency', type=int,
+                        default=100,
+                        help='Number of logins in progress at the same time.')
+    parser.add_argument('--batch', dest='batch', action='store_true',
+                        default=False,
+                        help='Hand the datagrams of each round to the ' +
+                        'server as one batch.')
+    parser.add_argument('--save', dest='save',
+                        help='Save the results (JSON) in this file.')
+    options = parser.parse_args()
+
+    protocol, transport = makeServer()
+    received = {}
+    waves = []
+    # the protocol prints every message, which would be most of the time
+    with contextlib.redirect_stdout(io.StringIO()):
+        start = time.perf_counter()
+        for first in range(0, options.users, options.concurrency):
+            count = min(options.concurrency, options.users - first)
+            waveStart = time.perf_counter()
+            runWave(protocol, transport, first, count, received,
+                    options.batch)
+            waves.append((count, time.perf_counter() - waveStart))
+        elapsed = time.perf_counter() - start
+
+    lastCount, lastElapsed = waves[-1]
+    report = {
+        'python': sys.version,
+        'timestamp': time.time(),
+        'users': options.users,
+        'concurrency': options.concurrency,
+        'batch': options.batch,
+        'seconds': elapsed,
+        'loginsPerSecond': options.users / elapsed,
+        'lastWaveLoginsPerSecond': lastCount / lastElapsed,
+        'errors': checkLogins(protocol, received, options.users),
+    }
+    output = json.dumps(report, indent=2)
+    if options.save:
+        with open(options.save, 'w') as saveFile:
+            saveFile.write(output)
+    print(output)
+    if report['errors']:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -19,11 +19,18 @@ parser.add_argument('-e', '--debug',
                     help='Raise the log level to debug',
                     action="store_true",
                     default=False)
+parser.add_argument('-r', '--reliable',
+                    dest='reliableFlag',
+                    help='Rely on TCP to deliver the messages: they are ' +
+                    'sent once, without retransmission timer.',
+                    action="store_true",
+                    default=False)
 
 options = parser.parse_args()
 
 # Call start function
 C2wStart(protocol,
          options.debugFlag, 
-         0)
+         0,
+         options.reliableFlag)
 
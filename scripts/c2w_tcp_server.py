@@ -33,6 +33,13 @@ parser.add_argument('-e', '--debug',
                     help='Raise the log level to debug',
                     action="store_true",
                     default=False)
+parser.add_argument('-r', '--reliable',
+                    dest='reliableFlag',
+                    help='Rely on TCP to deliver the messages: they are ' +
+                    'sent once, without retransmission timer (the clients ' +
+                    'do not need to use this option).',
+                    action="store_true",
+                    default=False)
 
 options = parser.parse_args()
 
@@ -43,4 +50,5 @@ C2wStart(protocol,
          options.noVideoFlag,
          options.streamVideoFlag,
          options.debugFlag, 
-         0)
+         0,
+         options.reliableFlag)
@@ -9,6 +9,10 @@ import os
 from set_path import set_path
 set_path()
 from  c2w.main.c2w_client import C2wStart
+from c2w.protocol.multicast import MULTICAST_CHAT_GROUP
+from c2w.protocol.udp_session import RECEIVE_WINDOW
+from functions import MIN_DATAGRAM_SIZE
+from functions import MAX_DATAGRAM_SIZE
 
 # Settings
 protocol = 'UDP'
@@ -22,12 +26,58 @@ parser.add_argument('-e', '--debug',
 parser.add_argument('-l', '--loss-pr', dest='lossPr',
                     help='The packet loss probability for outgoing ' +
                     'packets.', type=float, default=0)
+parser.add_argument('-m', '--min-rto', dest='minRto',
+                    help='The smallest retransmission timeout (in seconds), ' +
+                    'the timeout follows the measured round-trip time above ' +
+                    'it.', type=float, default=None)
+parser.add_argument('-w', '--send-window', dest='sendWindow',
+                    help='The maximum number of messages sent to the ' +
+                    'server and waiting for their ACK (at most ' +
+                    str(RECEIVE_WINDOW) + ').', type=int, default=None)
+parser.add_argument('-a', '--selective-acks', dest='selectiveAcksFlag',
+                    help='Acknowledge several messages of the server at ' +
+                    'once with cumulative and selective ACKs (the server ' +
+                    'must support them).',
+                    action="store_true", default=False)
+parser.add_argument('-f', '--fec-group-size', dest='fecGroupSize',
+                    help='Send a parity message after every group of this ' +
+                    'number of messages, so that one lost message per ' +
+                    'group is rebuilt without retransmission (the server ' +
+                    'then does the same, it must support it).', type=int,
+                    default=None)
+parser.add_argument('-d', '--max-datagram-size', dest='maxDatagramSize',
+                    help='The largest datagram sent (in bytes), longer ' +
+                    'messages are sent as segments.', type=int,
+                    default=None)
+parser.add_argument('-c', '--multicast-chat', dest='multicastChatGroup',
+                    help='Receive the chat of the room from its multicast ' +
+                    'group (this one for the main room, ' +
+                    MULTICAST_CHAT_GROUP + ' by default, the server must ' +
+                    'use the same).', nargs='?',
+                    const=MULTICAST_CHAT_GROUP, default=None)
+parser.add_argument('-b', '--coalesce-window', dest='coalesceWindow',
+                    help='Time (in seconds) the messages sent to the ' +
+                    'server wait for the next ones to leave in the same ' +
+                    'datagram.', type=float, default=None)
 
 options = parser.parse_args()
+if options.sendWindow is not None and not 1 <= options.sendWindow <= RECEIVE_WINDOW:
+    parser.error('the send window must be between 1 and ' + str(RECEIVE_WINDOW))
+if (options.maxDatagramSize is not None and
+        not MIN_DATAGRAM_SIZE <= options.maxDatagramSize <= MAX_DATAGRAM_SIZE):
+    parser.error('the largest datagram must be between ' + str(MIN_DATAGRAM_SIZE) +
+                 ' and ' + str(MAX_DATAGRAM_SIZE) + ' bytes')
 
 
 # Call start function
 C2wStart(protocol,
          options.debugFlag, 
-         options.lossPr)
+         options.lossPr,
+         minRto=options.minRto,
+         sendWindow=options.sendWindow,
+         selectiveAcksFlag=options.selectiveAcksFlag,
+         fecGroupSize=options.fecGroupSize,
+         maxDatagramSize=options.maxDatagramSize,
+         multicastChatGroup=options.multicastChatGroup,
+         coalesceWindow=options.coalesceWindow)
 
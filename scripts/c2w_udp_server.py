@@ -9,6 +9,9 @@ import os
 from set_path import set_path
 set_path()
 from  c2w.main.c2w_server import C2wStart
+from c2w.protocol.multicast import MULTICAST_CHAT_GROUP
+from functions import MIN_DATAGRAM_SIZE
+from functions import MAX_DATAGRAM_SIZE
 
 # Settings
 protocol = 'UDP'
@@ -36,8 +39,42 @@ parser.add_argument('-e', '--debug',
 parser.add_argument('-l', '--loss-pr', dest='lossPr',
                     help='The packet loss probability for outgoing ' +
                     'packets.', type=float, default=0)
+parser.add_argument('-m', '--min-rto', dest='minRto',
+                    help='The smallest retransmission timeout (in seconds), ' +
+                    'the timeout follows the measured round-trip time above ' +
+                    'it.', type=float, default=None)
+parser.add_argument('-f', '--fec-group-size', dest='fecGroupSize',
+                    help='Number of messages protected by one parity ' +
+                    'message for the clients using forward error ' +
+                    'correction.', type=int, default=None)
+parser.add_argument('-d', '--max-datagram-size', dest='maxDatagramSize',
+                    help='The largest datagram sent (in bytes), longer ' +
+                    'messages (e.g. the users list) are sent as segments.',
+                    type=int, default=None)
+parser.add_argument('-i', '--receive-buffer-size', dest='receiveBufferSize',
+                    help='The size (in bytes) of the receive buffer of the ' +
+                    'socket, large enough for the datagrams of a wave of ' +
+                    'logins.', type=int, default=None)
+parser.add_argument('-w', '--send-buffer-size', dest='sendBufferSize',
+                    help='The size (in bytes) of the send buffer of the ' +
+                    'socket.', type=int, default=None)
+parser.add_argument('-c', '--multicast-chat', dest='multicastChatGroup',
+                    help='Send the chat of each room once to a multicast ' +
+                    'group (this one for the main room, ' +
+                    MULTICAST_CHAT_GROUP + ' by default) to the clients ' +
+                    'which join it.', nargs='?',
+                    const=MULTICAST_CHAT_GROUP, default=None)
+parser.add_argument('-b', '--coalesce-window', dest='coalesceWindow',
+                    help='Time (in seconds) the messages sent to a client ' +
+                    'wait for the next ones to leave in the same datagram ' +
+                    '(the clients must split such datagrams).', type=float,
+                    default=None)
 
 options = parser.parse_args()
+if (options.maxDatagramSize is not None and
+        not MIN_DATAGRAM_SIZE <= options.maxDatagramSize <= MAX_DATAGRAM_SIZE):
+    parser.error('the largest datagram must be between ' + str(MIN_DATAGRAM_SIZE) +
+                 ' and ' + str(MAX_DATAGRAM_SIZE) + ' bytes')
 
 
 # Call start function
@@ -46,5 +83,12 @@ C2wStart(protocol,
          options.noVideoFlag,
          options.streamVideoFlag,
          options.debugFlag, 
-         options.lossPr)
+         options.lossPr,
+         minRto=options.minRto,
+         fecGroupSize=options.fecGroupSize,
+         maxDatagramSize=options.maxDatagramSize,
+         receiveBufferSize=options.receiveBufferSize,
+         sendBufferSize=options.sendBufferSize,
+         multicastChatGroup=options.multicastChatGroup,
+         coalesceWindow=options.coalesceWindow)
 
@@ -9,40 +9,169 @@ import struct
 from c2w.main.constants import ROOM_IDS
 
 
+# Formats binaires précompilés une seule fois au chargement du module : on évite ainsi
+# de reconstruire une chaîne de format (et de la faire analyser par struct) à chaque paquet.
+HEADER_STRUCT = struct.Struct('!HH') # longueur du paquet puis numéro de séquence (12 bits) et type (4 bits)
+MOVIE_ENTRY_STRUCT = struct.Struct('!4BHHB') # ip, port, longueur de l'entrée et id du film
+USER_ENTRY_STRUCT = struct.Struct('!BB') # longueur du nom et statut (room) de l'utilisateur
+UINT8_STRUCT = struct.Struct('!B')
+USER_UPDATE_ENTRY_STRUCT = struct.Struct('!BBB') # action, longueur du nom et statut (room) de l'utilisateur
+SEGMENT_STRUCT = struct.Struct('!BBB') # type du message découpé, numéro du segment et nombre de segments
+UINT16_STRUCT = struct.Struct('!H')
+HEADER_SIZE = HEADER_STRUCT.size
+# Tailles possibles d'un datagramme (header compris) : la longueur du paquet est sur 16 bits, et au plus petit un message
+# de longueur maximale tient encore dans 255 segments (le nombre de segments est sur un octet)
+MAX_DATAGRAM_SIZE = 65535
+MIN_DATAGRAM_SIZE = HEADER_SIZE + SEGMENT_STRUCT.size + (MAX_DATAGRAM_SIZE - HEADER_SIZE + 254) // 255
+SEQUENCE_NUMBER_MODULO = 4096 # le numéro de séquence est sur 12 bits, il revient à 0 après 4095
+
+# Message de parité de la correction d'erreurs (FEC) : il n'a pas de numéro de séquence propre et n'est jamais acquitté.
+# Le nombre de messages d'un groupe tient sur un octet
+FEC_PARITY_TYPE = 12
+FEC_MAX_GROUP_SIZE = 255
+
+# Segment d'un message trop long pour un seul datagramme : chaque segment a son propre numéro de séquence et son propre ack
+SEGMENT_TYPE = 13
+
+# Chat d'une room envoyé au groupe multicast de la room (numéro de séquence propre à la room, jamais acquitté)
+# et demande de réparation (NACK) d'un client qui reçoit le chat en multicast
+MULTICAST_CHAT_TYPE = 14
+MULTICAST_NACK_TYPE = 15
+
+# Actions d'une mise à jour de la liste des utilisateurs (message de type 10)
+USER_ADDED = 0
+USER_MOVED = 1
+USER_REMOVED = 2
+
+
 ##
 # Numéro 1 : prepareBuffHeader est une fonction qui retourne le header de chaque paquet 
 #qui doit être envoyé. Elle prend en argument : le numéro de séquence, le type lié à la requête et l'ensemble des données envoyées.
 def prepareBuffHeader(requestType, data, sequenceNumber):
      lenPacket = 4 + len(data) #ajout de 4 bit à la longeur du paquet de données
-     buffLenPacket = struct.pack('!H', lenPacket) #struct.pack permet de convertir l'ensemble des données en binaires ! 
-     #Mais il faut fournir le format, ici par '!H' (avec une taille de 2) 
      #Ici pour structurer le numéro de séquence et le type sur respectivement 12 et 4 bits, nous devons décaler vers la gauche le numéro de séquence 
      #de 4 bits. Après quoi nous pouvons additionner les deux nombres bit à bit. En prenant en considération que les nombres sont tout deux sur 2 octets.
      decaleSequenceNumber = sequenceNumber<<4
      sequenceAndTypeNumber = decaleSequenceNumber|requestType
-     buffSequenceAndTypeNumber = struct.pack('!H', sequenceAndTypeNumber)
-     buffHeader = buffLenPacket + buffSequenceAndTypeNumber
-     return buffHeader # on récupère le header du paquet
+     return HEADER_STRUCT.pack(lenPacket, sequenceAndTypeNumber) # on récupère le header du paquet
+
+# prepareBuffSelectiveAck renvoie un ack cumulatif et sélectif (voir c2wSelectiveAckMessage) : tous les messages jusqu'à
+# cumulativeSequenceNumber sont reçus, ainsi que ceux des bits à 1 de bitmap. La bitmap a toujours au moins un octet,
+# un ack sans données acquitte seulement son numéro de séquence.
+def prepareBuffSelectiveAck(cumulativeSequenceNumber, bitmap):
+     buffBitmap = bitmap.to_bytes(max(1, (bitmap.bit_length() + 7) // 8), 'little')
+     return prepareBuffHeader(0, buffBitmap, cumulativeSequenceNumber) + buffBitmap
+
+# prepareBuffFecParity renvoie le message de parité d'un groupe de datagrammes de numéros de séquence consécutifs
+# (à partir de firstSequenceNumber, qui est le numéro de séquence du header) : [nombre de datagrammes][XOR des datagrammes].
+# Les datagrammes plus courts sont complétés par des 0, la longueur de chacun est dans son header.
+def prepareBuffFecParity(firstSequenceNumber, datagrams):
+     size = max(len(datagram) for datagram in datagrams)
+     parity = 0
+     for datagram in datagrams:
+          parity ^= int.from_bytes(datagram, 'big') << (8 * (size - len(datagram)))
+     buffData = UINT8_STRUCT.pack(len(datagrams)) + parity.to_bytes(size, 'big')
+     return prepareBuffHeader(FEC_PARITY_TYPE, buffData, firstSequenceNumber) + buffData
+
+# prepareBuffLogin renvoie les données d'une requête de connexion (type 1) : le nom de l'utilisateur, suivi pour un client
+# qui utilise la correction d'erreurs (FEC) d'un octet nul et de la taille de ses groupes. Le serveur démarre alors
+# la correction d'erreurs pour ce client dès la connexion
+def prepareBuffLogin(userName, fecGroupSize=0):
+     buffUserName = userName.encode('utf-8')
+     if not fecGroupSize:
+          return buffUserName
+     return buffUserName + b'\x00' + UINT8_STRUCT.pack(fecGroupSize)
+
+# prepareBuffSegments découpe les données d'un message trop long pour un datagramme de maxDatagramSize octets (header compris)
+# et renvoie les données des segments (type 13) : [type du message][numéro du segment][nombre de segments][morceau des données].
+# Les segments partent avec des numéros de séquence consécutifs, le premier est donc le numéro de séquence du segment moins
+# son numéro. Un message qui tient dans un datagramme n'est pas découpé (liste vide). Un message qui demande plus de 255
+# segments lève ValueError (c'est possible au-delà de la longueur d'un paquet, par exemple une liste d'utilisateurs immense).
+def prepareBuffSegments(requestType, buffData, maxDatagramSize):
+     if HEADER_SIZE + len(buffData) <= maxDatagramSize:
+          return []
+     chunkSize = maxDatagramSize - HEADER_SIZE - SEGMENT_STRUCT.size
+     count = (len(buffData) + chunkSize - 1) // chunkSize
+     if count > 255:
+          raise ValueError('message too long for {0} segments of {1} bytes'.format(count, maxDatagramSize))
+     buffData = memoryview(buffData)
+     return [SEGMENT_STRUCT.pack(requestType, index, count) + buffData[index * chunkSize:(index + 1) * chunkSize]
+             for index in range(count)]
+
+# prepareBuffMulticastChat renvoie un message du chat d'une room pour son groupe multicast : [id de la room][message du chat]
+# (voir prepareBuffChatMessage), avec le numéro de séquence de la room. Sans message du chat (chatPayload vide) c'est un
+# battement de cœur : le dernier message envoyé à la room a ce numéro de séquence.
+def prepareBuffMulticastChat(roomId, chatPayload, sequenceNumber):
+     return prepareBuffPacket(MULTICAST_CHAT_TYPE, UINT8_STRUCT.pack(roomId) + chatPayload, sequenceNumber)
+
+# prepareBuffMulticastNack renvoie les données d'une demande de réparation : [id de la room][numéro de séquence manquant (2 octets)]...
+# Sans numéro de séquence le client demande seulement le dernier numéro de séquence de la room (il vient d'y entrer).
+def prepareBuffMulticastNack(roomId, sequenceNumbers):
+     return UINT8_STRUCT.pack(roomId) + b''.join([UINT16_STRUCT.pack(sequenceNumber) for sequenceNumber in sequenceNumbers])
 
 # fonction qui assemble les buffer header et données
 def prepareBuff(buffHeader, buffData):
      buffPacket =  buffHeader + buffData
      return buffPacket
 
+# prepareBuffHeaderInto écrit le header directement au début d'un buffer déjà alloué (bytearray) qui contient
+# la place du header suivie des données : la longueur du paquet est celle du buffer.
+def prepareBuffHeaderInto(buff, requestType, sequenceNumber):
+     HEADER_STRUCT.pack_into(buff, 0, len(buff), (sequenceNumber << 4) | requestType)
+
+# prepareBuffPacket est la variante de prepareBuff(prepareBuffHeader(...), buffData) qui écrit le header et les données
+# dans un seul buffer alloué une fois, sans créer de bytes intermédiaires pour le header.
+# Le bytearray est renvoyé tel quel (sans copie en bytes) : les transports UDP l'acceptent, les transports TCP de twisted
+# n'acceptent que des bytes et reçoivent [header, données] avec writeSequence
+def prepareBuffPacket(requestType, buffData, sequenceNumber):
+     buff = bytearray(HEADER_SIZE + len(buffData))
+     prepareBuffHeaderInto(buff, requestType, sequenceNumber)
+     buff[HEADER_SIZE:] = buffData
+     return buff
+
+# c2wBroadcast sert à envoyer le même message à plusieurs utilisateurs (liste des utilisateurs, message du chat) :
+# les données sont encodées une seule fois et partagées, seul le header de 4 octets (qui contient le numéro
+# de séquence propre à chaque destinataire) est écrit pour chaque destinataire.
+class c2wBroadcast(object):
+    __slots__ = ('requestType', 'buffData', 'lenPacket', 'messageType', '_segments')
+
+    def __init__(self, requestType, buffData, messageType=None):
+        #: Le type des messages diffusés.
+        self.requestType = requestType
+        #: Les données encodées une fois pour tous les destinataires.
+        self.buffData = bytes(buffData)
+        #: La longueur du paquet, identique pour tous les destinataires.
+        self.lenPacket = HEADER_SIZE + len(buffData)
+        #: Le type du message dont c'est un segment (le type des messages diffusés s'il n'est pas découpé).
+        self.messageType = requestType if messageType is None else messageType
+        self._segments = None
+
+    # renvoie la liste des messages à envoyer pour ce message : lui-même s'il tient dans un datagramme de maxDatagramSize
+    # octets, ses segments sinon. Les segments sont calculés une seule fois et partagés par tous les destinataires
+    def segments(self, maxDatagramSize):
+        if self._segments is None or self._segments[0] != maxDatagramSize:
+            segments = [c2wBroadcast(SEGMENT_TYPE, buffData, self.requestType)
+                        for buffData in prepareBuffSegments(self.requestType, self.buffData, maxDatagramSize)]
+            self._segments = (maxDatagramSize, segments or [self])
+        return self._segments[1]
+
+    def prepareBuffHeader(self, sequenceNumber):
+        return HEADER_STRUCT.pack(self.lenPacket, (sequenceNumber << 4) | self.requestType)
+
+    # renvoie le couple [header, données partagées] à donner à transport.writeSequence (aucune copie des données)
+    def prepareBuffSequence(self, sequenceNumber):
+        return [self.prepareBuffHeader(sequenceNumber), self.buffData]
+
 #Numéro 2 : decodeBuffHeader est une fonction qui prend en paramètre le paquet reçu et qui retourne une liste contenant :
 #la longueur du paquet, le numéro de séquence, le type de message et l'intégralités des données transmises. il sert aussi pour le nom d'utilisateur et le nom d'un film
 def decodeBuffHeader(datagram):
-    lData = len(datagram) - 4  #on retire les 4 bits ajouter à la longeur du paquet de données
-    rawDatagram = struct.unpack('!HH{0}s'.format(lData), datagram) #struct.unpack décompresse la valeur emballée dans sa représentation originale 
-    #avec le format spécifié, ici '!HH{0}s'. struct.unpack renvoie toujours un tuple, même s'il n'y a qu'un seul élément.
-    lenPacket = int(rawDatagram[0]) # on prend alors comme entier le premier élément de rawDatagram renvoyé par struct.unpack
-    sequenceAndTypeNumber = int(rawDatagram[1])
+    lenPacket, sequenceAndTypeNumber = HEADER_STRUCT.unpack_from(datagram) # unpack_from lit directement dans le buffer, sans copie
     typeNumber = sequenceAndTypeNumber & 15
     sequenceNumber = sequenceAndTypeNumber >> 4 #décalage vers la droite le numéro de séquence de 4 bits
     if typeNumber == 1 or typeNumber == 2 or typeNumber == 3:
-        data = str(rawDatagram[2], 'utf-8')
+        data = str(datagram[HEADER_SIZE:], 'utf-8')
     else:
-        data = rawDatagram[2]
+        data = bytes(datagram[HEADER_SIZE:])
     
     if data == "": # si les données envoyées sont vide ont retourne tout sauf les données 
         decodeBuff = [lenPacket, sequenceNumber, typeNumber]
@@ -54,41 +183,53 @@ def decodeBuffHeader(datagram):
 #Numéro 3 : prepareBuffMovieList est une fonction qui prend en paramètre la liste des films disponibles et qui renvoie 
 #une liste de toutes les informations concernant ces films.
 def prepareBuffMovieList(MovieList):
-    buffMovieList = bytes() # La méthode bytes() retourne un objet octect initialisé par la taille de ces données
-    for i in range(len(MovieList)):
-        ipMovie = MovieList[i].movieIpAddress # on prend tous les ip de tous les films
-        ipMovieList = ipMovie.split(".") # on sépare ces ip dans la liste
-        buffIp = struct.pack('!B', int(ipMovieList[0])) + struct.pack('!B', int(ipMovieList[1])) + struct.pack('!B', int(ipMovieList[2])) + struct.pack('!B', int(ipMovieList[3]))
-        adrPort = MovieList[i].moviePort # on prend tous les adresses de port de tous les films
-        buffAdrPort = struct.pack('!H', adrPort) 
-        idMovie = MovieList[i].movieId # on prend tous les id de tous les films
-        buffIdMovie = struct.pack('!B', idMovie) #on convertit en binaire mais ici avec une taille de 1 grâce à '!B'
-        nameMovie = MovieList[i].movieTitle # on prend tous les nom de tous les films
-        buffNameMovie = struct.pack('!{0}s'.format(len(nameMovie)), nameMovie.encode('utf-8')) # convertit sous forme de string
-        lenMovie =   len(nameMovie) + 9
-        buffLenMovie = struct.pack('!H', lenMovie)
-        BuffMovie = buffIp + buffAdrPort + buffLenMovie +buffIdMovie + buffNameMovie
-        buffMovieList += BuffMovie # on incrémente pour tous les films disponibles 
-    return buffMovieList
+    return bytes(fillBuffMovieList(MovieList, 0))
+
+# prepareBuffMovieListPacket renvoie directement le paquet complet (header + liste des films) de type 5, dans le
+# bytearray rempli (voir prepareBuffPacket)
+def prepareBuffMovieListPacket(MovieList, sequenceNumber):
+    buff = fillBuffMovieList(MovieList, HEADER_SIZE)
+    prepareBuffHeaderInto(buff, 5, sequenceNumber)
+    return buff
+
+# fillBuffMovieList calcule d'abord la taille totale de la liste, alloue un seul bytearray (en laissant 'offset' octets libres
+# au début pour le header) puis le remplit avec pack_into : plus de concaténations successives.
+def fillBuffMovieList(MovieList, offset):
+    encodedMovies = []
+    size = offset
+    for movie in MovieList:
+        nameMovie = movie.movieTitle.encode('utf-8') # la longueur est celle du titre encodé et non du nombre de caractères
+        encodedMovies.append((movie, nameMovie))
+        size = size + MOVIE_ENTRY_STRUCT.size + len(nameMovie)
+    buff = bytearray(size)
+    k = offset
+    for movie, nameMovie in encodedMovies:
+        ipMovieList = movie.movieIpAddress.split(".") # on sépare les 4 octets de l'ip
+        lenMovie = len(nameMovie) + 9
+        MOVIE_ENTRY_STRUCT.pack_into(buff, k, int(ipMovieList[0]), int(ipMovieList[1]), int(ipMovieList[2]), int(ipMovieList[3]),
+                                     movie.moviePort, lenMovie, movie.movieId)
+        k = k + MOVIE_ENTRY_STRUCT.size
+        buff[k : k + len(nameMovie)] = nameMovie
+        k = k + len(nameMovie)
+    return buff
 
 # Numéro 4 : decodeBuffMovieListest une fonction qui prend en paramètre tout le paquet reçu et qui retourne la liste des films décoder
 #et leurs propres paramètres. Dès qu'il est reçu chaque paramèrtre est décompressé et ajouté dans la liste movieList.
 def decodeBuffMovieList(datagram):
-    movieListDatagram = datagram[4:]
+    return decodeMovieListPayload(memoryview(datagram)[HEADER_SIZE:])
+
+# decodeMovieListPayload fait le même travail que decodeBuffMovieList mais sur les données seules (sans le header),
+# en lisant chaque entrée avec unpack_from à la bonne position plutôt qu'en découpant le paquet.
+def decodeMovieListPayload(payload):
     movieList = []
     k = 0
-    while k < len(movieListDatagram):
-        ipMovie = str(movieListDatagram[k]) + "." + str(movieListDatagram[k + 1]) + "." + str(movieListDatagram[k + 2]) + "." + str(movieListDatagram[k + 3])
-        k = k + 4
-        adrPort = struct.unpack('!H',movieListDatagram[k : k + 2])[0]
-        k = k + 2
-        lenMovie = int(struct.unpack('!H',movieListDatagram[k : k + 2])[0]) - 9
-        k  = k + 2
-        idMovie = struct.unpack('!B', movieListDatagram[k : k + 1])[0]
-        k = k + 1
-        nameMovie = str(struct.unpack('!{0}s'.format(lenMovie), movieListDatagram[k : k + lenMovie])[0], 'utf-8')
+    while k < len(payload):
+        ip1, ip2, ip3, ip4, adrPort, lenMovie, idMovie = MOVIE_ENTRY_STRUCT.unpack_from(payload, k)
+        k = k + MOVIE_ENTRY_STRUCT.size
+        lenMovie = lenMovie - 9
+        nameMovie = str(payload[k : k + lenMovie], 'utf-8')
         k = k + lenMovie
-        movieList.append((nameMovie, ipMovie, adrPort, idMovie))
+        movieList.append((nameMovie, '{0}.{1}.{2}.{3}'.format(ip1, ip2, ip3, ip4), adrPort, idMovie))
         
     return movieList
         
@@ -96,64 +237,423 @@ def decodeBuffMovieList(datagram):
 # Numéro 5 : prepareBuffUsersList est une fonction qui prend en argument la liste des utilisateurs qui la compresse 
 #en format binaire et qui renvoie cette même liste
 def prepareBuffUsersList(usersList):
-    buffUsersList = bytes()
-    for user in usersList:
-        userName = user.userName
-        lenUserName = len(userName)
-        buffLenUserName = struct.pack('!B', lenUserName)
-        buffUserName = struct.pack('!{0}s'.format(lenUserName), userName.encode('utf-8'))
+    return b''.join([prepareBuffUserEntry(user) for user in usersList])
+
+# prepareBuffUsersListPacket renvoie directement le paquet complet (header + liste des utilisateurs) de type 6, dans le
+# bytearray rempli (voir prepareBuffPacket)
+def prepareBuffUsersListPacket(usersList, sequenceNumber):
+    buff = fillBuffUsersList(usersList, HEADER_SIZE)
+    prepareBuffHeaderInto(buff, 6, sequenceNumber)
+    return buff
+
+# prepareBuffUserEntry renvoie l'entrée [longueur du nom][statut][nom] d'un utilisateur. Elle est gardée dans
+# user.userEncodedEntry : le nom n'est encodé qu'une fois et l'entrée n'est recalculée que lorsque
+# l'utilisateur change de room (le user store remet alors userEncodedEntry à None).
+def prepareBuffUserEntry(user):
+    entry = user.userEncodedEntry
+    if entry is None:
+        userName = user.userName.encode('utf-8')
         status = user.userChatRoom
         if status == ROOM_IDS.MAIN_ROOM:
-            buffStatus = struct.pack('!B', 0)
+            status = 0
         else:
-            buffStatus = struct.pack('!B', int(status))
-        buffUsersList += buffLenUserName + buffStatus + buffUserName
-    return buffUsersList
+            status = int(status)
+        entry = USER_ENTRY_STRUCT.pack(len(userName), status) + userName
+        user.userEncodedEntry = entry
+    return entry
+
+# fillBuffUsersList copie les entrées des utilisateurs dans un seul bytearray pré-alloué (même principe que fillBuffMovieList)
+def fillBuffUsersList(usersList, offset):
+    entries = [prepareBuffUserEntry(user) for user in usersList]
+    size = offset
+    for entry in entries:
+        size = size + len(entry)
+    buff = bytearray(size)
+    k = offset
+    for entry in entries:
+        buff[k : k + len(entry)] = entry
+        k = k + len(entry)
+    return buff
 
 # Numéro 6 : decodeBuffUsersList est une fonction qui prend en argument l'ensemble des données reçues et qui parmi celle-ci prend la liste 
 #des utilisateurs et les décompresses du format binaire (à leur format original) pour les ajouter à une liste : 'userList' laquel peut-être utilisé
 def decodeBuffUsersList(datagram):
-    userListDatagram = datagram[4:]
+    return decodeUsersListPayload(memoryview(datagram)[HEADER_SIZE:])
+
+# decodeUsersListPayload décode la liste des utilisateurs à partir des données seules (sans le header)
+def decodeUsersListPayload(payload):
     userList = []
     k = 0
-    while k < len(userListDatagram):
-        lenUserName = userListDatagram[k]
-        k = k + 1
-        status = userListDatagram[k]
-        k = k + 1
-        userName = str(struct.unpack('!{0}s'.format(lenUserName), userListDatagram[k : k + lenUserName])[0], 'utf-8')
-        userList.append(tuple((userName, status)))
+    while k < len(payload):
+        lenUserName, status = USER_ENTRY_STRUCT.unpack_from(payload, k)
+        k = k + USER_ENTRY_STRUCT.size
+        userName = str(payload[k : k + lenUserName], 'utf-8')
+        userList.append((userName, status))
         k = k + lenUserName
     return userList
 
+# prepareBuffUsersListUpdate encode une mise à jour de la liste des utilisateurs (message de type 10) : au lieu de renvoyer
+# toute la liste, on n'envoie que les utilisateurs modifiés. Elle prend une liste de couples (action, utilisateur) où
+# l'action est USER_ADDED, USER_MOVED ou USER_REMOVED. Chaque entrée est [action][longueur du nom][statut][nom].
+def prepareBuffUsersListUpdate(updates):
+    return b''.join([UINT8_STRUCT.pack(action) + prepareBuffUserEntry(user) for action, user in updates])
+
+# decodeUsersListUpdatePayload renvoie la liste des (action, nom, statut) d'une mise à jour (sans le header)
+def decodeUsersListUpdatePayload(payload):
+    updates = []
+    k = 0
+    while k < len(payload):
+        action, lenUserName, status = USER_UPDATE_ENTRY_STRUCT.unpack_from(payload, k)
+        k = k + USER_UPDATE_ENTRY_STRUCT.size
+        userName = str(payload[k : k + lenUserName], 'utf-8')
+        updates.append((action, userName, status))
+        k = k + lenUserName
+    return updates
+
+# applyUsersListUpdate applique une mise à jour décodée (liste des (action, nom, statut)) à la liste des utilisateurs
+# du client, une liste de couples (nom, titre du film ou ROOM_IDS.MAIN_ROOM) modifiée sur place. Elle renvoie la liste
+# des (nom, room) à afficher, la room valant ROOM_IDS.OUT_OF_THE_SYSTEM_ROOM pour un utilisateur parti, et False si la
+# mise à jour ne correspond pas à la liste (utilisateur ou film inconnu) : le client doit alors redemander la liste complète.
+def applyUsersListUpdate(userList, updates, movieIdNameDic):
+    changes = []
+    consistent = True
+    for action, userName, status in updates:
+        position = None
+        for i in range(len(userList)):
+            if userList[i][0] == userName:
+                position = i
+                break
+        if action == USER_REMOVED:
+            if position is None:
+                consistent = False
+                continue
+            del userList[position]
+            changes.append((userName, ROOM_IDS.OUT_OF_THE_SYSTEM_ROOM))
+            continue
+        if status not in movieIdNameDic or (action == USER_MOVED and position is None):
+            consistent = False
+            continue
+        user = (userName, movieIdNameDic[status])
+        if position is None:
+            userList.append(user)
+        else:
+            userList[position] = user
+        changes.append(user)
+    return changes, consistent
+
 # Numéro 7 : prepareBuffChatMessage est une fonction qui prend le message envoyé par un utilisateur et son nom associé, qui le transforme en format binaire
 # et qui renvoie un paquet binaire composé du nom, de la longeur du nom et du message de l'utilisateur
 def prepareBuffChatMessage(userName, message):
-    lenUserName = len(userName)
-    buffLenUserName = struct.pack('!B', lenUserName)
-    buffUserName = struct.pack('!{0}s'.format(len(userName)), userName.encode('utf-8'))
-    buffMessage =  struct.pack('!{0}s'.format(len(message)), message.encode('utf-8'))
-    buff = buffLenUserName + buffUserName + buffMessage
+    return bytes(fillBuffChatMessage(userName, message, 0))
+
+# prepareBuffChatMessagePacket renvoie directement le paquet complet (header + message) de type 9, dans le
+# bytearray rempli (voir prepareBuffPacket)
+def prepareBuffChatMessagePacket(userName, message, sequenceNumber):
+    buff = fillBuffChatMessage(userName, message, HEADER_SIZE)
+    prepareBuffHeaderInto(buff, 9, sequenceNumber)
+    return buff
+
+# fillBuffChatMessage écrit [longueur du nom][nom][message] dans un seul bytearray pré-alloué
+def fillBuffChatMessage(userName, message, offset):
+    buffUserName = userName.encode('utf-8')
+    buffMessage = message.encode('utf-8')
+    k = offset + 1 + len(buffUserName)
+    buff = bytearray(k + len(buffMessage))
+    UINT8_STRUCT.pack_into(buff, offset, len(buffUserName))
+    buff[offset + 1 : k] = buffUserName
+    buff[k:] = buffMessage
     return buff
         
 # Numéro 8 : decodeBuffChatMessage est une fonction qui prend en argument l'ensemble des données reçues, ils décompressent ces données (message et nom de l'utilisateur)du binaire-> au string 
 #et le retourne au serveur qui après va l'afficher dans l'espace chat des main et video room  
 def decodeBuffChatMessage(datagram):
-    chatMessageDatagram = datagram[4:]
+    return decodeChatMessagePayload(memoryview(datagram)[HEADER_SIZE:])
 
-    lenUserName = chatMessageDatagram[0]
-    userName = str(struct.unpack('!{0}s'.format(lenUserName), chatMessageDatagram[1:1 + lenUserName])[0], 'utf-8')
-    message = str(struct.unpack('!{0}s'.format(len(chatMessageDatagram[lenUserName + 1:])), chatMessageDatagram[1 + lenUserName:])[0], 'utf-8')
+# decodeChatMessagePayload décode le nom de l'envoyeur et le message à partir des données seules (sans le header)
+def decodeChatMessagePayload(payload):
+    lenUserName = UINT8_STRUCT.unpack_from(payload)[0]
+    userName = str(payload[1:1 + lenUserName], 'utf-8')
+    message = str(payload[1 + lenUserName:], 'utf-8')
     return (userName, message)
-    
 
-        
-        
-    
 
+##
+# Couche de décodage "objet" : decodeMessage ne lit que le header (4 octets) et renvoie un message typé
+# qui garde une vue (memoryview) sur ses données. Les champs (nom, liste des films, liste des utilisateurs...)
+# ne sont décodés qu'au premier accès puis gardés en mémoire. Les __slots__ évitent un dictionnaire par message.
+class c2wMessage(object):
+    __slots__ = ('lenPacket', 'sequenceNumber', 'typeNumber', 'payload')
 
+    def __init__(self, lenPacket, sequenceNumber, typeNumber, payload):
+        #: La longueur totale du paquet (header compris).
+        self.lenPacket = lenPacket
+        #: Le numéro de séquence (12 bits) de l'envoyeur.
+        self.sequenceNumber = sequenceNumber
+        #: Le type du message (4 bits).
+        self.typeNumber = typeNumber
+        #: Une memoryview sur les données du message (sans le header), aucune copie n'est faite.
+        self.payload = payload
 
+    def __repr__(self):
+        return '<{0} len={1} seq={2} type={3}>'.format(type(self).__name__, self.lenPacket,
+                                                       self.sequenceNumber, self.typeNumber)
 
-    
-               
-            
+# Un ack n'a pas de données : on ne crée même pas la memoryview
+class c2wAckMessage(c2wMessage):
+    __slots__ = ()
+
+    def __init__(self, lenPacket, sequenceNumber):
+        c2wMessage.__init__(self, lenPacket, sequenceNumber, 0, b'')
+
+    # renvoie les numéros de séquence parmi inFlight (messages en attente d'ack) acquittés par ce message
+    def acknowledgedAmong(self, inFlight):
+        if self.sequenceNumber in inFlight:
+            return [self.sequenceNumber]
+        return []
+
+# Ack cumulatif et sélectif (type 0 avec des données) : le numéro de séquence du header est le dernier d'une suite de
+# messages tous reçus, les données sont une bitmap des messages suivants reçus (le bit i, en partant du bit de poids
+# faible du premier octet, correspond au numéro de séquence cumulatif + 1 + i). Un seul ack acquitte ainsi plusieurs messages.
+class c2wSelectiveAckMessage(c2wMessage):
+    __slots__ = ('_bitmap',)
+
+    def __init__(self, lenPacket, sequenceNumber, typeNumber, payload):
+        c2wMessage.__init__(self, lenPacket, sequenceNumber, typeNumber, payload)
+        self._bitmap = None
+
+    @property
+    def bitmap(self):
+        if self._bitmap is None:
+            self._bitmap = int.from_bytes(self.payload, 'little')
+        return self._bitmap
+
+    # True si le message de numéro de séquence sequenceNumber est acquitté : il précède le numéro cumulatif
+    # (arithmétique modulo 4096, sur une demi-plage) ou son bit est à 1 dans la bitmap
+    def acknowledges(self, sequenceNumber):
+        offset = (self.sequenceNumber - sequenceNumber) % SEQUENCE_NUMBER_MODULO
+        if offset < SEQUENCE_NUMBER_MODULO // 2:
+            return True
+        return (self.bitmap >> (SEQUENCE_NUMBER_MODULO - offset - 1)) & 1 == 1
+
+    def acknowledgedAmong(self, inFlight):
+        return [sequenceNumber for sequenceNumber in inFlight if self.acknowledges(sequenceNumber)]
+
+# Messages dont les données sont une simple chaîne : login (1), départ (2), entrée dans une room (3 et 4)
+class c2wTextMessage(c2wMessage):
+    __slots__ = ('_text',)
+
+    def __init__(self, lenPacket, sequenceNumber, typeNumber, payload):
+        c2wMessage.__init__(self, lenPacket, sequenceNumber, typeNumber, payload)
+        self._text = None
+
+    @property
+    def text(self):
+        if self._text is None:
+            self._text = str(self.payload, 'utf-8')
+        return self._text
+
+# Requête de connexion (type 1, voir prepareBuffLogin) : le nom de l'utilisateur et la taille des groupes de la
+# correction d'erreurs du client (0 s'il ne l'utilise pas)
+class c2wLoginMessage(c2wTextMessage):
+    __slots__ = ()
+
+    @property
+    def text(self):
+        if self._text is None:
+            self._text = str(self.payload[:self._userNameLength()], 'utf-8')
+        return self._text
+
+    @property
+    def fecGroupSize(self):
+        userNameLength = self._userNameLength()
+        if userNameLength + 2 > len(self.payload):
+            return 0
+        return self.payload[userNameLength + 1]
+
+    def _userNameLength(self):
+        userNameLength = bytes(self.payload).find(b'\x00')
+        return len(self.payload) if userNameLength < 0 else userNameLength
+
+# Liste des films (type 5)
+class c2wMovieListMessage(c2wMessage):
+    __slots__ = ('_movieList',)
+
+    def __init__(self, lenPacket, sequenceNumber, typeNumber, payload):
+        c2wMessage.__init__(self, lenPacket, sequenceNumber, typeNumber, payload)
+        self._movieList = None
+
+    @property
+    def movieList(self):
+        if self._movieList is None:
+            self._movieList = decodeMovieListPayload(self.payload)
+        return self._movieList
+
+# Liste des utilisateurs (type 6)
+class c2wUsersListMessage(c2wMessage):
+    __slots__ = ('_usersList',)
+
+    def __init__(self, lenPacket, sequenceNumber, typeNumber, payload):
+        c2wMessage.__init__(self, lenPacket, sequenceNumber, typeNumber, payload)
+        self._usersList = None
+
+    @property
+    def usersList(self):
+        if self._usersList is None:
+            self._usersList = decodeUsersListPayload(self.payload)
+        return self._usersList
+
+# Mise à jour de la liste des utilisateurs (type 10)
+class c2wUsersListUpdateMessage(c2wMessage):
+    __slots__ = ('_usersListUpdate',)
+
+    def __init__(self, lenPacket, sequenceNumber, typeNumber, payload):
+        c2wMessage.__init__(self, lenPacket, sequenceNumber, typeNumber, payload)
+        self._usersListUpdate = None
+
+    @property
+    def usersListUpdate(self):
+        if self._usersListUpdate is None:
+            self._usersListUpdate = decodeUsersListUpdatePayload(self.payload)
+        return self._usersListUpdate
+
+# Message du chat (type 9)
+class c2wChatMessage(c2wMessage):
+    __slots__ = ('_chatMessage',)
+
+    def __init__(self, lenPacket, sequenceNumber, typeNumber, payload):
+        c2wMessage.__init__(self, lenPacket, sequenceNumber, typeNumber, payload)
+        self._chatMessage = None
+
+    @property
+    def chatMessage(self):
+        if self._chatMessage is None:
+            self._chatMessage = decodeChatMessagePayload(self.payload)
+        return self._chatMessage
+
+    @property
+    def userName(self):
+        return self.chatMessage[0]
+
+    @property
+    def message(self):
+        return self.chatMessage[1]
+
+# Message de parité (type 12) : le numéro de séquence est celui du premier datagramme du groupe
+class c2wFecParityMessage(c2wMessage):
+    __slots__ = ()
+
+    @property
+    def count(self):
+        return self.payload[0]
+
+    # renvoie le datagramme manquant du groupe à partir des autres (None si le résultat n'est pas un paquet valide)
+    def rebuild(self, datagrams):
+        buffParity = self.payload[1:]
+        size = len(buffParity)
+        missing = int.from_bytes(buffParity, 'big')
+        for datagram in datagrams:
+            if len(datagram) > size:
+                return None
+            missing ^= int.from_bytes(datagram, 'big') << (8 * (size - len(datagram)))
+        buff = missing.to_bytes(size, 'big')
+        lenPacket = HEADER_STRUCT.unpack_from(buff)[0]
+        if lenPacket < HEADER_SIZE or lenPacket > size:
+            return None
+        return buff[:lenPacket]
+
+# Segment d'un message découpé (type 13)
+class c2wSegmentMessage(c2wMessage):
+    __slots__ = ()
+
+    @property
+    def segmentHeader(self):
+        return SEGMENT_STRUCT.unpack_from(self.payload)
+
+    # le numéro de séquence du premier segment du message
+    @property
+    def firstSequenceNumber(self):
+        return (self.sequenceNumber - self.payload[1]) % SEQUENCE_NUMBER_MODULO
+
+    @property
+    def data(self):
+        return self.payload[SEGMENT_STRUCT.size:]
+
+# Message du chat d'une room reçu en multicast (type 14), ou battement de cœur s'il n'a pas de message
+class c2wMulticastChatMessage(c2wChatMessage):
+    __slots__ = ()
+
+    @property
+    def roomId(self):
+        return self.payload[0]
+
+    @property
+    def isHeartbeat(self):
+        return len(self.payload) == 1
+
+    @property
+    def chatMessage(self):
+        if self._chatMessage is None:
+            self._chatMessage = decodeChatMessagePayload(self.payload[1:])
+        return self._chatMessage
+
+# Demande de réparation des messages multicast perdus (type 15)
+class c2wMulticastNackMessage(c2wMessage):
+    __slots__ = ()
+
+    @property
+    def roomId(self):
+        return self.payload[0]
+
+    @property
+    def missingSequenceNumbers(self):
+        return [UINT16_STRUCT.unpack_from(self.payload, k)[0] for k in range(1, len(self.payload) - 1, UINT16_STRUCT.size)]
+
+# classe de message à utiliser pour chaque type (les types absents utilisent c2wMessage)
+MESSAGE_CLASSES = {
+    1: c2wLoginMessage,
+    2: c2wTextMessage,
+    3: c2wTextMessage,
+    4: c2wTextMessage,
+    5: c2wMovieListMessage,
+    6: c2wUsersListMessage,
+    9: c2wChatMessage,
+    10: c2wUsersListUpdateMessage,
+    FEC_PARITY_TYPE: c2wFecParityMessage,
+    SEGMENT_TYPE: c2wSegmentMessage,
+    MULTICAST_CHAT_TYPE: c2wMulticastChatMessage,
+    MULTICAST_NACK_TYPE: c2wMulticastNackMessage,
+}
+
+# decodeMessage prend en paramètre un paquet complet (datagramme ou trame TCP) et renvoie le message typé correspondant.
+# Les acks prennent un chemin rapide qui ne touche jamais aux données.
+def decodeMessage(datagram):
+    lenPacket, sequenceAndTypeNumber = HEADER_STRUCT.unpack_from(datagram)
+    typeNumber = sequenceAndTypeNumber & 15
+    if typeNumber == 0:
+        if lenPacket == HEADER_SIZE:
+            return c2wAckMessage(lenPacket, sequenceAndTypeNumber >> 4)
+        return c2wSelectiveAckMessage(lenPacket, sequenceAndTypeNumber >> 4, 0, memoryview(datagram)[HEADER_SIZE:lenPacket])
+    payload = memoryview(datagram)[HEADER_SIZE:lenPacket]
+    return MESSAGE_CLASSES.get(typeNumber, c2wMessage)(lenPacket, sequenceAndTypeNumber >> 4, typeNumber, payload)
+
+# splitDatagram renvoie les messages d'un datagramme qui en contient plusieurs à la suite (voir c2wCoalescer), chacun avec
+# son header : la longueur écrite dans le header sépare un message du suivant. Un datagramme d'un seul message est renvoyé
+# tel quel, la fin d'un datagramme trop courte pour un message est ignorée
+def splitDatagram(datagram):
+    if HEADER_STRUCT.unpack_from(datagram)[0] >= len(datagram):
+        return [datagram]
+    messages = []
+    offset = 0
+    while offset + HEADER_SIZE <= len(datagram):
+        lenPacket = HEADER_STRUCT.unpack_from(datagram, offset)[0]
+        if lenPacket < HEADER_SIZE or offset + lenPacket > len(datagram):
+            break
+        messages.append(bytes(datagram[offset:offset + lenPacket]))
+        offset += lenPacket
+    return messages
+
+# decodeReassembledMessage renvoie le message typé d'un message reçu en segments, à partir de ses données réassemblées
+# (il peut être plus long que les 65535 octets d'un paquet, sa longueur n'est pas écrite dans un header)
+def decodeReassembledMessage(typeNumber, sequenceNumber, buffData):
+    return MESSAGE_CLASSES.get(typeNumber, c2wMessage)(HEADER_SIZE + len(buffData), sequenceNumber, typeNumber,
+                                                       memoryview(buffData))
@@ -0,0 +1,125 @@
+import socket
+import logging
+from twisted.internet import udp
+from twisted.python import log
+
+logging.basicConfig()
+moduleLogger = logging.getLogger('c2w.main.batch_udp_port')
+
+
+class c2wBatchUdpPort(udp.Port):
+
+    #: Largest number of datagrams read from the socket for one readiness
+    #: event (the reactor serves the other events in between).
+    maxBatchSize = 256
+
+    def __init__(self, port, proto, interface='', maxPacketSize=8192,
+                 reactor=None, receiveBufferSize=None, sendBufferSize=None):
+        """
+        :param port: The UDP port number to listen on.
+        :param proto: The protocol (instance of
+            :py:class:`twisted.internet.protocol.DatagramProtocol`).
+        :param receiveBufferSize: The size (in bytes) of the receive buffer
+            of the socket (SO_RCVBUF), the system default if ``None``.
+        :param sendBufferSize: The size (in bytes) of the send buffer of
+            the socket (SO_SNDBUF), the system default if ``None``.
+
+        A UDP port which reads every datagram waiting in the socket (up to
+        :py:attr:`maxBatchSize`) when it becomes readable and hands them
+        to the protocol together, with
+        ``proto.datagramsReceived([(datagram, (host, port)), ...])``
+        (``datagramReceived`` for each datagram if the protocol has no
+        such method).  The datagrams written by the protocol meanwhile are
+        sent together once the batch has been treated, so the socket is
+        drained before any time is spent sending.
+
+        .. code-block:: python
+
+            port = c2wBatchUdpPort(serverPort, serverProtocolInstance,
+                                   reactor=reactor)
+            port.startListening()
+        """
+        udp.Port.__init__(self, port, proto, interface, maxPacketSize,
+                          reactor)
+        self.receiveBufferSize = receiveBufferSize
+        self.sendBufferSize = sendBufferSize
+        #: The datagrams written while a batch is treated, ``None`` outside
+        #: of a batch.
+        self._pendingWrites = None
+
+    def createInternetSocket(self):
+        skt = udp.Port.createInternetSocket(self)
+        if self.receiveBufferSize is not None:
+            skt.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF,
+                           self.receiveBufferSize)
+        if self.sendBufferSize is not None:
+            skt.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF,
+                           self.sendBufferSize)
+        moduleLogger.debug('socket buffers: receive=%s, send=%s',
+                           skt.getsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF),
+                           skt.getsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF))
+        return skt
+
+    def doRead(self):
+        """
+        Called when the socket is ready for reading.
+        """
+        datagrams = []
+        read = 0
+        while read < self.maxThroughput and len(datagrams) < self.maxBatchSize:
+            try:
+                data, addr = self.socket.recvfrom(self.maxPacketSize)
+            except OSError as se:
+                no = se.args[0]
+                if no in udp._sockErrReadIgnore:
+                    break
+                if no in udp._sockErrReadRefuse:
+                    if self._connectedAddr:
+                        self.protocol.connectionRefused()
+                    break
+                # the datagrams already read are treated before the error
+                # goes up to the reactor
+                if datagrams:
+                    self.deliver(datagrams)
+                raise
+            read += len(data)
+            datagrams.append((data, addr[:2]))
+        if datagrams:
+            self.deliver(datagrams)
+
+    def deliver(self, datagrams):
+        """
+        :param datagrams: The list of (datagram, (host, port)) read from
+            the socket.
+
+        Hands a batch to the protocol, then sends what it has written.
+        """
+        self._pendingWrites = []
+        try:
+            datagramsReceived = getattr(self.protocol, 'datagramsReceived',
+                                        None)
+            if datagramsReceived is not None:
+                try:
+                    datagramsReceived(datagrams)
+                except BaseException:
+                    log.err()
+            else:
+                for data, addr in datagrams:
+                    try:
+                        self.protocol.datagramReceived(data, addr)
+                    except BaseException:
+                        log.err()
+        finally:
+            pendingWrites = self._pendingWrites
+            self._pendingWrites = None
+            for datagram, addr in pendingWrites:
+                try:
+                    udp.Port.write(self, datagram, addr)
+                except BaseException:
+                    log.err()
+
+    def write(self, datagram, addr=None):
+        if self._pendingWrites is not None:
+            self._pendingWrites.append((datagram, addr))
+            return None
+        return udp.Port.write(self, datagram, addr)
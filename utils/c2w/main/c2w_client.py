@@ -12,6 +12,53 @@ following command line option:
    The client will print extra debugging messages if this option is present
    on the command line.
 
+.. cmdoption:: -m seconds, --min-rto seconds
+
+   UDP only: the smallest retransmission timeout.  The timeout follows the
+   measured round-trip time to the server above this value (one second by
+   default).
+
+.. cmdoption:: -w number, --send-window number
+
+   UDP only: the maximum number of messages sent to the server and waiting
+   for their ACK (8 by default), the next ones wait until one is
+   acknowledged.  It cannot be above the receive window of the server (64
+   messages).
+
+.. cmdoption:: -a, --selective-acks
+
+   UDP only: the client acknowledges several messages of the server at once
+   with cumulative and selective ACKs, sent after a short delay.  The server
+   answers the same way to such a client.
+
+.. cmdoption:: -f number, --fec-group-size number
+
+   UDP only: forward error correction, a parity message is sent after every
+   group of this number of messages (at most 255) so that one lost message
+   of the group is rebuilt without waiting for its retransmission.  The
+   group size is sent in the login request, the server then does the same
+   for this client from the login on.
+
+.. cmdoption:: -d bytes, --max-datagram-size bytes
+
+   UDP only: the largest datagram sent (1400 bytes by default, below the
+   MTU of an Ethernet link, between 264 and 65535 bytes).  A longer chat
+   message is split into segments (at most 255) which are acknowledged and
+   sent again one by one.
+
+.. cmdoption:: -c [group], --multicast-chat [group]
+
+   UDP only: the chat of the room is received from its multicast group (the
+   given group for the main room, 239.192.74.0 by default, and the next
+   addresses for the movie rooms), the lost messages are asked to the
+   server.  The server must be started with the same option.
+
+.. cmdoption:: -b seconds, --coalesce-window seconds
+
+   UDP only: the messages sent to the server within this time (a few
+   milliseconds) leave together in one datagram, each with its own header
+   and ACK.  The server splits such datagrams.
+
 The client uses a Model-View-Controller pattern. The model is in
 the :py:mod:`~c2w_main.c2w_model` module.  The view is in the
 :py:mod:`~c2w_main.c2w_view` module and controller is in the
@@ -67,13 +114,25 @@ Gst.init(None)
 
 import logging
 import importlib
+from c2w.protocol.udp_session import RECEIVE_WINDOW
+from functions import FEC_MAX_GROUP_SIZE
+from functions import MIN_DATAGRAM_SIZE
+from functions import MAX_DATAGRAM_SIZE
 
 logging.basicConfig()
 moduleLogger = logging.getLogger('c2w.main.c2w_client')
 
 def C2wStart(protocolChoice,          # 'UDP' or TCP'
              debugFlag, 
-             lossPr):
+             lossPr,
+             reliableFlag=False,
+             minRto=None,
+             sendWindow=None,
+             selectiveAcksFlag=False,
+             fecGroupSize=None,
+             maxDatagramSize=None,
+             multicastChatGroup=None,
+             coalesceWindow=None):
     logging.basicConfig()
     log = logging.getLogger('c2w.main.c2wclient')
     log.setLevel(logging.INFO)
@@ -99,6 +158,51 @@ def C2wStart(protocolChoice,          # 'UDP' or TCP'
     protocolName = getattr(module, protocol.rsplit('.', 1)[1])
     log.debug("MAIN_DEBUG: imported module=%s, protocol=%s", module, protocolName)
 
+    if reliableFlag and not udpFlag:
+        protocolName.reliableTransport = True
+        log.info("MAIN_INFO: relying on TCP, no retransmission of the messages")
+
+    if minRto is not None and udpFlag:
+        protocolName.minRto = minRto
+        log.info("MAIN_INFO: smallest retransmission timeout: %s s", minRto)
+
+    if sendWindow is not None and udpFlag:
+        if not 1 <= sendWindow <= RECEIVE_WINDOW:
+            moduleLogger.critical('The send window must be between 1 and ' +
+                                  '%s messages', RECEIVE_WINDOW)
+            raise SystemExit
+        protocolName.sendWindow = sendWindow
+        log.info("MAIN_INFO: at most %s messages waiting for their ACK", sendWindow)
+
+    if selectiveAcksFlag and udpFlag:
+        protocolName.selectiveAcks = True
+        log.info("MAIN_INFO: using cumulative and selective ACKs")
+
+    if fecGroupSize is not None and udpFlag:
+        if not 0 <= fecGroupSize <= FEC_MAX_GROUP_SIZE:
+            moduleLogger.critical('The FEC group size must be between 0 and ' +
+                                  '%s messages', FEC_MAX_GROUP_SIZE)
+            raise SystemExit
+        protocolName.fecGroupSize = fecGroupSize
+        log.info("MAIN_INFO: one parity message every %s messages", fecGroupSize)
+
+    if maxDatagramSize is not None and udpFlag:
+        if not MIN_DATAGRAM_SIZE <= maxDatagramSize <= MAX_DATAGRAM_SIZE:
+            moduleLogger.critical('The largest datagram must be between %s ' +
+                                  'and %s bytes', MIN_DATAGRAM_SIZE,
+                                  MAX_DATAGRAM_SIZE)
+            raise SystemExit
+        protocolName.maxDatagramSize = maxDatagramSize
+        log.info("MAIN_INFO: largest datagram: %s bytes", maxDatagramSize)
+
+    if multicastChatGroup is not None and udpFlag:
+        protocolName.multicastChatGroup = multicastChatGroup
+        log.info("MAIN_INFO: chat of the main room received from the multicast group %s", multicastChatGroup)
+
+    if coalesceWindow is not None and udpFlag:
+        protocolName.coalesceWindow = coalesceWindow
+        log.info("MAIN_INFO: messages coalesced into one datagram for %s s", coalesceWindow)
+
     if debugFlag:
         log.setLevel(logging.DEBUG)
         logC2w = logging.getLogger('c2w')
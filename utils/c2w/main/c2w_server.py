@@ -22,6 +22,58 @@ following command line options:
    The server will print extra debugging messages if this option is present
    on the command line.
 
+.. cmdoption:: -r, --reliable
+
+   TCP only: the server relies on TCP to deliver the messages and does not
+   retransmit them every second until they are acknowledged.
+
+.. cmdoption:: -m seconds, --min-rto seconds
+
+   UDP only: the smallest retransmission timeout.  The timeout of each
+   client follows its measured round-trip time above this value (one second
+   by default).
+
+.. cmdoption:: -f number, --fec-group-size number
+
+   UDP only: for the clients asking for forward error correction in their
+   login request, a parity message is sent after every group of this number
+   of messages (4 by default, at most 255), so that a lost message of the
+   group is rebuilt by the client without waiting for its retransmission.
+
+.. cmdoption:: -d bytes, --max-datagram-size bytes
+
+   UDP only: the largest datagram sent (1400 bytes by default, below the
+   MTU of an Ethernet link, between 264 and 65535 bytes).  A longer
+   message, e.g. the users list with hundreds of users, is split into
+   segments which are acknowledged and sent again one by one instead of
+   being fragmented by IP.  A message needing more than 255 segments is
+   not sent (the error is logged).
+
+.. cmdoption:: -i bytes, --receive-buffer-size bytes
+.. cmdoption:: -w bytes, --send-buffer-size bytes
+
+   UDP only: the sizes of the receive and send buffers of the socket (the
+   system defaults otherwise).  The server reads all the datagrams waiting
+   in the socket at once and treats them as a batch, a larger receive
+   buffer keeps the datagrams of a wave of logins until then.
+
+.. cmdoption:: -c [group], --multicast-chat [group]
+
+   UDP only: the chat of each room is sent once to a multicast group (the
+   given group for the main room, 239.192.74.0 by default, and the next
+   addresses for the movie rooms, on the server port + 1) instead of once
+   to each client of the room.  Only the clients started with the same
+   option receive it that way, they ask the server for the messages they
+   have lost.
+
+.. cmdoption:: -b seconds, --coalesce-window seconds
+
+   UDP only: the messages sent to a client within this time (a few
+   milliseconds) leave together in one datagram, up to the largest
+   datagram size, instead of one datagram each.  Every message keeps its
+   header, sequence number and ACK.  The clients must split such datagrams
+   (the clients of this version always do).
+
 .. note::
    If there is a file named "c2w_movie_config" in the same directory as
    the Python server script, the server reads this file to determine the
@@ -42,6 +94,10 @@ import sys
 from c2w.main.chat_server_protocol_factory import c2wChatServerProtocolFactory
 from c2w.main.server_model import c2wServerModel
 from c2w.main.server_proxy import c2wServerProxy
+from c2w.main.batch_udp_port import c2wBatchUdpPort
+from functions import FEC_MAX_GROUP_SIZE
+from functions import MIN_DATAGRAM_SIZE
+from functions import MAX_DATAGRAM_SIZE
 
 sys.dont_write_bytecode = True
 
@@ -128,7 +184,15 @@ def C2wStart(protocolChoice,          # 'UDP' or TCP'
              noVideoFlag,
              streamVideoFlag,
              debugFlag, 
-             lossPr):
+             lossPr,
+             reliableFlag=False,
+             minRto=None,
+             fecGroupSize=None,
+             maxDatagramSize=None,
+             receiveBufferSize=None,
+             sendBufferSize=None,
+             multicastChatGroup=None,
+             coalesceWindow=None):
                
     logging.basicConfig()
     log = logging.getLogger('c2w.c2w_main.server')
@@ -162,6 +226,39 @@ def C2wStart(protocolChoice,          # 'UDP' or TCP'
 
     log.info("importing module=%s, protocolName=%s", module, protocolName)
 
+    if reliableFlag and not udpFlag:
+        protocolName.reliableTransport = True
+        log.info("MAIN_INFO: relying on TCP, no retransmission of the messages")
+
+    if minRto is not None and udpFlag:
+        protocolName.minRto = minRto
+        log.info("MAIN_INFO: smallest retransmission timeout: %s s", minRto)
+
+    if fecGroupSize is not None and udpFlag:
+        if not 1 <= fecGroupSize <= FEC_MAX_GROUP_SIZE:
+            moduleLogger.critical('The FEC group size must be between 1 and ' +
+                                  '%s messages', FEC_MAX_GROUP_SIZE)
+            raise SystemExit
+        protocolName.fecGroupSize = fecGroupSize
+        log.info("MAIN_INFO: one parity message every %s messages", fecGroupSize)
+
+    if maxDatagramSize is not None and udpFlag:
+        if not MIN_DATAGRAM_SIZE <= maxDatagramSize <= MAX_DATAGRAM_SIZE:
+            moduleLogger.critical('The largest datagram must be between %s ' +
+                                  'and %s bytes', MIN_DATAGRAM_SIZE,
+                                  MAX_DATAGRAM_SIZE)
+            raise SystemExit
+        protocolName.maxDatagramSize = maxDatagramSize
+        log.info("MAIN_INFO: largest datagram: %s bytes", maxDatagramSize)
+
+    if multicastChatGroup is not None and udpFlag:
+        protocolName.multicastChatGroup = multicastChatGroup
+        log.info("MAIN_INFO: chat of the main room sent to the multicast group %s", multicastChatGroup)
+
+    if coalesceWindow is not None and udpFlag:
+        protocolName.coalesceWindow = coalesceWindow
+        log.info("MAIN_INFO: messages coalesced into one datagram for %s s", coalesceWindow)
+
     serverPort = port
     serverModel = c2wServerModel()
     serverProxy = c2wServerProxy(serverModel)
@@ -175,7 +272,11 @@ def C2wStart(protocolChoice,          # 'UDP' or TCP'
     if udpFlag:
         log.info("MAIN_INFO: Server listening on UDP port %s", serverPort)
         serverProtocolInstance = protocolName(serverProxy, lossPr)
-        reactor.listenUDP(serverPort, serverProtocolInstance)
+        udpPort = c2wBatchUdpPort(serverPort, serverProtocolInstance,
+                                  reactor=reactor,
+                                  receiveBufferSize=receiveBufferSize,
+                                  sendBufferSize=sendBufferSize)
+        udpPort.startListening()
     else:
         log.info("MAIN_INFO: Server listening on TCP port %s", serverPort)
         f = c2wChatServerProtocolFactory(protocolName, serverProxy)
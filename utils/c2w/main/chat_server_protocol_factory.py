@@ -45,6 +45,12 @@ class c2wChatServerProtocolFactory(Factory):
             The user list, of type
 :py:class:`~c2w.main.server_proxy.c2wServerProxy`.
 
+        .. attribute:: protocolInstances
+
+            The set of the protocol instances whose connection is still
+            open.  Each instance removes itself from it when its connection
+            is lost.
+
         .. warning::
             The chat server protocol *must* use the server proxy to get the
             movie list otherwise video streaming will not work.
@@ -57,6 +63,8 @@ class c2wChatServerProtocolFactory(Factory):
         moduleLogger.debug('ChatServerProtocolFactory, protocolName= %s',
                            str(self.protocolName))
         self.lastMovieId = 0
+        #: The protocol instances of the open connections.
+        self.protocolInstances = set()
 
     def buildProtocol(self, addr):
         """
@@ -69,4 +77,6 @@ class c2wChatServerProtocolFactory(Factory):
         moduleLogger.info("FACTORY_INFO: building a new protocol instance, " +
                           "for user with address %s", addr)
         p = self.protocolName(self.serverProxy, addr.host, addr.port)
+        p.factory = self
+        self.protocolInstances.add(p)
         return p
@@ -95,6 +95,12 @@ class c2wMovieStore(object):
         #: A dictionary  storing all the movies.  The movie movieTitle is the
         #: key.
         self._movieDic = {}
+        #: Version of the movie list, incremented every time a movie is
+        #: added or removed.
+        self._version = 0
+        #: The last encoded movie list, as a tuple (version, encoder,
+        #: payload), see :py:meth:`getEncodedMovieList`.
+        self._encodedMovieList = None
 
     def addMovie(self, movie):
         if not isinstance(movie, c2wMovie):
@@ -111,6 +117,7 @@ class c2wMovieStore(object):
                 " title=%s, IP=%s, port=%s", movie.movieTitle,
                 movie.movieIpAddress, movie.moviePort)
             self._movieDic[movie.movieTitle] = movie
+            self._version += 1
 
     def createAndAddMovie(self, movieTitle, movieIpAddress, moviePort,
                           movieFilePath=None, movieId=None, noVideo=False,
@@ -127,18 +134,48 @@ class c2wMovieStore(object):
                 " title=%s, IP=%s, port=%s", movie.movieTitle,
                 movie.movieIpAddress, movie.moviePort)
             self._movieDic[movie.movieTitle] = movie
+            self._version += 1
 
     def removeMovie(self, movieTitle):
         """
         Delete the movie whose title is movieTitle from the dictionary.
         """
         del self._movieDic[movieTitle]
+        self._version += 1
 
     def removeAllMovies(self):
         """
         Delete all the movies in the store.
         """
         self._movieDic = {}
+        self._version += 1
+
+    def getVersion(self):
+        """
+        Return the version of the movie list.  It changes every time a
+        movie is added or removed.
+        """
+        return self._version
+
+    def getEncodedMovieList(self, encoder):
+        """
+        :param encoder: A function taking the list of movies (as returned
+                by :py:meth:`getMovieList`) and returning its wire encoding.
+        :returns: The encoded movie list.
+
+        The encoded list is cached and ``encoder`` is only called again
+        after the movie list has changed (or with a different encoder).
+
+        .. warning::
+            Only adding and removing movies invalidates the cache.  The
+            attributes of a movie already in the store must not be modified.
+        """
+        cached = self._encodedMovieList
+        if (cached is None or cached[0] != self._version or
+                cached[1] is not encoder):
+            cached = (self._version, encoder, encoder(self.getMovieList()))
+            self._encodedMovieList = cached
+        return cached[2]
 
     def getMovieList(self):
         """
@@ -313,6 +313,20 @@ class c2wServerModel(object):
         """
         return self._movieStore.getMovieList()
 
+    def getEncodedUserList(self, encoder):
+        """
+        Returns the user list encoded by ``encoder``.  The encoding is
+        cached by the user store until the user list changes.
+        """
+        return self._userStore.getEncodedUserList(encoder)
+
+    def getEncodedMovieList(self, encoder):
+        """
+        Returns the movie list encoded by ``encoder``.  The encoding is
+        cached by the movie store until the movie list changes.
+        """
+        return self._movieStore.getEncodedMovieList(encoder)
+
     def startStreamingMovie(self, movieTitle):
         """
         Start streaming the corresponding movie.
@@ -227,6 +227,30 @@ class c2wServerProxy(object):
         """
         return self.serverModel.getMovieList()
 
+    def getEncodedUserList(self, encoder):
+        """
+        :param encoder: A function taking the list of users (each element
+                is an instance of :py:class:`~c2w.main.user.c2wUser`)
+                and returning its wire encoding.
+
+        Returns the encoded user list.  The result is cached and only
+        encoded again after a user has been added, removed or has changed
+        room.
+        """
+        return self.serverModel.getEncodedUserList(encoder)
+
+    def getEncodedMovieList(self, encoder):
+        """
+        :param encoder: A function taking the list of movies (each element
+                is an instance of :py:class:`~c2w.main.movie.c2wMovie`)
+                and returning its wire encoding.
+
+        Returns the encoded movie list.  The result is cached and only
+        encoded again after a movie has been added or removed, so this is
+        the method to use when sending the movie list to many clients.
+        """
+        return self.serverModel.getEncodedMovieList(encoder)
+
     def startStreamingMovie(self, movieTitle):
         """
         Start streaming the corresponding movie.
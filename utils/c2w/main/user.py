@@ -51,6 +51,12 @@ class c2wUser(object):
         .. attribute:: userAddress
 
             The address of the corresponding client.  (Optional)
+
+        .. attribute:: userEncodedEntry
+
+            The wire encoding of this user in the user list, cached by the
+            protocol (``None`` until it is first encoded).  The user store
+            resets it whenever the user changes room.
         """
         #: The user Id (can be none).
         self.userId = userId
@@ -64,6 +70,8 @@ class c2wUser(object):
         #: This field can be used to store the address of the corresponding
         #: user (only for the server).
         self.userAddress = userAddress
+        #: The cached wire encoding of the user (only for the server).
+        self.userEncodedEntry = None
 
     def __repr__(self):
         s = '<Instance of c2wUser; userName={0}, userChatRoom={1}, '.format(
@@ -95,6 +103,12 @@ class c2wUserStore(object):
         """
 
         self._allUserDic = {}
+        #: Version of the user list, incremented every time a user is
+        #: added, removed or changes room.
+        self._version = 0
+        #: The last encoded user list, as a tuple (version, encoder,
+        #: payload), see :py:meth:`getEncodedUserList`.
+        self._encodedUserList = None
 
     def addUser(self, user):
         """
@@ -116,6 +130,7 @@ class c2wUserStore(object):
             moduleLogger.debug("USER_STORE (addUSer): adding user" +
                 " with name %s to the dictionary", user.userName)
             self._allUserDic[user.userName] = user
+            self._version += 1
 
     def createAndAddUser(self, userName, userChatRoom, userChatInstance=None,
                          userAddress=None, userId=None):
@@ -149,6 +164,7 @@ class c2wUserStore(object):
             moduleLogger.debug("USER_STORE (addUSer): adding user" +
                 " with name %s to the dictionary", user.userName)
             self._allUserDic[user.userName] = user
+            self._version += 1
 
     def getUserByName(self, userName):
         """
@@ -186,7 +202,10 @@ class c2wUserStore(object):
 
         Update the location of the user whose name is :py:obj:`userName`.
         """
-        self._allUserDic[userName].userChatRoom = newUserChatRoom
+        user = self._allUserDic[userName]
+        user.userChatRoom = newUserChatRoom
+        user.userEncodedEntry = None
+        self._version += 1
 
     def removeUser(self, userName):
         """
@@ -198,6 +217,7 @@ class c2wUserStore(object):
         """
         if userName in list(self._allUserDic.keys()):
             del self._allUserDic[userName]
+            self._version += 1
         else:
             raise ValueError("trying to delete a user not in the list")
 
@@ -206,6 +226,35 @@ class c2wUserStore(object):
         Remove all the users from the list.
         """
         self._allUserDic = {}
+        self._version += 1
+
+    def getVersion(self):
+        """
+        Return the version of the user list.  It changes every time a
+        user is added, removed or changes room.
+        """
+        return self._version
+
+    def getEncodedUserList(self, encoder):
+        """
+        :param encoder: A function taking the list of users (as returned
+                by :py:meth:`getUserList`) and returning its wire encoding.
+        :returns: The encoded user list.
+
+        The encoded list is cached and ``encoder`` is only called again
+        after the user list has changed (or with a different encoder).
+
+        .. warning::
+            The room of a user must only be changed with
+            :py:meth:`updateUserChatRoom`, otherwise the cache is not
+            invalidated.
+        """
+        cached = self._encodedUserList
+        if (cached is None or cached[0] != self._version or
+                cached[1] is not encoder):
+            cached = (self._version, encoder, encoder(self.getUserList()))
+            self._encodedUserList = cached
+        return cached[2]
 
     def getUserList(self):
         """
@@ -0,0 +1,84 @@
+from twisted.trial import unittest
+
+from c2w.protocol.congestion import c2wCongestionWindow
+from c2w.protocol.retransmit import c2wRetransmitEntry
+
+
+def sentEntry(sentAt):
+    """
+    Returns the entry of a message sent at ``sentAt``.
+    """
+    entry = c2wRetransmitEntry(sentAt, 1.0, None, ())
+    entry.sentAt = sentAt
+    return entry
+
+
+class c2wCongestionWindowTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.window = c2wCongestionWindow()
+
+    def test_initialWindow(self):
+        self.assertTrue(self.window.canSend(3))
+        self.assertFalse(self.window.canSend(4))
+
+    def test_slowStart(self):
+        """
+        Each acknowledged message lets one more message be sent.
+        """
+        for i in range(4):
+            self.window.acknowledged(sentEntry(0.0))
+        self.assertEqual(self.window.window, 8.0)
+        self.assertTrue(self.window.canSend(7))
+        self.assertFalse(self.window.canSend(8))
+
+    def test_duplicateAck(self):
+        self.window.acknowledged(None)
+        self.assertEqual(self.window.window, 4.0)
+
+    def test_additiveIncrease(self):
+        """
+        Above the slow start threshold the window grows by about one message
+        per window of acknowledged messages.
+        """
+        self.window.timedOut(sentEntry(0.0), 1.0)
+        self.assertEqual(self.window.slowStartThreshold, 2.0)
+        expected = 2.0
+        for i in range(5):
+            self.window.acknowledged(sentEntry(1.0))
+            expected += 1 / expected
+            self.assertTrue(abs(self.window.window - expected) < 1e-9)
+        # 2 -> 2.5 -> 2.9: one more message after about a window of ACKs
+        self.assertTrue(3.8 < self.window.window < 3.9)
+
+    def test_halvedOncePerLossEvent(self):
+        """
+        The messages sent before a decrease were lost together: their
+        timeouts do not halve the window again.
+        """
+        entries = [sentEntry(0.1 * i) for i in range(4)]
+        self.window.timedOut(entries[0], 1.0)
+        self.assertEqual(self.window.window, 2.0)
+        for entry in entries[1:]:
+            self.window.timedOut(entry, 1.1)
+        self.assertEqual(self.window.window, 2.0)
+        # the same message timing out again is part of the same event
+        self.window.timedOut(entries[0], 3.0)
+        self.assertEqual(self.window.window, 2.0)
+
+        # a message sent after the decrease is lost: a new loss event
+        self.window.timedOut(sentEntry(1.5), 3.0)
+        self.assertEqual(self.window.window, 1.0)
+        self.assertEqual(self.window.decreasedAt, 3.0)
+
+    def test_bounds(self):
+        for i in range(5):
+            self.window.timedOut(sentEntry(float(i)), i + 0.5)
+        self.assertEqual(self.window.window, 1.0)
+        self.assertTrue(self.window.canSend(0))
+        self.assertFalse(self.window.canSend(1))
+
+        window = c2wCongestionWindow()
+        for i in range(200):
+            window.acknowledged(sentEntry(0.0))
+        self.assertEqual(window.window, 64.0)
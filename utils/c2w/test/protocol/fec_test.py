@@ -0,0 +1,134 @@
+from twisted.trial import unittest
+from twisted.test import proto_helpers
+from twisted.internet import task
+from twisted.internet import reactor
+from twisted.internet.protocol import DatagramProtocol
+
+from c2w.protocol.fec import c2wFecEncoder
+from c2w.protocol.fec import c2wFecDecoder
+from c2w.protocol.udp_chat_server import c2wUdpChatServerProtocol
+from c2w.main.server_model import c2wServerModel
+from c2w.main.server_proxy import c2wServerProxy
+from functions import prepareBuffPacket
+from functions import prepareBuffLogin
+from functions import prepareBuffChatMessage
+from functions import decodeMessage
+
+
+def chatMessage(sequenceNumber, message):
+    return bytes(prepareBuffPacket(9, prepareBuffChatMessage('bob', message), sequenceNumber))
+
+
+class c2wFecTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = task.Clock()
+        self.patch(reactor, 'callLater', self.clock.callLater)
+        self.parities = []
+        self.encoder = c2wFecEncoder(self.parities.append, 4)
+        self.decoder = c2wFecDecoder()
+
+    def tearDown(self):
+        self.encoder.cancel()
+
+    def send(self, sequenceNumbers, lost=()):
+        """
+        Sends the chat messages ``sequenceNumbers`` through the encoder,
+        the decoder receives all of them but ``lost``.  Returns the
+        messages sent.
+        """
+        datagrams = {}
+        for sequenceNumber in sequenceNumbers:
+            datagram = chatMessage(sequenceNumber, 'message ' + 'x' * sequenceNumber)
+            datagrams[sequenceNumber] = datagram
+            self.encoder.add(sequenceNumber, datagram)
+            if sequenceNumber not in lost:
+                self.decoder.add(sequenceNumber, datagram)
+        return datagrams
+
+    def test_lostMessageRecovered(self):
+        """
+        One message lost in a group is rebuilt from the parity and the
+        other messages.
+        """
+        datagrams = self.send(range(4), lost=(2,))
+        self.assertEqual(len(self.parities), 1)
+        parity = decodeMessage(self.parities[0])
+        self.assertEqual((parity.sequenceNumber, parity.count), (0, 4))
+        self.assertEqual(self.decoder.recover(parity), datagrams[2])
+
+    def test_nothingLost(self):
+        self.send(range(4))
+        self.assertIsNone(self.decoder.recover(decodeMessage(self.parities[0])))
+
+    def test_twoMessagesLost(self):
+        self.send(range(4), lost=(1, 3))
+        self.assertIsNone(self.decoder.recover(decodeMessage(self.parities[0])))
+
+    def test_incompleteGroupSentAfterDelay(self):
+        """
+        The parity of an incomplete group is sent after groupDelay, it
+        protects the messages sent so far.
+        """
+        datagrams = self.send(range(2), lost=(0,))
+        self.assertEqual(self.parities, [])
+        self.clock.advance(self.encoder.groupDelay)
+        self.assertEqual(len(self.parities), 1)
+        self.assertEqual(self.decoder.recover(decodeMessage(self.parities[0])), datagrams[0])
+
+    def test_groupAcrossWrapAround(self):
+        datagrams = self.send([4094, 4095, 0, 1], lost=(0,))
+        parity = decodeMessage(self.parities[0])
+        self.assertEqual(parity.sequenceNumber, 4094)
+        self.assertEqual(self.decoder.recover(parity), datagrams[0])
+
+    def test_gapStartsNewGroup(self):
+        """
+        A message which does not follow the group (a retransmission) closes
+        it: each group is made of consecutive messages.
+        """
+        self.send([0, 1, 5])
+        self.assertEqual([decodeMessage(parity).count for parity in self.parities], [2])
+
+
+class c2wUdpChatServerFecTestCase(unittest.TestCase):
+    """
+    Forward error correction negotiated in the login request.
+    """
+
+    def setUp(self):
+        self.clock = task.Clock()
+        self.patch(reactor, 'callLater', self.clock.callLater)
+        self.patch(reactor, 'seconds', self.clock.seconds)
+        # startProtocol sets the transport of the class
+        self.patch(DatagramProtocol, 'transport', None)
+        serverProxy = c2wServerProxy(c2wServerModel())
+        serverProxy.initMovieStore(False, True)
+        self.protocol = c2wUdpChatServerProtocol(serverProxy, 0)
+        self.transport = proto_helpers.FakeDatagramTransport()
+        self.protocol.makeConnection(self.transport)
+
+    def tearDown(self):
+        self.protocol.retransmitScheduler.stopAll()
+        for call in self.clock.getDelayedCalls():
+            call.cancel()
+
+    def test_fecStartedAtLogin(self):
+        login = bytes(prepareBuffPacket(1, prepareBuffLogin('bob', 2), 0))
+        self.assertEqual(decodeMessage(login).text, 'bob')
+        self.protocol.datagramReceived(login, ("127.0.0.1", 10001))
+        session = self.protocol.sessions[("127.0.0.1", 10001)]
+        self.assertIsNotNone(session.fecEncoder)
+        self.assertIsNotNone(session.fecDecoder)
+        self.assertEqual(session.user.userName, 'bob')
+        # the acceptance is protected by the first parity
+        self.clock.advance(session.fecEncoder.groupDelay)
+        self.assertIn(12, [decodeMessage(datagram).typeNumber
+                           for datagram, address in self.transport.written])
+
+    def test_noFecWithoutRequest(self):
+        login = bytes(prepareBuffPacket(1, prepareBuffLogin('bob'), 0))
+        self.protocol.datagramReceived(login, ("127.0.0.1", 10001))
+        session = self.protocol.sessions[("127.0.0.1", 10001)]
+        self.assertIsNone(session.fecEncoder)
+        self.assertIsNone(session.fecDecoder)
@@ -0,0 +1,90 @@
+from twisted.trial import unittest
+
+from c2w.protocol.frame_reader import c2wFrameReader
+from functions import prepareBuffHeader
+
+
+def frame(typeNumber, sequenceNumber, size=20):
+    """
+    Returns a frame of ``size`` bytes (header included).
+    """
+    data = bytes([sequenceNumber % 256]) * (size - 4)
+    return prepareBuffHeader(typeNumber, data, sequenceNumber) + data
+
+
+class c2wFrameReaderTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.reader = c2wFrameReader()
+
+    def test_wholeFrames(self):
+        self.reader.feed(frame(9, 1) + frame(0, 2, 4) + frame(10, 3, 300))
+        self.assertEqual(list(self.reader.frames()),
+                         [frame(9, 1), frame(0, 2, 4), frame(10, 3, 300)])
+        self.assertEqual(len(self.reader), 0)
+
+    def test_byteAtATime(self):
+        """
+        Frames fed one byte at a time (the length header split too) are
+        each yielded once complete.
+        """
+        stream = frame(9, 1) + frame(0, 2, 4) + frame(10, 3, 300)
+        frames = []
+        for i in range(len(stream)):
+            self.reader.feed(stream[i:i + 1])
+            received = list(self.reader.frames())
+            if i + 1 in (20, 24, len(stream)):
+                self.assertEqual(len(received), 1, i)
+            else:
+                self.assertEqual(received, [], i)
+            frames.extend(received)
+        self.assertEqual(frames, [frame(9, 1), frame(0, 2, 4), frame(10, 3, 300)])
+        self.assertEqual(len(self.reader), 0)
+
+    def test_incompleteFrameKept(self):
+        stream = frame(9, 1) + frame(9, 2)
+        self.reader.feed(stream[:30])
+        self.assertEqual(list(self.reader.frames()), [frame(9, 1)])
+        self.assertEqual(len(self.reader), 10)
+        self.reader.feed(stream[30:])
+        self.assertEqual(list(self.reader.frames()), [frame(9, 2)])
+
+    def test_framesAreBytes(self):
+        self.reader.feed(frame(9, 1))
+        received = list(self.reader.frames())[0]
+        self.assertIsInstance(received, bytes)
+        # the buffer is reused: the frame yielded does not change
+        self.reader.feed(frame(9, 2))
+        list(self.reader.frames())
+        self.assertEqual(received, frame(9, 1))
+
+    def test_compact(self):
+        """
+        The consumed bytes are removed once they are more than
+        compactThreshold and half of the buffer.
+        """
+        self.reader.compactThreshold = 40
+        self.reader.feed(frame(9, 1) + frame(9, 2)[:10])
+        list(self.reader.frames())
+        self.assertEqual(self.reader._offset, 20)
+
+        # 60 bytes consumed out of 110
+        self.reader.feed(frame(9, 2)[10:] + frame(9, 3) + frame(9, 4, 100)[:50])
+        self.assertEqual(list(self.reader.frames()), [frame(9, 2), frame(9, 3)])
+        self.assertEqual(self.reader._offset, 0)
+        self.assertEqual(len(self.reader), 50)
+
+        # 100 bytes consumed out of 250: less than half
+        self.reader.feed(frame(9, 4, 100)[50:] + frame(9, 5, 200)[:150])
+        self.assertEqual(list(self.reader.frames()), [frame(9, 4, 100)])
+        self.assertEqual(self.reader._offset, 100)
+        self.reader.feed(frame(9, 5, 200)[150:])
+        self.assertEqual(list(self.reader.frames()), [frame(9, 5, 200)])
+        self.assertEqual(self.reader._offset, 0)
+        self.assertEqual(len(self.reader), 0)
+
+    def test_invalidLength(self):
+        self.reader.feed(frame(9, 1) + b'\x00\x03\x00')
+        frames = self.reader.frames()
+        self.assertEqual(next(frames), frame(9, 1))
+        self.assertRaises(ValueError, next, frames)
@@ -0,0 +1,185 @@
+from twisted.trial import unittest
+from twisted.internet import task
+from twisted.internet import reactor
+
+from c2w.protocol.multicast import c2wMulticastRoom
+from c2w.protocol.multicast import c2wMulticastReceiver
+from c2w.protocol.multicast import multicastGroupOf
+from functions import decodeMessage
+from functions import prepareBuffChatMessage
+
+
+GROUP = ('239.192.74.0', 1951)
+
+
+class c2wMulticastRoomTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = task.Clock()
+        self.patch(reactor, 'callLater', self.clock.callLater)
+        self.written = []
+        self.room = c2wMulticastRoom(lambda buff, address: self.written.append((decodeMessage(buff), address)),
+                                     0, GROUP)
+
+    def tearDown(self):
+        self.room.cancel()
+
+    def test_groupOfRoom(self):
+        self.assertEqual(multicastGroupOf('239.192.74.0', 0), '239.192.74.0')
+        self.assertEqual(multicastGroupOf('239.192.74.0', 3), '239.192.74.3')
+
+    def test_sentToGroup(self):
+        self.room.send(prepareBuffChatMessage('bob', 'hello'))
+        self.room.send(prepareBuffChatMessage('bob', 'again'))
+        self.assertEqual([(message.sequenceNumber, address) for message, address in self.written],
+                         [(0, GROUP), (1, GROUP)])
+        self.assertEqual(self.room.sequenceNumber, 1)
+
+    def test_repair(self):
+        """
+        The messages kept are sent again, the older ones are given up.
+        """
+        self.room.historySize = 3
+        for i in range(5):
+            self.room.send(prepareBuffChatMessage('bob', str(i)))
+        repaired = [decodeMessage(buff) for buff in self.room.repair([0, 1, 2, 4])]
+        self.assertEqual([message.sequenceNumber for message in repaired], [2, 4])
+        self.assertTrue(self.room.hasSent(4))
+        self.assertFalse(self.room.hasSent(1))
+
+    def test_heartbeats(self):
+        """
+        The heartbeats follow the last message at heartbeatDelays and give
+        its sequence number.
+        """
+        self.room.send(prepareBuffChatMessage('bob', 'hello'))
+        del self.written[:]
+        self.clock.advance(0.1)
+        self.clock.advance(0.4)
+        self.assertEqual(len(self.written), 2)
+        self.clock.advance(1.5)
+        self.clock.advance(10.0)
+        self.assertEqual(len(self.written), 3)
+        for message, address in self.written:
+            self.assertEqual(message.sequenceNumber, 0)
+            self.assertEqual(message.payload.tobytes(), b'\x00')
+        self.assertEqual(self.clock.getDelayedCalls(), [])
+
+    def test_heartbeatsRestartAfterMessage(self):
+        self.room.send(prepareBuffChatMessage('bob', 'hello'))
+        self.clock.advance(0.1)
+        self.room.send(prepareBuffChatMessage('bob', 'again'))
+        del self.written[:]
+        self.clock.advance(0.1)
+        self.assertEqual([message.sequenceNumber for message, address in self.written], [1])
+
+    def test_heartbeatOfSequenceNumber(self):
+        message = decodeMessage(self.room.heartbeat(7))
+        self.assertEqual(message.sequenceNumber, 7)
+
+
+class c2wMulticastReceiverTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = task.Clock()
+        self.patch(reactor, 'callLater', self.clock.callLater)
+        self.nacks = []
+        self.receiver = c2wMulticastReceiver(self.nacks.append)
+
+    def tearDown(self):
+        self.receiver.cancel()
+
+    def test_ignoredBeforeSync(self):
+        self.assertFalse(self.receiver.received(0))
+
+    def test_receivedOnce(self):
+        self.receiver.sync(10)
+        self.assertTrue(self.receiver.received(11))
+        self.assertFalse(self.receiver.received(11))
+        self.assertFalse(self.receiver.received(10))
+        self.assertEqual(self.nacks, [])
+
+    def test_gapRepaired(self):
+        """
+        The messages missing from a gap are asked for after nackDelay, then
+        again every nackInterval until they are received.
+        """
+        self.receiver.sync(10)
+        self.assertTrue(self.receiver.received(13))
+        self.assertEqual(self.nacks, [])
+        self.clock.advance(self.receiver.nackDelay)
+        self.assertEqual(self.nacks, [[11, 12]])
+
+        self.assertTrue(self.receiver.received(12))
+        self.clock.advance(self.receiver.nackInterval)
+        self.assertEqual(self.nacks, [[11, 12], [11]])
+        self.assertTrue(self.receiver.received(11))
+        self.clock.advance(self.receiver.nackInterval)
+        self.assertEqual(len(self.nacks), 2)
+        self.assertEqual(self.clock.getDelayedCalls(), [])
+
+    def test_lateMessageNotAskedFor(self):
+        self.receiver.sync(10)
+        self.receiver.received(12)
+        self.assertTrue(self.receiver.received(11))
+        self.clock.advance(self.receiver.nackDelay)
+        self.assertEqual(self.nacks, [])
+
+    def test_givenUpAfterMaxNacks(self):
+        """
+        A message asked for maxNacks times is not asked for any more, it is
+        still shown if it arrives.
+        """
+        self.receiver.sync(10)
+        self.receiver.received(12)
+        self.clock.advance(self.receiver.nackDelay)
+        for i in range(self.receiver.maxNacks):
+            self.clock.advance(self.receiver.nackInterval)
+        self.assertEqual(self.nacks, [[11]] * self.receiver.maxNacks)
+        self.assertEqual(self.clock.getDelayedCalls(), [])
+        self.assertTrue(self.receiver.received(11))
+        self.assertFalse(self.receiver.received(11))
+
+    def test_gapAcrossWrapAround(self):
+        self.receiver.sync(4094)
+        self.assertTrue(self.receiver.received(1))
+        self.clock.advance(self.receiver.nackDelay)
+        self.assertEqual(self.nacks, [[4095, 0]])
+
+    def test_heartbeatRevealsLastMessageLost(self):
+        """
+        A heartbeat after the last message received reveals the messages lost
+        at the end of a conversation, including the last one.
+        """
+        self.receiver.sync(10)
+        self.receiver.received(11)
+        self.receiver.heartbeat(11)
+        self.receiver.heartbeat(13)
+        self.clock.advance(self.receiver.nackDelay)
+        self.assertEqual(self.nacks, [[12, 13]])
+        self.assertTrue(self.receiver.received(13))
+
+    def test_groupHandshake(self):
+        """
+        Before sync, the receiver asks for a heartbeat of the group with an
+        empty NACK, then sends back the sequence number of the heartbeat
+        received from the group until the server answers.
+        """
+        self.receiver.nack()
+        self.assertEqual(self.nacks, [[]])
+        self.receiver.heartbeat(20)
+        self.assertEqual(self.nacks, [[], [20]])
+        self.receiver.heartbeat(21)
+        self.clock.advance(self.receiver.nackInterval)
+        self.assertEqual(self.nacks, [[], [20], [21]])
+
+        self.receiver.sync(21)
+        self.clock.advance(self.receiver.nackInterval)
+        self.assertEqual(len(self.nacks), 3)
+        self.assertTrue(self.receiver.received(22))
+
+    def test_handshakeGivenUp(self):
+        self.receiver.nack()
+        for i in range(10):
+            self.clock.advance(self.receiver.nackInterval)
+        self.assertEqual(self.nacks, [[]] * self.receiver.maxNacks)
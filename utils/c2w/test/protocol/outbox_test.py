@@ -0,0 +1,209 @@
+from twisted.trial import unittest
+from twisted.test import proto_helpers
+
+from c2w.protocol.outbox import c2wOutbox
+from c2w.protocol.outbox import c2wWriteBatch
+from c2w.protocol.tcp_chat_server import c2wTcpChatServerProtocol
+from c2w.main.server_model import c2wServerModel
+from c2w.main.server_proxy import c2wServerProxy
+from functions import prepareBuffHeader
+
+
+def frame(typeNumber, sequenceNumber, size=20):
+    """
+    Returns a frame of ``size`` bytes (header included).
+    """
+    data = bytes([sequenceNumber % 256]) * (size - 4)
+    return prepareBuffHeader(typeNumber, data, sequenceNumber) + data
+
+
+class PausingTransport(proto_helpers.StringTransport):
+    """
+    A transport which cannot keep up: it pauses its producer after each
+    ``writeSequence``.
+    """
+
+    def writeSequence(self, data):
+        proto_helpers.StringTransport.writeSequence(self, data)
+        if self.producer is not None:
+            self.producer.pauseProducing()
+
+
+class c2wOutboxTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.transport = proto_helpers.StringTransport()
+        self.dropped = []
+        self.outbox = c2wOutbox(self.transport, batch=c2wWriteBatch(),
+                                dropCallback=self.dropped.append)
+        self.outbox.highWaterMark = 100
+        self.outbox.lowWaterMark = 40
+        self.outbox.disconnectLimit = 400
+
+    def test_registeredAsProducer(self):
+        self.assertIs(self.transport.producer, self.outbox)
+        self.assertTrue(self.transport.streaming)
+
+    def test_writtenImmediately(self):
+        """
+        Outside a batch and while the transport keeps up, a frame is written
+        at once.
+        """
+        self.outbox.write(frame(9, 1))
+        self.assertEqual(self.transport.value(), frame(9, 1))
+        self.assertEqual(len(self.outbox), 0)
+        self.assertEqual(self.outbox.queuedBytes, 0)
+
+    def test_queuedWhilePaused(self):
+        """
+        The frames written while the outbox is paused are queued once (a
+        retransmission is not queued again) and written on resume.
+        """
+        self.outbox.pauseProducing()
+        self.outbox.write(frame(9, 1))
+        self.outbox.write(frame(9, 1))
+        self.outbox.writeSequence([frame(0, 5, 4)])
+        self.assertEqual(self.transport.value(), b'')
+        self.assertEqual(len(self.outbox), 2)
+        self.assertEqual(self.outbox.queuedBytes, 24)
+
+        self.outbox.resumeProducing()
+        self.assertEqual(self.transport.value(), frame(9, 1) + frame(0, 5, 4))
+        self.assertEqual(len(self.outbox), 0)
+        self.assertEqual(self.outbox.queuedBytes, 0)
+
+    def test_supersededUsersListsDropped(self):
+        """
+        A whole user list queued while the outbox is paused replaces the user
+        lists and user list updates still queued, their retransmission is
+        stopped through the drop callback.
+        """
+        self.outbox.pauseProducing()
+        self.outbox.write(frame(6, 1))
+        self.outbox.write(frame(10, 2))
+        self.outbox.write(frame(9, 3))
+        self.outbox.write(frame(6, 4))
+        self.assertEqual(self.dropped, [1, 2])
+        self.assertEqual([entry.key for entry in self.outbox._queue],
+                         [(9, 3), (6, 4)])
+        self.assertEqual(self.outbox.queuedBytes, 40)
+
+        self.outbox.resumeProducing()
+        self.assertEqual(self.transport.value(), frame(9, 3) + frame(6, 4))
+        self.assertEqual(self.outbox.queuedBytes, 0)
+
+    def test_supersededUsersListsDroppedInBatch(self):
+        """
+        A whole user list replaces the user list updates still queued even
+        when the outbox is not paused, e.g. for a client made slow by the
+        updates of a batch: its held back chat messages follow the list.
+        """
+        with self.outbox.batch:
+            self.outbox.write(frame(10, 1))
+            self.outbox.write(frame(9, 2))
+            self.outbox.write(frame(6, 3))
+        self.assertEqual(self.dropped, [1])
+        self.assertEqual(self.transport.value(), frame(9, 2) + frame(6, 3))
+
+        self.transport.clear()
+        with self.outbox.batch:
+            for sequenceNumber in range(4, 10):
+                self.outbox.write(frame(10, sequenceNumber))
+            self.outbox.write(frame(9, 10))
+            self.assertTrue(self.outbox.slow)
+            self.assertEqual(self.outbox.heldBackBytes, 20)
+            self.outbox.write(frame(6, 11))
+            self.assertFalse(self.outbox.slow)
+            self.assertEqual(self.dropped, [1, 4, 5, 6, 7, 8, 9])
+            self.assertEqual([entry.key for entry in self.outbox._queue],
+                             [(6, 11), (9, 10)])
+        self.assertEqual(self.transport.value(), frame(6, 11) + frame(9, 10))
+        self.assertEqual(self.outbox.queuedBytes, 0)
+
+    def test_chatHeldBackAboveHighWaterMark(self):
+        """
+        Above the high water mark the chat messages are held back, they are
+        queued again once the queue goes below the low water mark.
+        """
+        self.transport = PausingTransport()
+        self.outbox = c2wOutbox(self.transport, batch=c2wWriteBatch())
+        self.outbox.highWaterMark = 100
+        self.outbox.lowWaterMark = 40
+        self.outbox.pauseProducing()
+        for sequenceNumber in range(6):
+            self.outbox.write(frame(10, sequenceNumber))
+        self.assertTrue(self.outbox.slow)
+        self.assertEqual(self.outbox.queuedBytes, 120)
+
+        self.outbox.write(frame(9, 6))
+        self.assertEqual(self.outbox.queuedBytes, 120)
+        self.assertEqual(self.outbox.heldBackBytes, 20)
+        self.assertEqual(len(self.outbox), 7)
+
+        # at most lowWaterMark bytes per writeSequence, then paused again
+        self.outbox.resumeProducing()
+        self.assertEqual(self.transport.value(), frame(10, 0) + frame(10, 1))
+        self.assertEqual(self.outbox.queuedBytes, 80)
+        self.assertTrue(self.outbox.slow)
+        self.assertEqual(self.outbox.heldBackBytes, 20)
+
+        self.outbox.resumeProducing()
+        self.assertFalse(self.outbox.slow)
+        self.assertEqual(self.outbox.heldBackBytes, 0)
+        self.assertEqual([entry.key for entry in self.outbox._queue],
+                         [(10, 4), (10, 5), (9, 6)])
+        self.assertEqual(self.outbox.queuedBytes, 60)
+
+        self.outbox.resumeProducing()
+        self.outbox.resumeProducing()
+        written = [frame(10, sequenceNumber) for sequenceNumber in range(6)]
+        self.assertEqual(self.transport.value(),
+                         b''.join(written) + frame(9, 6))
+        self.assertEqual(len(self.outbox), 0)
+        self.assertEqual(self.outbox.queuedBytes, 0)
+
+    def test_disconnectAboveLimit(self):
+        """
+        Above the disconnect limit (held back messages included) the
+        connection is closed and the queue is emptied.
+        """
+        self.outbox.pauseProducing()
+        for sequenceNumber in range(10):
+            self.outbox.write(frame(10, sequenceNumber))
+        for sequenceNumber in range(10, 20):
+            self.outbox.write(frame(9, sequenceNumber))
+        self.assertFalse(self.outbox.closed)
+        self.assertEqual(self.outbox.queuedBytes + self.outbox.heldBackBytes, 400)
+
+        self.outbox.write(frame(9, 20))
+        self.assertTrue(self.outbox.closed)
+        self.assertTrue(self.transport.disconnecting)
+        self.assertIsNone(self.transport.producer)
+        self.assertEqual(len(self.outbox), 0)
+        self.assertEqual(self.outbox.queuedBytes, 0)
+        self.assertEqual(self.outbox.heldBackBytes, 0)
+
+        self.outbox.resumeProducing()
+        self.outbox.write(frame(9, 21))
+        self.assertEqual(self.transport.value(), b'')
+
+    def test_sendQueueDepth(self):
+        """
+        The server protocol reports the frames and bytes waiting in the
+        outbox of its client, held back chat messages included.
+        """
+        serverProxy = c2wServerProxy(c2wServerModel())
+        protocol = c2wTcpChatServerProtocol(serverProxy, "127.0.0.1", 10000)
+        protocol.makeConnection(proto_helpers.StringTransport())
+        protocol.outbox.highWaterMark = 100
+        protocol.outbox.lowWaterMark = 40
+        self.assertEqual(protocol.getSendQueueDepth(), (0, 0))
+
+        protocol.outbox.pauseProducing()
+        for sequenceNumber in range(6):
+            protocol.outbox.write(frame(10, sequenceNumber))
+        protocol.outbox.write(frame(9, 6, 30))
+        self.assertEqual(protocol.getSendQueueDepth(), (7, 150))
+
+        protocol.outbox.resumeProducing()
+        self.assertEqual(protocol.getSendQueueDepth(), (0, 0))
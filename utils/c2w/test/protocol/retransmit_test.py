@@ -0,0 +1,165 @@
+from twisted.trial import unittest
+from twisted.internet import task
+from twisted.internet import reactor
+
+from c2w.protocol.retransmit import c2wRetransmitScheduler
+
+
+class c2wRetransmitSchedulerTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = task.Clock()
+        self.patch(reactor, 'callLater', self.clock.callLater)
+        self.patch(reactor, 'seconds', self.clock.seconds)
+        self.scheduler = c2wRetransmitScheduler()
+        self.sent = []
+
+    def tearDown(self):
+        self.scheduler.stopAll()
+
+    def advance(self, seconds, step=0.001):
+        """
+        Advances the clock in small steps, so that each reactor call runs at
+        its time.
+        """
+        for i in range(int(round(seconds / step))):
+            self.clock.advance(step)
+
+    def test_sentNowAndAfterInterval(self):
+        entry = self.scheduler.start('A', 1.0, self.sent.append, 'A')
+        self.assertEqual(self.sent, ['A'])
+        self.assertEqual(entry.sentAt, 0.0)
+        self.advance(0.98)
+        self.assertEqual(self.sent, ['A'])
+        self.advance(0.03)
+        self.assertEqual(self.sent, ['A', 'A'])
+        self.assertEqual(entry.retransmissions, 1)
+        self.assertEqual(len(self.clock.getDelayedCalls()), 1)
+
+    def test_stop(self):
+        entry = self.scheduler.start('A', 1.0, self.sent.append, 'A')
+        self.assertIn('A', self.scheduler)
+        self.assertIs(self.scheduler.stop('A'), entry)
+        self.assertIsNone(self.scheduler.stop('A'))
+        self.assertEqual(len(self.scheduler), 0)
+        self.assertEqual(self.clock.getDelayedCalls(), [])
+        self.advance(3.0, 0.1)
+        self.assertEqual(self.sent, ['A'])
+
+    def test_startReplaces(self):
+        self.scheduler.start('A', 1.0, self.sent.append, 'A1')
+        self.scheduler.start('A', 0.5, self.sent.append, 'A2')
+        self.assertEqual(len(self.scheduler), 1)
+        self.advance(1.01)
+        self.assertEqual(self.sent, ['A1', 'A2', 'A2', 'A2'])
+
+    def test_laterDeadlineInTheSameTick(self):
+        """
+        A message due later in the tick of a message sent again is not
+        forgotten when that message is stopped.
+        """
+        self.scheduler.start('A', 0.925, self.sent.append, 'A')
+        self.scheduler.start('B', 0.939, self.sent.append, 'B')
+        self.advance(0.925)
+        self.assertEqual(self.sent, ['A', 'B', 'A'])
+        self.scheduler.stop('A')
+        self.advance(1.0)
+        self.assertEqual(self.sent, ['A', 'B', 'A', 'B', 'B'])
+        calls = self.clock.getDelayedCalls()
+        self.assertEqual(len(calls), 1)
+        self.assertGreater(calls[0].getTime(), self.clock.seconds())
+
+    def test_nonAlignedDeadlines(self):
+        """
+        Each message is sent again once per interval, whatever the position
+        of its deadlines in the ticks.
+        """
+        intervals = {'A': 0.07, 'B': 0.0949, 'C': 0.123, 'D': 0.3}
+        times = dict((key, []) for key in intervals)
+        for key, interval in sorted(intervals.items()):
+            self.scheduler.start(key, interval,
+                                 lambda key: times[key].append(self.clock.seconds()), key)
+        self.advance(3.0)
+        # at most one tick early, at most one step of the clock late
+        tick = self.scheduler.tickInterval
+        for key, interval in intervals.items():
+            self.assertGreaterEqual(len(times[key]), int(3.0 / (interval + 0.001)))
+            for before, after in zip(times[key], times[key][1:]):
+                self.assertTrue(interval - tick < after - before < interval + 0.0011,
+                                (key, after - before))
+
+    def test_intervalShorterThanTick(self):
+        self.scheduler.start('A', 0.004, self.sent.append, 'A')
+        self.advance(0.1)
+        self.assertGreaterEqual(self.sent.count('A'), 10)
+        self.assertEqual(len(self.clock.getDelayedCalls()), 1)
+
+    def test_wrapAround(self):
+        """
+        A message due after more than one turn of the wheel stays in its
+        slot until its deadline.
+        """
+        turn = self.scheduler.tickInterval * self.scheduler.wheelSize
+        self.scheduler.start('A', turn + 1.855, self.sent.append, 'A')
+        self.advance(turn + 1.85, 0.01)
+        self.assertEqual(self.sent, ['A'])
+        self.advance(0.02)
+        self.assertEqual(self.sent, ['A', 'A'])
+        self.advance(turn + 1.855, 0.01)
+        self.assertEqual(self.sent, ['A', 'A', 'A'])
+
+    def test_backoff(self):
+        def backoff(entry):
+            return entry.interval * 2
+        self.scheduler.start('A', 1.0, self.sent.append, 'A', backoff=backoff)
+        times = []
+        self.scheduler._entries['A'].function = lambda key: times.append(self.clock.seconds())
+        self.advance(7.1, 0.01)
+        self.assertEqual(len(times), 3)
+        for time, expected in zip(times, [1.0, 3.0, 7.0]):
+            self.assertTrue(abs(time - expected) < 0.03, (time, expected))
+
+    def test_stopInsideCallback(self):
+        """
+        A message stopped by the retransmission of another one due in the
+        same call is not sent again.
+        """
+        def sendA(key):
+            self.sent.append(key)
+            self.scheduler.stop('B')
+        self.scheduler.start('A', 1.0, sendA, 'A')
+        self.scheduler.start('B', 1.005, self.sent.append, 'B')
+        self.sent = []
+        self.advance(1.01)
+        self.assertEqual(self.sent, ['A'])
+        self.assertNotIn('B', self.scheduler)
+        self.advance(2.05, 0.01)
+        self.assertEqual(self.sent, ['A', 'A', 'A'])
+
+    def test_restartInsideCallback(self):
+        def sendA(key):
+            self.sent.append(key)
+            if len(self.sent) > 1:
+                self.scheduler.start('A', 0.5, self.sent.append, 'A2')
+        self.scheduler.start('A', 1.0, sendA, 'A')
+        self.advance(1.01)
+        self.assertEqual(self.sent, ['A', 'A', 'A2'])
+        self.advance(0.5)
+        self.assertEqual(self.sent, ['A', 'A', 'A2', 'A2'])
+
+    def test_failingRetransmissionStopped(self):
+        def send(key):
+            if self.sent:
+                raise RuntimeError('write failed')
+            self.sent.append(key)
+        self.scheduler.start('A', 1.0, send, 'A')
+        self.advance(1.01)
+        self.assertNotIn('A', self.scheduler)
+        self.assertEqual(self.clock.getDelayedCalls(), [])
+
+    def test_stopAll(self):
+        self.scheduler.start('A', 1.0, self.sent.append, 'A')
+        self.scheduler.start('B', 2.0, self.sent.append, 'B')
+        self.scheduler.stopAll()
+        self.assertEqual(len(self.scheduler), 0)
+        self.assertEqual(self.clock.getDelayedCalls(), [])
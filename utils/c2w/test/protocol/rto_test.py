@@ -0,0 +1,107 @@
+from twisted.trial import unittest
+
+from c2w.protocol.rto import c2wRtoEstimator
+from c2w.protocol.retransmit import c2wRetransmitEntry
+
+
+def sentEntry(sentAt, interval, retransmissions=0):
+    """
+    Returns the entry of a message sent at ``sentAt``, waiting ``interval``
+    seconds for its ACK.
+    """
+    entry = c2wRetransmitEntry(sentAt, interval, None, ())
+    entry.sentAt = sentAt
+    entry.retransmissions = retransmissions
+    return entry
+
+
+class c2wRtoEstimatorTestCase(unittest.TestCase):
+
+    def setUp(self):
+        # no jitter: the timeouts are exact
+        self.estimator = c2wRtoEstimator(minRto=0.01, randomFunction=lambda: 0.0)
+
+    def test_initialTimeout(self):
+        self.assertEqual(self.estimator.timeout(), 1.0)
+        self.assertEqual(c2wRtoEstimator().currentRto(), 1.0)
+
+    def test_firstSample(self):
+        self.estimator.sample(0.1)
+        self.assertEqual(self.estimator.srtt, 0.1)
+        self.assertEqual(self.estimator.rttvar, 0.05)
+        self.assertTrue(abs(self.estimator.timeout() - 0.3) < 1e-9)
+
+    def test_nextSamples(self):
+        """
+        The next round-trip times are smoothed (RFC 6298).
+        """
+        self.estimator.sample(0.1)
+        self.estimator.sample(0.2)
+        self.assertTrue(abs(self.estimator.rttvar - (0.75 * 0.05 + 0.25 * 0.1)) < 1e-9)
+        self.assertTrue(abs(self.estimator.srtt - (0.875 * 0.1 + 0.125 * 0.2)) < 1e-9)
+        self.assertTrue(abs(self.estimator.rto - (self.estimator.srtt + 4 * self.estimator.rttvar)) < 1e-9)
+
+    def test_bounds(self):
+        self.estimator.sample(0.0)
+        self.assertEqual(self.estimator.timeout(), 0.01)
+        self.estimator.sample(100.0)
+        self.assertEqual(self.estimator.timeout(), 60.0)
+        self.assertEqual(c2wRtoEstimator(randomFunction=lambda: 0.0).minRto, 1.0)
+
+    def test_jitter(self):
+        estimator = c2wRtoEstimator(randomFunction=lambda: 0.5)
+        self.assertTrue(abs(estimator.timeout() - 0.95) < 1e-9)
+
+    def test_acknowledgedGivesSample(self):
+        self.estimator.acknowledged(sentEntry(1.0, 1.0), 1.2)
+        self.assertTrue(abs(self.estimator.srtt - 0.2) < 1e-9)
+
+    def test_duplicateAck(self):
+        self.estimator.acknowledged(None, 1.2)
+        self.assertIsNone(self.estimator.srtt)
+
+    def test_karnRule(self):
+        """
+        A message sent again gives no round-trip time, its ACK only cancels
+        the backoff.
+        """
+        self.estimator.sample(0.1)
+        entry = sentEntry(1.0, 0.3)
+        self.estimator.backoff(entry, 1.3)
+        self.assertEqual(self.estimator.backoffCount, 1)
+        entry.retransmissions = 1
+        self.estimator.acknowledged(entry, 1.35)
+        self.assertEqual(self.estimator.srtt, 0.1)
+        self.assertEqual(self.estimator.backoffCount, 0)
+
+    def test_backoffDoublesInterval(self):
+        entry = sentEntry(0.0, 1.0)
+        self.assertEqual(self.estimator.backoff(entry, 1.0), 2.0)
+        entry.interval = 2.0
+        self.assertEqual(self.estimator.backoff(entry, 3.0), 4.0)
+        entry.interval = 40.0
+        self.assertEqual(self.estimator.backoff(entry, 43.0), 60.0)
+
+    def test_backoffOncePerLossEvent(self):
+        """
+        The messages sent before the last doubling of the timeout were lost
+        with the same event: they do not double it again.
+        """
+        first = sentEntry(0.0, 1.0)
+        second = sentEntry(0.1, 1.0)
+        self.estimator.backoff(first, 1.0)
+        self.estimator.backoff(second, 1.1)
+        self.assertEqual(self.estimator.backoffCount, 1)
+        self.assertEqual(self.estimator.timeout(), 2.0)
+
+        # a message sent after the doubling is lost: a new loss event
+        third = sentEntry(1.5, 2.0)
+        self.estimator.backoff(third, 3.5)
+        self.assertEqual(self.estimator.backoffCount, 2)
+        self.assertEqual(self.estimator.timeout(), 4.0)
+
+    def test_backoffBounded(self):
+        for i in range(10):
+            self.estimator.backoff(sentEntry(i * 100.0, 1.0), i * 100.0 + 1)
+        self.assertEqual(self.estimator.timeout(), 60.0)
+        self.assertEqual(self.estimator.backoffCount, 6)
@@ -0,0 +1,81 @@
+from twisted.trial import unittest
+
+from c2w.protocol.sequence_window import c2wSequenceWindow
+
+
+class c2wSequenceWindowTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.window = c2wSequenceWindow()
+
+    def test_duplicate(self):
+        self.assertTrue(self.window.add(7))
+        self.assertFalse(self.window.add(7))
+        self.assertTrue(self.window.add(8))
+        self.assertFalse(self.window.add(8))
+        self.assertFalse(self.window.add(7))
+
+    def test_outOfOrder(self):
+        """
+        A message arrived after a newer one is treated once.
+        """
+        self.assertTrue(self.window.add(10))
+        self.assertTrue(self.window.add(13))
+        self.assertTrue(self.window.add(11))
+        self.assertFalse(self.window.add(11))
+        self.assertTrue(self.window.add(12))
+        self.assertEqual(self.window.highestSequenceNumber, 13)
+
+    def test_wrapAround(self):
+        """
+        The sequence numbers following 4095 are newer, those before it are
+        still remembered.
+        """
+        for sequenceNumber in (4093, 4095, 0, 2):
+            self.assertTrue(self.window.add(sequenceNumber))
+        self.assertEqual(self.window.highestSequenceNumber, 2)
+        for sequenceNumber in (4093, 4095, 0, 2):
+            self.assertFalse(self.window.add(sequenceNumber))
+        self.assertTrue(self.window.add(4094))
+        self.assertTrue(self.window.add(1))
+        self.assertFalse(self.window.add(4094))
+        self.assertFalse(self.window.add(1))
+        self.assertEqual(self.window.highestSequenceNumber, 2)
+
+    def test_lateMessageAcrossWrapAround(self):
+        """
+        A message sent before the wrap around and arrived after it is not
+        taken for a newer one.
+        """
+        self.assertTrue(self.window.add(4090))
+        self.assertTrue(self.window.add(5))
+        self.assertTrue(self.window.add(4091))
+        self.assertEqual(self.window.highestSequenceNumber, 5)
+
+    def test_severalTurns(self):
+        for turn in range(3):
+            for sequenceNumber in range(4096):
+                self.assertTrue(self.window.add(sequenceNumber), (turn, sequenceNumber))
+                self.assertFalse(self.window.add(sequenceNumber), (turn, sequenceNumber))
+
+    def test_olderThanWindow(self):
+        """
+        A message older than the window is considered as treated.
+        """
+        self.window.add(100)
+        self.window.add(100 + self.window.windowSize)
+        self.assertFalse(self.window.add(99))
+        self.assertTrue(self.window.add(101))
+
+    def test_jumpForgetsOlderMessages(self):
+        self.window.add(4000)
+        self.window.add((4000 + self.window.windowSize + 1) % 4096)
+        self.assertFalse(self.window.add(4000))
+        self.assertFalse(self.window.add(4001))
+
+    def test_reset(self):
+        self.window.add(5)
+        self.window.reset()
+        self.assertIsNone(self.window.highestSequenceNumber)
+        self.assertTrue(self.window.add(5))
+        self.assertTrue(self.window.add(2000))
@@ -0,0 +1,106 @@
+import errno
+
+from twisted.trial import unittest
+from twisted.test import proto_helpers
+from twisted.internet import task
+from twisted.internet import reactor
+
+from c2w.protocol.udp_chat_server import c2wUdpChatServerProtocol
+from c2w.main.server_model import c2wServerModel
+from c2w.main.server_proxy import c2wServerProxy
+from c2w.main.batch_udp_port import c2wBatchUdpPort
+
+
+MOVIES = [
+          (0X03, "3 Days to Kill", "128.12.12.12", 20000, "")
+          ]
+
+#: Login request of "bob", sequence number 0.
+LOGIN_BOB = bytes.fromhex("00070001626f62")
+
+
+class FailingSocket(object):
+    """
+    A socket holding some datagrams, then failing with ``error``.
+    """
+
+    def __init__(self, datagrams, error):
+        self.datagrams = list(datagrams)
+        self.error = error
+
+    def recvfrom(self, size):
+        if self.datagrams:
+            return self.datagrams.pop(0)
+        raise self.error
+
+
+class BatchProtocol(object):
+
+    def __init__(self):
+        self.batches = []
+
+    def datagramsReceived(self, datagrams):
+        self.batches.append(datagrams)
+
+
+class c2wUdpChatServerBatchTestCase(unittest.TestCase):
+    """
+    Batches of datagrams handed to
+    :py:meth:`c2wUdpChatServerProtocol.datagramsReceived`.
+    """
+
+    def setUp(self):
+        self.clock = task.Clock()
+        self.patch(reactor, 'callLater', self.clock.callLater)
+
+        serverModel = c2wServerModel()
+        serverProxy = c2wServerProxy(serverModel)
+        serverProxy.initMovieStore(False, True)
+        serverProxy.removeAllMovies()
+        for m in MOVIES:
+            serverProxy.addMovie(m[1], m[2], m[3], m[4], m[0])
+        self.protocol = c2wUdpChatServerProtocol(serverProxy, 0)
+        self.transport = proto_helpers.FakeDatagramTransport()
+        self.protocol.makeConnection(self.transport)
+
+    def tearDown(self):
+        for call in self.clock.getDelayedCalls():
+            call.cancel()
+
+    def test_malformedDatagramDoesNotDropBatch(self):
+        """
+        A datagram that raises while it is handled is logged, and the
+        datagrams after it in the same batch are still handled.
+        """
+        self.protocol.datagramsReceived([(b'\x00', ("127.0.0.1", 10000)),
+                                         (LOGIN_BOB, ("127.0.0.1", 10001))])
+
+        self.assertTrue(self.flushLoggedErrors())
+        self.assertIn(("127.0.0.1", 10001), self.protocol.sessions)
+        self.assertEqual(self.transport.written[0],
+                         (bytes.fromhex("00040000"), ("127.0.0.1", 10001)))
+
+
+class c2wBatchUdpPortTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.protocol = BatchProtocol()
+        self.port = c2wBatchUdpPort(0, self.protocol)
+        self.datagrams = [(b'a', ("127.0.0.1", 10001, 0, 0)), (b'b', ("127.0.0.1", 10002))]
+
+    def test_batchDeliveredBeforeError(self):
+        """
+        The datagrams read before an unexpected socket error are handed to
+        the protocol, then the error is raised.
+        """
+        self.port.socket = FailingSocket(self.datagrams, OSError(errno.EIO, 'I/O error'))
+        self.assertRaises(OSError, self.port.doRead)
+        self.assertEqual(self.protocol.batches,
+                         [[(b'a', ("127.0.0.1", 10001)), (b'b', ("127.0.0.1", 10002))]])
+
+    def test_emptySocket(self):
+        self.port.socket = FailingSocket(self.datagrams, OSError(errno.EAGAIN, 'again'))
+        self.port.doRead()
+        self.assertEqual(len(self.protocol.batches), 1)
+        self.port.doRead()
+        self.assertEqual(len(self.protocol.batches), 1)
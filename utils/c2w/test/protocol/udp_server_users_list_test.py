@@ -0,0 +1,120 @@
+from twisted.trial import unittest
+from twisted.test import proto_helpers
+from twisted.internet import task
+from twisted.internet import reactor
+from twisted.internet.protocol import DatagramProtocol
+
+from c2w.protocol.udp_chat_server import c2wUdpChatServerProtocol
+from c2w.main.server_model import c2wServerModel
+from c2w.main.server_proxy import c2wServerProxy
+from functions import prepareBuffHeader
+from functions import decodeMessage
+from functions import c2wBroadcast
+
+
+MOVIES = [
+          (0X03, "3 Days to Kill", "128.12.12.12", 20000, "")
+          ]
+
+BOB = ("127.0.0.1", 10001)
+ALICE = ("127.0.0.1", 10002)
+CAROL = ("127.0.0.1", 10003)
+
+
+def loginRequest(userName):
+    """
+    Returns the login request of ``userName``, sequence number 0.
+    """
+    return prepareBuffHeader(1, userName, 0) + userName.encode()
+
+
+class c2wUdpChatServerUsersListTestCase(unittest.TestCase):
+    """
+    The users list updates are sent to a client only once it has
+    acknowledged its users list and the update sent before.
+    """
+
+    def setUp(self):
+        self.clock = task.Clock()
+        self.patch(reactor, 'callLater', self.clock.callLater)
+        self.patch(reactor, 'seconds', self.clock.seconds)
+        # startProtocol sets the transport of the class
+        self.patch(DatagramProtocol, 'transport', None)
+
+        serverModel = c2wServerModel()
+        serverProxy = c2wServerProxy(serverModel)
+        serverProxy.initMovieStore(False, True)
+        serverProxy.removeAllMovies()
+        for m in MOVIES:
+            serverProxy.addMovie(m[1], m[2], m[3], m[4], m[0])
+        self.protocol = c2wUdpChatServerProtocol(serverProxy, 0)
+        self.transport = proto_helpers.FakeDatagramTransport()
+        self.protocol.makeConnection(self.transport)
+
+    def tearDown(self):
+        self.protocol.retransmitScheduler.stopAll()
+
+    def received(self, hostPort):
+        """
+        Returns the (type, sequence number) of the messages written to
+        ``hostPort`` since the last call.
+        """
+        messages = [decodeMessage(datagram) for datagram, address in self.transport.written
+                    if address == hostPort]
+        self.transport.written = [(datagram, address) for datagram, address in self.transport.written
+                                  if address != hostPort]
+        return [(message.typeNumber, message.sequenceNumber) for message in messages]
+
+    def ack(self, hostPort, sequenceNumber):
+        self.protocol.datagramReceived(prepareBuffHeader(0, "", sequenceNumber), hostPort)
+
+    def login(self, userName, hostPort):
+        """
+        Logs ``userName`` in up to the users list, which is not acknowledged.
+        """
+        self.protocol.datagramReceived(loginRequest(userName), hostPort)
+        self.ack(hostPort, 0)
+        self.ack(hostPort, 1)
+        self.assertIn((6, 2), self.received(hostPort))
+
+    def test_updateHeldBackUntilUsersListAcknowledged(self):
+        self.login("bob", BOB)
+        self.login("alice", ALICE)
+        self.assertEqual(self.received(BOB), [])
+
+        self.ack(BOB, 2)
+        self.assertEqual(self.received(BOB), [(10, 3)])
+
+    def test_updatesSentInOrder(self):
+        """
+        The updates following an update not acknowledged yet are sent
+        together once it is acknowledged.
+        """
+        self.login("bob", BOB)
+        self.ack(BOB, 2)
+        self.login("alice", ALICE)
+        self.assertEqual(self.received(BOB), [(10, 3)])
+        self.login("carol", CAROL)
+        self.ack(ALICE, 2)
+        self.assertEqual(self.received(BOB), [])
+        self.assertEqual(len(self.protocol.sessions[BOB].pendingUpdates), 1)
+
+        self.ack(BOB, 3)
+        self.assertEqual(self.received(BOB), [(10, 4)])
+        self.assertEqual(self.protocol.sessions[BOB].pendingUpdates, [])
+
+    def test_usersListTooLongForSegments(self):
+        """
+        A users list needing more than 255 segments is not sent, the error
+        is logged and the other messages still leave.
+        """
+        self.login("bob", BOB)
+        self.ack(BOB, 2)
+        session = self.protocol.sessions[BOB]
+        self.protocol.sendBroadcast(c2wBroadcast(6, b'x' * 256 * self.protocol.maxDatagramSize), session)
+        self.assertEqual(len(self.flushLoggedErrors(ValueError)), 1)
+        self.assertEqual(self.received(BOB), [])
+        self.assertEqual(len(session.sendQueue), 0)
+
+        self.login("alice", ALICE)
+        self.assertEqual(self.received(BOB), [(10, 3)])